@@ -0,0 +1,410 @@
+"""
+Statistiques de visites des portfolios publics
+
+Les visites sont mises en tampon pendant la requête puis insérées en lot par
+un thread de fond dans visit_events. Chaque lot ajoute ses vues aux agrégats
+horaires et journaliers de visit_rollups par incrément (INSERT ... ON
+CONFLICT DO UPDATE) : les lots de plusieurs workers s'additionnent sans se
+voir. Visiteurs uniques, référents et navigateurs ne s'additionnent pas ; ils
+sont recalculés à partir des événements des créneaux touchés toutes les
+ANALYTICS_ROLLUP_INTERVAL secondes, dans une transaction séparée, comme la
+purge des événements anciens (au plus une fois par heure). Le tableau de
+bord ne lit que ces agrégats : son coût dépend du nombre de jours affichés,
+pas du trafic.
+
+`flask analytics refresh` recalcule les agrégats de la période récente et
+`flask analytics purge` supprime les événements au-delà de la rétention.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, func, distinct
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Ordre important : Edge et Opera s'annoncent aussi comme Chrome et Safari
+UA_FAMILIES = [
+    ('Robot', re.compile(r'bot|crawl|spider|slurp|preview', re.I)),
+    ('Edge', re.compile(r'Edg(e|A|iOS)?/')),
+    ('Opera', re.compile(r'OPR/|Opera')),
+    ('Chrome', re.compile(r'Chrome/|CriOS/')),
+    ('Firefox', re.compile(r'Firefox/|FxiOS/')),
+    ('Safari', re.compile(r'Safari/')),
+    ('Script', re.compile(r'curl|wget|python|httpie|Go-http-client', re.I)),
+]
+
+
+def ua_family(user_agent):
+    """Famille de navigateur à partir du User-Agent"""
+    if not user_agent:
+        return 'Inconnu'
+    for family, pattern in UA_FAMILIES:
+        if pattern.search(user_agent):
+            return family
+    return 'Autre'
+
+
+def referrer_host(referrer):
+    """Hôte du référent, ou None pour un accès direct"""
+    if not referrer:
+        return None
+    host = urlparse(referrer).netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host[:100] or None
+
+
+def bucket_start(moment, granularity):
+    """Début du créneau horaire ou journalier contenant moment"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class AnalyticsRecorder:
+    """Tampon d'événements de visite inséré en lot en arrière-plan"""
+
+    def __init__(self, app, flush_interval=10, retention_days=30, rollup_interval=300):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.rollup_interval = rollup_interval
+        self._events = []
+        # Créneaux dont les statistiques exactes sont à recalculer
+        self._dirty = set()
+        self._last_rollup = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self._last_purge = None
+
+    def record(self, portfolio_id, ip, user_agent, referrer, occurred_at=None):
+        """Enregistrer une visite (ne touche pas à la base)"""
+        occurred_at = occurred_at or datetime.utcnow()
+        event = {
+            'portfolio_id': portfolio_id,
+            'occurred_at': occurred_at,
+            'visitor_hash': self._visitor_hash(ip, user_agent, occurred_at),
+            'referrer_host': referrer_host(referrer),
+            'ua_family': ua_family(user_agent),
+        }
+        self._ensure_started()
+        with self._lock:
+            self._events.append(event)
+        if not self.flush_interval:
+            self.flush()
+            self.maintain()
+
+    def _visitor_hash(self, ip, user_agent, occurred_at):
+        # Sel journalier : un visiteur est reconnu dans la journée sans conserver son IP
+        salt = f"{self.app.config['SECRET_KEY']}:{occurred_at.date().isoformat()}"
+        digest = hashlib.sha256(f"{salt}|{ip}|{user_agent}".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def flush(self):
+        """Insérer les événements en attente et mettre à jour les agrégats"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._events:
+                    return 0
+                events, self._events = self._events, []
+
+            try:
+                with self.app.app_context():
+                    self._write(events)
+            except Exception as e:
+                logger.error(f"Erreur écriture statistiques de visites: {e}")
+                with self._lock:
+                    self._events[:0] = events
+                return 0
+            return len(events)
+
+    def _write(self, events):
+        from models import VisitEvent, db
+
+        views = {}
+        for event in events:
+            for granularity in GRANULARITIES:
+                bucket = (event['portfolio_id'], granularity, bucket_start(event['occurred_at'], granularity))
+                views[bucket] = views.get(bucket, 0) + 1
+        try:
+            db.session.execute(VisitEvent.__table__.insert(), events)
+            increment_rollups(views)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        with self._lock:
+            self._dirty.update(views)
+
+    def maintain(self):
+        """Recalculer les statistiques des créneaux touchés et purger les anciens événements"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        self._last_rollup = time.monotonic()
+        try:
+            with self.app.app_context():
+                refresh_rollups(sorted(dirty))
+                self._maybe_purge()
+        except Exception as e:
+            logger.error(f"Erreur recalcul des statistiques de visites: {e}")
+            with self._lock:
+                self._dirty.update(dirty)
+
+    def _maybe_purge(self):
+        # Au plus une purge par heure et par processus
+        now = datetime.utcnow()
+        if self._last_purge and now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        purge_events(now - timedelta(days=self.retention_days))
+
+    def _ensure_started(self):
+        # Démarrage paresseux, après le fork des workers gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._events = []
+            self._stop.clear()
+            if self.flush_interval:
+                threading.Thread(target=self._run, name='analytics', daemon=True).start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - self._last_rollup >= self.rollup_interval:
+                self.maintain()
+
+    def stop(self):
+        """Arrêter le thread et écrire les événements restants"""
+        self._stop.set()
+        self.flush()
+        self.maintain()
+
+
+def _rollup_insert(table, dialect):
+    # INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite >= 3.24)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=['portfolio_id', 'granularity', 'bucket_start'],
+        set_={'views': func.coalesce(table.c.views, 0) + stmt.excluded.views},
+    )
+
+
+def increment_rollups(views):
+    """Ajouter des vues aux agrégats ({(portfolio_id, granularité, début): vues}), créés au besoin"""
+    from models import VisitRollup, db
+
+    if not views:
+        return
+    table = VisitRollup.__table__
+    rows = [{'portfolio_id': portfolio_id, 'granularity': granularity, 'bucket_start': start, 'views': count}
+            for (portfolio_id, granularity, start), count in sorted(views.items())]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        db.session.execute(_rollup_insert(table, dialect), rows)
+        return
+
+    # Autres bases (SQL Server) : incrément, puis création du créneau s'il n'existe pas encore
+    update = table.update().where(
+        (table.c.portfolio_id == bindparam('pid'))
+        & (table.c.granularity == bindparam('gran'))
+        & (table.c.bucket_start == bindparam('start'))
+    ).values(views=func.coalesce(table.c.views, 0) + bindparam('n'))
+    for row in rows:
+        params = {'pid': row['portfolio_id'], 'gran': row['granularity'], 'start': row['bucket_start'],
+                  'n': row['views']}
+        if db.session.execute(update, params).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert(), row)
+        except IntegrityError:
+            # Créé entre-temps par un autre worker
+            db.session.execute(update, params)
+
+
+def refresh_rollups(buckets):
+    """Recalculer visiteurs uniques, référents et navigateurs de créneaux, dans leur propre transaction"""
+    from models import db
+
+    if not buckets:
+        return
+    try:
+        for portfolio_id, granularity, start in buckets:
+            refresh_rollup(portfolio_id, granularity, start)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+
+
+def refresh_rollup(portfolio_id, granularity, start):
+    """Recalculer les statistiques exactes d'un agrégat à partir des événements de son créneau
+
+    Les vues, incrémentées par chaque lot, ne sont pas réécrites : un lot validé
+    pendant le recalcul n'est pas perdu.
+    """
+    from models import VisitEvent, VisitRollup, db
+
+    end = start + GRANULARITIES[granularity]
+    in_bucket = (
+        VisitEvent.portfolio_id == portfolio_id,
+        VisitEvent.occurred_at >= start,
+        VisitEvent.occurred_at < end,
+    )
+
+    unique_visitors = db.session.query(func.count(distinct(VisitEvent.visitor_hash))).filter(*in_bucket).scalar()
+    if not unique_visitors:
+        # Événements déjà purgés : les statistiques enregistrées restent
+        return
+
+    def top(column, limit=10):
+        rows = db.session.query(column, func.count(VisitEvent.id)).filter(*in_bucket) \
+            .group_by(column).order_by(func.count(VisitEvent.id).desc()).limit(limit).all()
+        return {key or 'Direct': count for key, count in rows}
+
+    table = VisitRollup.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.portfolio_id == portfolio_id, table.c.granularity == granularity,
+               table.c.bucket_start == start)
+        .values(unique_visitors=unique_visitors,
+                referrers=json.dumps(top(VisitEvent.referrer_host)),
+                user_agents=json.dumps(top(VisitEvent.ua_family)))
+    )
+
+
+def purge_events(before):
+    """Supprimer les événements bruts plus anciens que before (les agrégats restent), dans leur propre transaction"""
+    from models import VisitEvent, db
+
+    try:
+        deleted = VisitEvent.query.filter(VisitEvent.occurred_at < before).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+    return deleted
+
+
+def get_recorder():
+    """Récupérer l'enregistreur de l'application courante (créé au premier appel)"""
+    recorder = current_app.extensions.get('analytics')
+    if recorder is None:
+        recorder = AnalyticsRecorder(
+            current_app._get_current_object(),
+            flush_interval=current_app.config.get('ANALYTICS_FLUSH_INTERVAL', 10),
+            retention_days=current_app.config.get('ANALYTICS_RETENTION_DAYS', 30),
+            rollup_interval=current_app.config.get('ANALYTICS_ROLLUP_INTERVAL', 300),
+        )
+        current_app.extensions['analytics'] = recorder
+    return recorder
+
+
+def record_visit(portfolio_id, request):
+    """Enregistrer la visite correspondant à la requête courante"""
+    get_recorder().record(
+        portfolio_id,
+        request.remote_addr,
+        request.headers.get('User-Agent', ''),
+        request.headers.get('Referer', ''),
+    )
+
+
+def get_dashboard(portfolio_id, days=30):
+    """Statistiques pour la page analytics, lues uniquement dans les agrégats"""
+    from models import VisitRollup
+
+    now = datetime.utcnow()
+    daily = VisitRollup.query.filter(
+        VisitRollup.portfolio_id == portfolio_id,
+        VisitRollup.granularity == 'day',
+        VisitRollup.bucket_start >= bucket_start(now - timedelta(days=days - 1), 'day')
+    ).order_by(VisitRollup.bucket_start.desc()).all()
+    hourly = VisitRollup.query.filter(
+        VisitRollup.portfolio_id == portfolio_id,
+        VisitRollup.granularity == 'hour',
+        VisitRollup.bucket_start >= bucket_start(now - timedelta(hours=23), 'hour')
+    ).order_by(VisitRollup.bucket_start).all()
+
+    referrers = {}
+    user_agents = {}
+    for rollup in daily:
+        for host, count in rollup.get_referrers().items():
+            referrers[host] = referrers.get(host, 0) + count
+        for family, count in rollup.get_user_agents().items():
+            user_agents[family] = user_agents.get(family, 0) + count
+
+    return {
+        'days': days,
+        'views': sum(rollup.views or 0 for rollup in daily),
+        # Somme des visiteurs uniques journaliers
+        'unique_visitors': sum(rollup.unique_visitors or 0 for rollup in daily),
+        'daily': daily,
+        'hourly': hourly,
+        'top_referrers': sorted(referrers.items(), key=lambda item: item[1], reverse=True)[:10],
+        'user_agents': sorted(user_agents.items(), key=lambda item: item[1], reverse=True),
+    }
+
+
+# --- Ligne de commande -----------------------------------------------------
+
+@click.group('analytics')
+def analytics_command():
+    """Statistiques de visites"""
+
+
+@analytics_command.command('refresh')
+@click.option('--days', default=2, help="Nombre de jours récents à recalculer")
+@with_appcontext
+def refresh_command(days):
+    """Recalculer visiteurs uniques, référents et navigateurs des agrégats récents"""
+    from models import VisitRollup
+
+    since = bucket_start(datetime.utcnow() - timedelta(days=days - 1), 'day')
+    buckets = [(rollup.portfolio_id, rollup.granularity, rollup.bucket_start) for rollup in
+               VisitRollup.query.filter(VisitRollup.bucket_start >= since).order_by(VisitRollup.id)]
+    refresh_rollups(buckets)
+    click.echo(f"✅ {len(buckets)} agrégat(s) recalculé(s)")
+
+
+@analytics_command.command('purge')
+@with_appcontext
+def purge_command():
+    """Supprimer les événements bruts au-delà de ANALYTICS_RETENTION_DAYS"""
+    days = current_app.config.get('ANALYTICS_RETENTION_DAYS', 30)
+    deleted = purge_events(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"✅ {deleted} événement(s) supprimé(s)")
@@ -1,90 +1,111 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_mail import Mail, Message
-from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, redirect, url_for
+from flask_login import current_user
 import os
-import secrets
-from datetime import datetime, timedelta
-import json
-
-# Configuration de l'application
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-# Configuration de la base de données pour Render (PostgreSQL) ou local (SQL Server)
-database_url = os.environ.get('DATABASE_URL')
-if database_url:
-    # Render - PostgreSQL
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    # Local - SQL Server
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'mssql+pyodbc://@localhost\\SQLEXPRESS/portfolio_builder?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Configuration email
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT') or 587)
-app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-
-# Initialisation des extensions
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
-mail = Mail(app)
-CORS(app)
-
-# Import des modèles et routes (après initialisation de db)
-from models import User, Portfolio, Project, Experience, Education, Skill
-from routes.auth import auth_bp
-from routes.portfolio import portfolio_bp
-from routes.public import public_bp
-
-# Enregistrement des blueprints
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(portfolio_bp, url_prefix='/portfolio')
-app.register_blueprint(public_bp, url_prefix='/p')
-
-# Configuration du dossier d'upload
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'cv'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'images'), exist_ok=True)
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+from config import config
+from extensions import db, login_manager, cors, init_migrate
+import database
+import jobs
+
+
+def create_app(config_name=None):
+    """Créer l'application
+
+    config_name : clé de config.config ('development', 'production', 'testing')
+    ou chemin d'une classe (ex. 'config_render.RenderConfig'), ou dictionnaire
+    de réglages (copie de la configuration d'une autre application). Par défaut
+    FLASK_CONFIG, sinon 'production' si FLASK_ENV=production.
+    """
+    if config_name is None:
+        config_name = os.environ.get('FLASK_CONFIG') or \
+            ('production' if os.environ.get('FLASK_ENV') == 'production' else 'default')
+
+    app = Flask(__name__)
+    if isinstance(config_name, dict):
+        app.config.update(config_name)
+    else:
+        app.config.from_object(config.get(config_name, config_name))
+    # Pools de connexions et réplica en lecture
+    database.configure_engines(app)
+
+    # Initialisation des extensions (aucune connexion à la base ici : compatible gunicorn --preload)
+    db.init_app(app)
+    database.init_app(app, db)
+    login_manager.init_app(app)
+    login_manager.login_view = 'auth.login'
+    login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
+    cors.init_app(app)
+    if os.environ.get('FLASK_RUN_FROM_CLI'):
+        init_migrate(app)
+
+    # Import des routes (après initialisation de db)
+    from auth import auth_bp
+    from portfolio import portfolio_bp
+    from public import public_bp
+    from file_serving import files_bp
+    from metrics import metrics_bp
+
+    # Enregistrement des blueprints
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(portfolio_bp, url_prefix='/portfolio')
+    app.register_blueprint(public_bp, url_prefix='/p')
+    # Fichiers envoyés (/uploads/<type>/<fichier>)
+    app.register_blueprint(files_bp)
+    # Mesures par requête (requêtes SQL, temps de rendu) et /metrics
+    app.register_blueprint(metrics_bp)
+    # Tâches de fond (emails, imports de CV, images)
+    jobs.init_app(app)
 
-@app.route('/')
-def index():
-    """Page d'accueil"""
-    if current_user.is_authenticated:
-        return redirect(url_for('portfolio.dashboard'))
-    return render_template('index.html')
+    # Commandes CLI
+    from export_static import export_static_command
+    from benchmark import benchmark_command
+    from jobs import jobs_command
+    from analytics import analytics_command
+    app.cli.add_command(export_static_command)
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(jobs_command)
+    app.cli.add_command(analytics_command)
 
-@app.route('/about')
-def about():
-    """Page à propos"""
-    return render_template('about.html')
+    @app.route('/')
+    def index():
+        """Page d'accueil"""
+        if current_user.is_authenticated:
+            return redirect(url_for('portfolio.dashboard'))
+        return render_template('index.html')
 
-@app.errorhandler(404)
-def not_found(error):
-    return render_template('errors/404.html'), 404
+    @app.route('/about')
+    def about():
+        """Page à propos"""
+        return render_template('about.html')
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return render_template('errors/404.html'), 404
+
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        retry_after = getattr(error, 'retry_after', None)
+        response = app.make_response((render_template('errors/429.html', retry_after=retry_after), 429))
+        if retry_after:
+            response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @app.errorhandler(500)
+    def internal_error(error):
+        db.session.rollback()
+        return render_template('errors/500.html'), 500
+
+    return app
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    from models import User
+    return db.session.get(User, int(user_id))
 
-@app.errorhandler(500)
-def internal_error(error):
-    db.session.rollback()
-    return render_template('errors/500.html'), 500
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
     app.run(debug=True, host='0.0.0.0', port=5000)
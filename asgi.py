@@ -0,0 +1,247 @@
+"""
+Service asynchrone (ASGI) des pages publiques
+
+Les pages publiques (portfolio, version embarquée, API JSON, recherche) sont
+servies sur une boucle asyncio : leurs lectures passent par un pilote de base
+asynchrone (asyncpg pour PostgreSQL, aiosqlite pour SQLite), si bien qu'un
+client lent ou une base qui tarde n'immobilise plus un worker. Les vues, les
+templates, les caches et les hooks (mesures, session) restent ceux de
+l'application Flask : chaque vue s'exécute dans AsyncSession.run_sync, qui
+rend la main à la boucle pendant chaque requête SQL (lectures faites via
+database.read_session).
+
+Tout le reste (tableau de bord, authentification, fichiers, CV, visiteurs
+connectés, POST) est transmis à l'application WSGI dans un pool de
+ASGI_WSGI_THREADS threads. Une page publique l'est aussi quand la base
+asynchrone échoue avant la réponse.
+
+Un seul processus suffit :
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+Paquets : uvicorn, greenlet et asyncpg ou aiosqlite. La base lue est
+ASYNC_DATABASE_URL, sinon le réplica (DATABASE_REPLICA_URL) ou la base
+principale, avec le pilote asynchrone correspondant.
+"""
+
+import asyncio
+import logging
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import g
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from werkzeug.exceptions import HTTPException
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Endpoints servis sur la boucle : lecture et rendu seulement
+ASYNC_ENDPOINTS = {
+    'public.view_portfolio', 'public.embed_portfolio', 'public.portfolio_api', 'public.search_portfolios',
+}
+
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_database_url(config):
+    """URL de la base lue par le service asynchrone"""
+    if config.get('ASYNC_DATABASE_URL'):
+        return config['ASYNC_DATABASE_URL']
+    url = make_url(config.get('DATABASE_REPLICA_URL') or config['SQLALCHEMY_DATABASE_URI'])
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"Aucun pilote asynchrone pour {url.get_backend_name()} : définir ASYNC_DATABASE_URL")
+    return url.set(drivername=f'{url.get_backend_name()}+{driver}')
+
+
+def build_environ(scope, body=None):
+    """Environnement WSGI d'une requête ASGI"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body if body is not None else tempfile.SpooledTemporaryFile(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class PublicASGI:
+    """Application ASGI : pages publiques sur la boucle, le reste via WSGI"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=flask_app.config.get('ASGI_WSGI_THREADS', 8),
+                                           thread_name_prefix='wsgi')
+        self.engine = None
+        self._sessionmaker = None
+
+    @property
+    def sessionmaker(self):
+        """Sessions asynchrones (moteur créé au premier usage)"""
+        if self._sessionmaker is None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+            config = self.flask_app.config
+            url = async_database_url(config)
+            self.engine = create_async_engine(url, **database.engine_options(config, url))
+            self._sessionmaker = async_sessionmaker(self.engine)
+        return self._sessionmaker
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if scope['method'] in ('GET', 'HEAD'):
+            environ = build_environ(scope)
+            if self._endpoint(environ) in ASYNC_ENDPOINTS:
+                response = await self.dispatch(environ)
+                if response is not None:
+                    await self.send_response(response, environ, send)
+                    return
+        await self.call_wsgi(scope, receive, send)
+
+    def _endpoint(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return endpoint
+
+    async def dispatch(self, environ):
+        """Exécuter la requête Flask sur la boucle, ou None pour la laisser à WSGI"""
+        app = self.flask_app
+        ctx = app.request_context(environ)
+        ctx.push()
+        error = None
+        try:
+            # Flask-Login chargerait l'utilisateur connecté par une requête synchrone
+            if '_user_id' in ctx.session or \
+                    app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') in ctx.request.cookies:
+                return None
+            async with self.sessionmaker() as session:
+                return await session.run_sync(self._full_dispatch)
+        except (DBAPIError, ConnectionError, TimeoutError) as e:
+            # Rien n'a encore été envoyé : l'application WSGI rejoue la requête
+            logger.warning(f"Lecture asynchrone impossible, requête transmise à WSGI : {e}")
+            g.pop('request_stats', None)
+            return None
+        except Exception as e:
+            error = e
+            return app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    def _full_dispatch(self, session):
+        # Dans le greenlet de run_sync, avec le contexte de la requête
+        g.read_session = session
+        return self.flask_app.full_dispatch_request()
+
+    async def send_response(self, response, environ, send):
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': _encode_headers(headers)})
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def call_wsgi(self, scope, receive, send):
+        """Transmettre la requête à l'application WSGI, dans le pool de threads"""
+        body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = await loop.run_in_executor(self.executor, self.flask_app, build_environ(scope, body), start_response)
+        chunks = iter(result)
+        try:
+            # Morceaux lus dans le pool (fichiers en flux) ; start_response peut
+            # n'être appelé qu'au premier
+            chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': _encode_headers(started['headers'])})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    # Configuration ou pilote manquant : erreur au démarrage plutôt qu'à la première page
+                    self.sessionmaker
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(flask_app=None):
+    """Application ASGI autour de l'application Flask (créée si absente)"""
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    return PublicASGI(flask_app)
+
+
+app = create_asgi_app()
@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_mail import Message
+from passwords import authenticate, hash_password
 from models import User, db
+from mailer import send_template_email
+from ratelimit import rate_limit
+import tokens
 from forms import LoginForm, RegisterForm, ResetPasswordForm, ResetPasswordRequestForm
 import secrets
 from datetime import datetime, timedelta
@@ -10,6 +12,7 @@ from datetime import datetime, timedelta
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limit('RATELIMIT_REGISTER')
 def register():
     """Inscription d'un nouvel utilisateur"""
     if current_user.is_authenticated:
@@ -34,7 +37,7 @@ def register():
         user = User(
             username=form.username.data,
             email=form.email.data,
-            password_hash=generate_password_hash(form.password.data),
+            password_hash=hash_password(form.password.data),
             first_name=form.first_name.data,
             last_name=form.last_name.data
         )
@@ -57,6 +60,8 @@ def register():
     return render_template('auth/register.html', form=form)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('RATELIMIT_LOGIN')
+@rate_limit('RATELIMIT_LOGIN_ACCOUNT', key='account')
 def login():
     """Connexion utilisateur"""
     if current_user.is_authenticated:
@@ -66,7 +71,7 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         
-        if user and check_password_hash(user.password_hash, form.password.data):
+        if user and authenticate(user, form.password.data):
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             flash(f'Bienvenue {user.get_full_name()} !', 'success')
@@ -85,6 +90,8 @@ def logout():
     return redirect(url_for('index'))
 
 @auth_bp.route('/reset-password', methods=['GET', 'POST'])
+@rate_limit('RATELIMIT_RESET_PASSWORD')
+@rate_limit('RATELIMIT_RESET_PASSWORD_ACCOUNT', key='account')
 def reset_password_request():
     """Demande de réinitialisation de mot de passe"""
     if current_user.is_authenticated:
@@ -106,74 +113,49 @@ def reset_password(token):
     if current_user.is_authenticated:
         return redirect(url_for('portfolio.dashboard'))
     
-    user = User.verify_reset_token(token)
+    user = tokens.verify_token(token, tokens.RESET_PASSWORD)
     if not user:
         flash('Token invalide ou expiré.', 'error')
         return redirect(url_for('auth.reset_password_request'))
     
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        user.password_hash = generate_password_hash(form.password.data)
-        user.reset_token = None
-        user.reset_token_expires = None
+        # Nouveau hash : le lien de réinitialisation ne fonctionne plus
+        user.password_hash = hash_password(form.password.data)
         db.session.commit()
         flash('Votre mot de passe a été réinitialisé avec succès.', 'success')
         return redirect(url_for('auth.login'))
     
     return render_template('auth/reset_password.html', form=form)
 
+@auth_bp.route('/verify-email/<token>')
+def verify_email(token):
+    """Vérification de l'adresse email"""
+    user = tokens.verify_token(token, tokens.VERIFY_EMAIL)
+    if not user:
+        flash('Lien de vérification invalide ou expiré.', 'error')
+        return redirect(url_for('auth.login'))
+    
+    user.is_email_verified = True
+    db.session.commit()
+    flash('Votre adresse email a été vérifiée.', 'success')
+    return redirect(url_for('portfolio.dashboard' if current_user.is_authenticated else 'auth.login'))
+
 def send_verification_email(user):
-    """Envoyer email de vérification"""
+    """Programmer l'email de vérification (envoyé par la file de tâches)"""
     try:
-        token = user.get_reset_token()
-        msg = Message(
-            'Vérification de votre compte Portfolio Builder',
-            sender=current_app.config['MAIL_USERNAME'],
-            recipients=[user.email]
-        )
-        msg.body = f'''
-Bonjour {user.get_full_name()},
-
-Bienvenue sur Portfolio Builder !
-
-Votre compte a été créé avec succès. Vous pouvez maintenant commencer à créer votre portfolio professionnel.
-
-Pour vérifier votre email, cliquez sur le lien suivant :
-{url_for('auth.verify_email', token=token, _external=True)}
-
-Si vous n'avez pas créé de compte, ignorez cet email.
-
-Cordialement,
-L'équipe Portfolio Builder
-        '''
-        mail.send(msg)
+        token = tokens.generate_token(user, tokens.VERIFY_EMAIL)
+        send_template_email('verification', [user.email], name=user.get_full_name(),
+                            url=url_for('auth.verify_email', token=token, _external=True))
     except Exception as e:
         current_app.logger.error(f"Erreur envoi email vérification: {e}")
 
 def send_password_reset_email(user):
-    """Envoyer email de réinitialisation de mot de passe"""
+    """Programmer l'email de réinitialisation de mot de passe"""
     try:
-        token = user.get_reset_token()
-        msg = Message(
-            'Réinitialisation de votre mot de passe',
-            sender=current_app.config['MAIL_USERNAME'],
-            recipients=[user.email]
-        )
-        msg.body = f'''
-Bonjour {user.get_full_name()},
-
-Vous avez demandé la réinitialisation de votre mot de passe.
-
-Pour réinitialiser votre mot de passe, cliquez sur le lien suivant :
-{url_for('auth.reset_password', token=token, _external=True)}
-
-Ce lien expire dans 1 heure.
-
-Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
-
-Cordialement,
-L'équipe Portfolio Builder
-        '''
-        mail.send(msg)
+        token = tokens.generate_token(user, tokens.RESET_PASSWORD)
+        send_template_email('password_reset', [user.email], name=user.get_full_name(),
+                            url=url_for('auth.reset_password', token=token, _external=True),
+                            expires=tokens.describe_max_age(tokens.RESET_PASSWORD))
     except Exception as e:
         current_app.logger.error(f"Erreur envoi email reset: {e}")
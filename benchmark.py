@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+"""
+Mesures de performance des pages les plus sollicitées
+
+Crée des comptes de test (bench-0000, bench-0001...) avec des projets,
+expériences, formations et compétences sur le modèle des données de
+démonstration d'init_render.py, puis mesure débit et latences (p50, p90,
+p95, p99) de view_portfolio, portfolio_api, embed_portfolio, de la recherche
+et du tableau de bord :
+
+- via le client de test Flask (dans le processus, avec le nombre de requêtes
+  SQL par page relevé par metrics) ;
+- via HTTP, avec plusieurs processus clients, contre un gunicorn démarré pour
+  l'occasion ou déjà lancé (--url).
+
+Les résultats sont enregistrés en JSON (un fichier par exécution, avec le
+commit courant) pour comparer deux versions. En mode HTTP, la mémoire (RSS,
+PSS) du maître et des workers gunicorn est relevée ; `startup` mesure le
+temps de create_app et la mémoire d'un processus neuf ; `mail` mesure le
+débit d'envoi des emails, une connexion SMTP par message (comportement de
+Flask-Mail) contre le pool de mailer.py, sur un serveur aiosmtpd local ou
+le serveur donné ; `passwords` mesure le coût de chaque algorithme de
+hachage et propose PASSWORD_HASH_METHOD pour une durée visée.
+
+Utilisation :
+    flask benchmark seed [--users N] [--items M]
+    flask benchmark run [--client test|http] [--requests N] [--compare FICHIER]
+    flask benchmark startup [--runs N]
+    flask benchmark mail [--messages N] [--concurrency C] [--server HÔTE:PORT]
+    flask benchmark passwords [--target-ms 250] [--threads T]
+    flask benchmark compare AVANT.json APRES.json
+    flask benchmark clean
+"""
+
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+USER_PREFIX = 'bench-'
+PASSWORD = 'bench123'
+SEARCH_TERMS = ('Python', 'Flask', 'Paris', 'Développeur', 'API')
+
+# scénario -> (endpoint, chemin pour le n-ième compte, connexion requise)
+SCENARIOS = {
+    'view_portfolio': ('public.view_portfolio', lambda n, url: f'/p/{url}', False),
+    'portfolio_api': ('public.portfolio_api', lambda n, url: f'/p/{url}/api', False),
+    'embed_portfolio': ('public.embed_portfolio', lambda n, url: f'/p/{url}/embed', False),
+    'search': ('public.search_portfolios', lambda n, url: f'/p/search?q={SEARCH_TERMS[n % len(SEARCH_TERMS)]}', False),
+    'dashboard': ('portfolio.dashboard', lambda n, url: '/portfolio/dashboard', True),
+}
+
+# Mêmes données que la démonstration d'init_render.py, déclinées par numéro
+PROJECTS = (
+    ('Application Web Portfolio', 'Application de création de portfolios professionnels',
+     ['Python', 'Flask', 'SQLAlchemy', 'TailwindCSS']),
+    ('API REST', 'API RESTful pour la gestion des données', ['Python', 'Flask', 'SQLAlchemy', 'JSON']),
+)
+EXPERIENCES = (
+    ('Développeur Full Stack', 'Tech Company', 'Paris, France', 'Développement d\'applications web modernes'),
+    ('Développeur Python', 'Startup Inc', 'Lyon, France', 'Développement backend avec Python et Flask'),
+)
+EDUCATION = (
+    ('Master en Informatique', 'Université de Paris', 'Paris, France', 'Spécialisation en développement web'),
+    ('Licence Informatique', 'Université de Lyon', 'Lyon, France', 'Formation générale en informatique'),
+)
+SKILLS = (
+    ('Python', 'Expert', 'Technique'), ('Flask', 'Avancé', 'Technique'), ('SQLAlchemy', 'Avancé', 'Technique'),
+    ('JavaScript', 'Intermédiaire', 'Technique'), ('Anglais', 'Avancé', 'Langue'), ('Git', 'Avancé', 'Autre'),
+)
+
+
+# --- Données de test ---------------------------------------------------------
+
+def seed(users, items):
+    """Créer les comptes de test manquants ; renvoie le nombre de comptes créés"""
+    from sqlalchemy import insert
+    from models import db, User, Portfolio, Project, Experience, Education, Skill
+    from passwords import hash_password
+    from search import rebuild_index
+
+    existing = {username for (username,) in db.session.query(User.username)
+                .filter(User.username.like(f'{USER_PREFIX}%'))}
+    numbers = [n for n in range(users) if f'{USER_PREFIX}{n:04d}' not in existing]
+    if not numbers:
+        return 0
+
+    # Un seul hachage : il est volontairement lent
+    password_hash = hash_password(PASSWORD)
+    portfolios = []
+    for n in numbers:
+        user = User(username=f'{USER_PREFIX}{n:04d}', email=f'{USER_PREFIX}{n:04d}@example.com',
+                    first_name='Bench', last_name=f'User {n}', password_hash=password_hash)
+        portfolio = Portfolio(user=user, public_url=f'{USER_PREFIX}{n:04d}', is_public=True,
+                              bio='Portfolio de démonstration - Portfolio Builder', location='Paris, France',
+                              website='https://example.com', github='https://github.com/demo')
+        db.session.add(portfolio)
+        portfolios.append(portfolio)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    rows = {Project: [], Experience: [], Education: [], Skill: []}
+    for portfolio in portfolios:
+        common = {'portfolio_id': portfolio.id, 'created_at': now, 'updated_at': now}
+        for i in range(items):
+            title, description, technologies = PROJECTS[i % len(PROJECTS)]
+            rows[Project].append(dict(common, title=f'{title} {i + 1}', description=description,
+                                      technologies=json.dumps(technologies), order_index=i,
+                                      github_url=f'https://github.com/demo/projet-{i + 1}', featured=i == 0))
+            title, company, location, description = EXPERIENCES[i % len(EXPERIENCES)]
+            rows[Experience].append(dict(common, title=title, company=f'{company} {i + 1}', location=location,
+                                         start_date=date(2022 - i, 1, 1), end_date=None if i == 0 else date(2023 - i, 1, 1),
+                                         current=i == 0, description=description, order_index=i))
+            degree, institution, location, description = EDUCATION[i % len(EDUCATION)]
+            rows[Education].append(dict(common, degree=f'{degree} {i + 1}', institution=institution, location=location,
+                                        start_date=date(2018 - 2 * i, 9, 1), end_date=date(2020 - 2 * i, 6, 30),
+                                        current=False, description=description, order_index=i))
+            name, level, category = SKILLS[i % len(SKILLS)]
+            rows[Skill].append(dict(common, name=f'{name} {i + 1}' if i >= len(SKILLS) else name,
+                                    level=level, category=category, order_index=i))
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.session.execute(insert(model.__table__), model_rows)
+    db.session.commit()
+    # Les sections insérées directement ne passent pas par l'indexation automatique
+    rebuild_index()
+    return len(numbers)
+
+
+def clean():
+    """Supprimer les comptes de test ; renvoie leur nombre"""
+    from models import db, User
+    users = User.query.filter(User.username.like(f'{USER_PREFIX}%')).all()
+    for user in users:
+        db.session.delete(user)
+    db.session.commit()
+    return len(users)
+
+
+def _targets():
+    from models import db, User, Portfolio
+    rows = db.session.query(User.id, User.email, Portfolio.public_url) \
+        .join(Portfolio, Portfolio.user_id == User.id) \
+        .filter(User.username.like(f'{USER_PREFIX}%')).order_by(User.id).all()
+    if not rows:
+        raise click.ClickException('Aucun compte de test : lancez d\'abord "flask benchmark seed"')
+    return rows
+
+
+# --- Mesures -----------------------------------------------------------------
+
+def _percentile(values, percent):
+    # Rang le plus proche sur des valeurs triées
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """Débit et latences (ms) d'une série de requêtes"""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+            **{f'p{p}': round(_percentile(latencies, p) * 1000, 2) for p in (50, 90, 95, 99)},
+            'max': round(latencies[-1] * 1000, 2),
+        },
+    }
+
+
+def run_test_client(scenario, targets, count, warmup):
+    """Mesurer un scénario avec le client de test Flask"""
+    from metrics import get_registry
+
+    endpoint, path, login = SCENARIOS[scenario]
+    app = current_app._get_current_object()
+    client = app.test_client()
+    histogram = get_registry().query_counts.get(endpoint)
+    queries_before = (histogram.sum, histogram.count) if histogram else (0, 0)
+
+    latencies, errors = [], 0
+    for n in range(warmup + count):
+        user_id, _, public_url = targets[n % len(targets)]
+        if login:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        # Contexte neuf comme pour une vraie requête : sinon g (utilisateur connecté,
+        # session SQLAlchemy) serait partagé avec le contexte de la commande
+        with app.app_context():
+            started = time.perf_counter()
+            response = client.get(path(n, public_url))
+            response.get_data()
+            elapsed = time.perf_counter() - started
+        if n >= warmup:
+            latencies.append(elapsed)
+            errors += response.status_code >= 400
+
+    result = summarize(latencies, errors, sum(latencies))
+    histogram = get_registry().query_counts.get(endpoint)
+    if histogram and histogram.count > queries_before[1]:
+        result['queries_per_request'] = round(
+            (histogram.sum - queries_before[0]) / (histogram.count - queries_before[1]), 2)
+    return result
+
+
+def _http_login(session, base_url, email):
+    response = session.get(f'{base_url}/auth/login')
+    match = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', response.text)
+    response = session.post(f'{base_url}/auth/login', data={
+        'email': email, 'password': PASSWORD, 'csrf_token': match.group(1) if match else '',
+    })
+    if '/auth/login' in response.url:
+        raise RuntimeError(f'Connexion impossible pour {email}')
+
+
+def _http_worker(base_url, paths, email):
+    """Processus client : requêtes successives sur une connexion persistante"""
+    import requests
+    session = requests.Session()
+    if email:
+        _http_login(session, base_url, email)
+    latencies, errors = [], 0
+    for path in paths:
+        started = time.perf_counter()
+        try:
+            response = session.get(base_url + path, allow_redirects=False)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            failed = True
+        latencies.append(time.perf_counter() - started)
+        errors += failed
+    return latencies, errors
+
+
+def run_http(scenario, targets, count, warmup, base_url, concurrency):
+    """Mesurer un scénario via HTTP avec plusieurs processus clients"""
+    _, path, login = SCENARIOS[scenario]
+    paths = [path(n, targets[n % len(targets)][2]) for n in range(warmup + count)]
+    _http_worker(base_url, paths[:warmup], targets[0][1] if login else None)
+
+    measured = paths[warmup:]
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        futures = [pool.submit(_http_worker, base_url, measured[i::concurrency],
+                               targets[i % len(targets)][1] if login else None)
+                   for i in range(concurrency)]
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+    return summarize([latency for latencies, _ in results for latency in latencies],
+                     sum(errors for _, errors in results), elapsed)
+
+
+def _child_env(**extra):
+    # Processus lancés depuis flask : ne pas se croire en ligne de commande (Flask-Migrate)
+    env = {name: value for name, value in os.environ.items() if name != 'FLASK_RUN_FROM_CLI'}
+    env.update(extra)
+    return env
+
+
+def start_gunicorn(workers, preload=True):
+    """Démarrer gunicorn sur un port libre ; renvoie (processus, URL)"""
+    import requests
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'wsgi:app', '--bind', f'127.0.0.1:{port}',
+                                '--workers', str(workers), '--log-level', 'warning'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=_child_env(GUNICORN_PRELOAD='true' if preload else 'false'))
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException('gunicorn s\'est arrêté au démarrage')
+        try:
+            # Toute réponse suffit (/metrics ne dépend d'aucun template ni de la base)
+            requests.get(base_url + '/metrics', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException('gunicorn ne répond pas')
+
+
+def process_memory_kb(pid):
+    """RSS et PSS (pages partagées réparties entre processus) en Ko, sous Linux"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    values[f'{name.lower()}_kb'] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def server_memory(master_pid):
+    """Mémoire du maître gunicorn et de chacun de ses workers"""
+    workers = []
+    for name in os.listdir('/proc') if os.path.isdir('/proc') else ():
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # Le nom du processus (2e champ) peut contenir des espaces
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == master_pid:
+            workers.append(process_memory_kb(name))
+    return {'master': process_memory_kb(master_pid), 'workers': workers}
+
+
+def start_smtp_sink():
+    """Serveur SMTP local (aiosmtpd) qui accepte et jette les messages ; renvoie (processus, port)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    # Processus isolé (-I) : le module public.py de l'application masquerait le paquet
+    # `public` dont dépend aiosmtpd
+    process = subprocess.Popen([sys.executable, '-I', '-m', 'aiosmtpd', '-n', '-l', f'127.0.0.1:{port}',
+                                '-c', 'aiosmtpd.handlers.Sink'], stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException("aiosmtpd ne démarre pas (pip install aiosmtpd) : "
+                                       + process.stderr.read().decode('utf-8', 'replace').strip()[-200:])
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise click.ClickException("aiosmtpd ne répond pas")
+
+
+def run_mail(pool, messages, batch_size, concurrency):
+    """Envoyer messages par lots de batch_size depuis concurrency threads ; débit et connexions ouvertes"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    app = current_app._get_current_object()
+
+    def send(batch):
+        # Flask-Mail lit la configuration de l'application pour encoder les messages
+        with app.app_context():
+            pool.send(batch)
+
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in executor.map(send, batches):
+            pass
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return {'messages': len(messages), 'elapsed_s': round(elapsed, 3),
+            'messages_per_s': round(len(messages) / elapsed, 1), 'connections': pool.connects}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# --- Comparaison -------------------------------------------------------------
+
+def compare(before, after, threshold=0.1):
+    """Lignes de comparaison et liste des régressions (p95 ou débit dégradés de plus de threshold)"""
+    lines, regressions = [], []
+    for scenario, new in after['scenarios'].items():
+        old = before['scenarios'].get(scenario)
+        if not old or not old.get('requests') or not new.get('requests'):
+            continue
+        changes = {}
+        for label, old_value, new_value, worse in (
+            ('p50', old['latency_ms']['p50'], new['latency_ms']['p50'], 1),
+            ('p95', old['latency_ms']['p95'], new['latency_ms']['p95'], 1),
+            ('req/s', old['throughput_rps'], new['throughput_rps'], -1),
+        ):
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            changes[label] = change
+            if label != 'p50' and change * worse > threshold:
+                regressions.append(f'{scenario} {label}')
+        lines.append(f"{scenario:16} p50 {new['latency_ms']['p50']:8.2f} ms ({changes['p50']:+.0%})  "
+                     f"p95 {new['latency_ms']['p95']:8.2f} ms ({changes['p95']:+.0%})  "
+                     f"{new['throughput_rps'] or 0:8.1f} req/s ({changes['req/s']:+.0%})")
+    return lines, regressions
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _report_comparison(before, after, threshold):
+    lines, regressions = compare(before, after, threshold)
+    click.echo(f"Comparaison avec {(before.get('commit') or '?')[:8]} ({before.get('client')}) :")
+    for line in lines:
+        click.echo(f'  {line}')
+    if regressions:
+        click.echo(f"❌ Régressions (> {threshold:.0%}) : {', '.join(regressions)}")
+        sys.exit(1)
+    click.echo('✅ Pas de régression')
+
+
+# --- Commandes ---------------------------------------------------------------
+
+@click.group('benchmark')
+def benchmark_command():
+    """Mesurer les performances des pages publiques et du tableau de bord"""
+
+
+@benchmark_command.command('seed')
+@click.option('--users', default=50, help="Nombre de comptes de test")
+@click.option('--items', default=5, help="Projets, expériences, formations et compétences par compte")
+@with_appcontext
+def seed_command(users, items):
+    """Créer les comptes de test manquants"""
+    started = time.monotonic()
+    created = seed(users, items)
+    click.echo(f"✅ {created} compte(s) de test créé(s) en {time.monotonic() - started:.1f}s")
+
+
+@benchmark_command.command('clean')
+@with_appcontext
+def clean_command():
+    """Supprimer les comptes de test"""
+    click.echo(f"✅ {clean()} compte(s) de test supprimé(s)")
+
+
+@benchmark_command.command('run')
+@click.option('--client', type=click.Choice(['test', 'http']), default='test',
+              help="Client de test Flask ou HTTP multi-processus")
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help="Scénario à mesurer (tous par défaut, option répétable)")
+@click.option('--requests', 'count', default=200, help="Requêtes mesurées par scénario")
+@click.option('--warmup', default=20, help="Requêtes de chauffe non mesurées")
+@click.option('--url', default=None, help="Serveur déjà lancé (sinon gunicorn est démarré)")
+@click.option('--concurrency', default=4, help="Processus clients en mode HTTP")
+@click.option('--server-workers', default=2, help="Workers du gunicorn démarré en mode HTTP")
+@click.option('--preload/--no-preload', default=True, help="gunicorn --preload (application chargée dans le maître)")
+@click.option('--output', default='benchmarks', help="Dossier des résultats JSON")
+@click.option('--compare', 'baseline', default=None, type=click.Path(exists=True),
+              help="Résultats précédents à comparer")
+@click.option('--threshold', default=0.1, help="Dégradation tolérée avant régression (0.1 = 10 %)")
+@with_appcontext
+def run_command(client, scenarios, count, warmup, url, concurrency, server_workers, preload, output, baseline,
+                threshold):
+    """Mesurer débit et latences, enregistrer les résultats"""
+    from models import db
+    targets = _targets()
+    scenarios = scenarios or tuple(SCENARIOS)
+
+    server = None
+    if client == 'http' and not url:
+        server, url = start_gunicorn(server_workers, preload)
+    results = {}
+    memory = None
+    try:
+        for scenario in scenarios:
+            if client == 'test':
+                result = run_test_client(scenario, targets, count, warmup)
+            else:
+                result = run_http(scenario, targets, count, warmup, url.rstrip('/'), concurrency)
+            results[scenario] = result
+            latency = result.get('latency_ms', {})
+            click.echo(f"{scenario:16} {result.get('throughput_rps') or 0:8.1f} req/s  "
+                       f"p50 {latency.get('p50', 0):8.2f} ms  p95 {latency.get('p95', 0):8.2f} ms  "
+                       f"p99 {latency.get('p99', 0):8.2f} ms  erreurs {result['errors']}"
+                       + (f"  SQL {result['queries_per_request']}/req" if 'queries_per_request' in result else ''))
+        if server is not None:
+            memory = server_memory(server.pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    commit = _commit()
+    report = {
+        'commit': commit,
+        'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'client': client,
+        'python': platform.python_version(),
+        'database': db.engine.dialect.name,
+        'settings': {'users': len(targets), 'requests': count, 'warmup': warmup,
+                     'concurrency': concurrency if client == 'http' else 1,
+                     'page_cache': current_app.config.get('PAGE_CACHE_TYPE', 'lru')},
+        'scenarios': results,
+    }
+    if memory is not None:
+        report['server'] = {'workers': server_workers, 'preload': preload, 'memory_kb': memory}
+        click.echo(f"Mémoire gunicorn : maître {memory['master']}, workers {memory['workers']}")
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{(commit or 'local')[:8]}-{client}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    click.echo(f"✅ Résultats enregistrés dans {path}")
+
+    if baseline:
+        _report_comparison(_load(baseline), report, threshold)
+
+
+STARTUP_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+created = time.perf_counter() - started
+app.test_client().get('/metrics')
+print(json.dumps({
+    'create_app_s': created,
+    'first_request_s': time.perf_counter() - started,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+@benchmark_command.command('startup')
+@click.option('--runs', default=5, help="Processus neufs à mesurer")
+@click.option('--output', default='benchmarks', help="Dossier des résultats JSON")
+def startup_command(runs, output):
+    """Mesurer le démarrage d'un worker : import et create_app, première requête, mémoire"""
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), env=_child_env())
+        if completed.returncode != 0:
+            raise click.ClickException(completed.stderr.strip().splitlines()[-1] if completed.stderr else 'échec')
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    result = {name: _percentile(sorted(sample[name] for sample in samples), 50) for name in samples[0]}
+    click.echo(f"create_app {result['create_app_s'] * 1000:.0f} ms, première requête "
+               f"{result['first_request_s'] * 1000:.0f} ms, RSS max {result['max_rss_kb'] / 1024:.1f} Mo, "
+               f"{result['modules']:.0f} modules (médianes sur {runs} processus)")
+
+    commit = _commit()
+    report = {'commit': commit, 'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+              'python': platform.python_version(), 'startup': result, 'runs': samples}
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{(commit or 'local')[:8]}-startup.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    click.echo(f"✅ Résultats enregistrés dans {path}")
+
+
+@benchmark_command.command('mail')
+@click.option('--messages', 'count', default=200, help="Messages envoyés par mode")
+@click.option('--concurrency', default=2, help="Threads d'envoi (sessions SMTP du pool)")
+@click.option('--server', default=None, help="Serveur SMTP HÔTE:PORT (config MAIL_* ; sinon aiosmtpd local)")
+@click.option('--output', default='benchmarks', help="Dossier des résultats JSON")
+@with_appcontext
+def mail_command(count, concurrency, server, output):
+    """Mesurer le débit d'envoi des emails : une connexion par message contre le pool SMTP"""
+    from flask_mail import Message
+    from extensions import get_mail
+    from mailer import SMTPPool, render_email
+
+    config = current_app.config
+    # Flask-Mail encode les messages (initialisé au premier envoi)
+    get_mail()
+    sink = None
+    if server:
+        host, _, port = server.rpartition(':')
+        options = {'use_tls': config.get('MAIL_USE_TLS', False), 'use_ssl': config.get('MAIL_USE_SSL', False),
+                   'username': config.get('MAIL_USERNAME'), 'password': config.get('MAIL_PASSWORD')}
+    else:
+        sink, port = start_smtp_sink()
+        host, options = '127.0.0.1', {}
+    batch_size = config.get('MAIL_BATCH_SIZE', 50)
+
+    def messages():
+        # Mêmes textes que les emails de vérification, rendus par les templates précompilés
+        result = []
+        for n in range(count):
+            subject, body = render_email('verification', name=f'Bench {n}', url=f'https://example.com/verify/{n}')
+            result.append(Message(subject, sender='bench@example.com', recipients=[f'bench-{n}@example.com'],
+                                  body=body))
+        return result
+
+    try:
+        results = {
+            # Flask-Mail : connexion, TLS et login pour chaque message
+            'connection_per_message': run_mail(SMTPPool(host, int(port), size=concurrency, max_emails=1, **options),
+                                               messages(), 1, concurrency),
+            'pooled': run_mail(SMTPPool(host, int(port), size=concurrency, **options),
+                               messages(), batch_size, concurrency),
+        }
+    finally:
+        if sink is not None:
+            sink.terminate()
+            sink.wait()
+
+    for mode, result in results.items():
+        click.echo(f"{mode:24} {result['messages_per_s']:8.1f} messages/s  "
+                   f"{result['connections']:4} connexion(s)  {result['elapsed_s']:.2f}s")
+
+    commit = _commit()
+    report = {'commit': commit, 'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+              'python': platform.python_version(), 'server': server or 'aiosmtpd', 'concurrency': concurrency,
+              'batch_size': batch_size, 'mail': results}
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{(commit or 'local')[:8]}-mail.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    click.echo(f"✅ Résultats enregistrés dans {path}")
+
+
+@benchmark_command.command('passwords')
+@click.option('--target-ms', default=250.0, help="Durée visée d'un hachage (et d'une vérification), en ms")
+@click.option('--algorithm', 'algorithms', multiple=True, help="Algorithmes à mesurer (par défaut : disponibles)")
+@click.option('--threads', default=0, help="Vérifications simultanées pour mesurer le débit (0 = nombre de cœurs)")
+@click.option('--output', default='benchmarks', help="Dossier des résultats JSON")
+@with_appcontext
+def passwords_command(target_ms, algorithms, threads, output):
+    """Calibrer le hachage des mots de passe : coût le plus proche de --target-ms par algorithme"""
+    from concurrent.futures import ThreadPoolExecutor
+    from passwords import available_algorithms, calibrate, check_hash, get_hasher, hash_with, measure
+
+    threads = threads or os.cpu_count() or 1
+    configured = get_hasher().method
+    results = {'configured': {'method': configured, 'ms': round(measure(configured), 1)}}
+    click.echo(f"Configuration actuelle {configured} : {results['configured']['ms']:.0f} ms")
+
+    for algorithm in algorithms or available_algorithms():
+        method, measurements = calibrate(algorithm, target_ms)
+        # Débit de vérification avec `threads` calculs simultanés (le hachage libère le GIL)
+        password_hash = hash_with(method, PASSWORD)
+        count = threads * 4
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: check_hash(password_hash, PASSWORD), range(count)))
+        per_second = count / (time.perf_counter() - started)
+        elapsed = dict(measurements)[method]
+        results[algorithm] = {'method': method, 'ms': round(elapsed, 1), 'verifications_per_s': round(per_second, 1),
+                              'measurements': [{'method': m, 'ms': round(ms, 1)} for m, ms in measurements]}
+        click.echo(f"{algorithm:8} {method:24} {elapsed:7.0f} ms  {per_second:7.1f} vérifications/s "
+                   f"({threads} threads)")
+
+    click.echo(f"PASSWORD_HASH_METHOD={results[(algorithms or available_algorithms())[0]]['method']}")
+
+    commit = _commit()
+    report = {'commit': commit, 'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+              'python': platform.python_version(), 'cpus': os.cpu_count(), 'target_ms': target_ms,
+              'threads': threads, 'passwords': results}
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{(commit or 'local')[:8]}-passwords.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    click.echo(f"✅ Résultats enregistrés dans {path}")
+
+
+@benchmark_command.command('compare')
+@click.argument('before', type=click.Path(exists=True))
+@click.argument('after', type=click.Path(exists=True))
+@click.option('--threshold', default=0.1, help="Dégradation tolérée avant régression (0.1 = 10 %)")
+def compare_command(before, after, threshold):
+    """Comparer deux fichiers de résultats"""
+    _report_comparison(_load(before), _load(after), threshold)
+
+
+if __name__ == '__main__':
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        app.cli.main(args=['benchmark'] + sys.argv[1:])
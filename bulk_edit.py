@@ -0,0 +1,144 @@
+"""
+Réorganisation et modification groupées des sections du portfolio
+
+Un nouvel ordre complet et/ou une liste de modifications par élément sont
+appliqués en une seule instruction UPDATE ... SET col = CASE id WHEN ... END,
+dans une transaction, au lieu d'un commit (et d'une invalidation des caches)
+par élément modifié.
+"""
+
+import json
+from datetime import date, datetime
+from urllib.parse import urlparse
+from sqlalchemy import Boolean, Date, String, case, literal, select, update
+from forms import SkillForm
+from models import db, Project, Experience, Education, Skill
+
+# section -> (modèle, champs modifiables)
+SECTIONS = {
+    'projects': (Project, ('title', 'description', 'technologies', 'github_url', 'demo_url', 'featured')),
+    'experiences': (Experience, ('title', 'company', 'location', 'start_date', 'end_date', 'current', 'description')),
+    'education': (Education, ('degree', 'institution', 'location', 'start_date', 'end_date', 'current', 'description')),
+    'skills': (Skill, ('name', 'level', 'category')),
+}
+
+URL_FIELDS = {'github_url', 'demo_url'}
+
+# Mêmes valeurs que les listes du formulaire de compétence
+CHOICES = {
+    ('skills', name): [value for value, _ in getattr(SkillForm, name).kwargs['choices']]
+    for name in ('level', 'category')
+}
+
+
+class BulkEditError(ValueError):
+    """Requête de modification groupée invalide"""
+
+
+def _ids(values, what):
+    if not isinstance(values, list) or not all(isinstance(value, int) and not isinstance(value, bool)
+                                               for value in values):
+        raise BulkEditError(f'{what} : liste d\'identifiants attendue')
+    if len(set(values)) != len(values):
+        raise BulkEditError(f'{what} : identifiant en double')
+    return values
+
+
+def _coerce(section, column, value):
+    """Valeur d'un champ convertie et validée selon le type de la colonne"""
+    name = column.name
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        if not column.nullable:
+            raise BulkEditError(f'Le champ {name} est obligatoire')
+        # Chaîne vide autorisée pour les champs texte facultatifs, comme dans les formulaires
+        return None if isinstance(column.type, (Boolean, Date)) or name in URL_FIELDS else value
+
+    if name == 'technologies':
+        if isinstance(value, str):
+            value = value.split(',')
+        if not isinstance(value, list) or not all(isinstance(tech, str) for tech in value):
+            raise BulkEditError('Le champ technologies doit être une liste')
+        return json.dumps([tech.strip() for tech in value if tech.strip()])
+    if isinstance(column.type, Boolean):
+        if not isinstance(value, bool):
+            raise BulkEditError(f'Le champ {name} doit valoir true ou false')
+        return value
+    if isinstance(column.type, Date):
+        try:
+            return date.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise BulkEditError(f'Le champ {name} doit être une date AAAA-MM-JJ')
+    if not isinstance(value, str):
+        raise BulkEditError(f'Le champ {name} doit être du texte')
+    if isinstance(column.type, String) and column.type.length and len(value) > column.type.length:
+        raise BulkEditError(f'Le champ {name} ne doit pas dépasser {column.type.length} caractères')
+    if (section, name) in CHOICES and value not in CHOICES[(section, name)]:
+        raise BulkEditError(f"Valeur non valide pour {name} : {', '.join(CHOICES[(section, name)])}")
+    if name in URL_FIELDS and urlparse(value).scheme not in ('http', 'https'):
+        raise BulkEditError(f'Le champ {name} doit être une URL http(s)')
+    return value
+
+
+def _patches(section, table, items):
+    """Modifications par colonne : {colonne: {id: valeur}}"""
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise BulkEditError('items : liste d\'objets attendue')
+    fields = SECTIONS[section][1]
+    columns = {}
+    _ids([item.get('id') for item in items], 'items')
+    for item in items:
+        unknown = set(item) - set(fields) - {'id'}
+        if unknown:
+            raise BulkEditError(f"Champ non modifiable : {', '.join(sorted(unknown))}")
+        values = {name: _coerce(section, table.c[name], value) for name, value in item.items() if name != 'id'}
+        # Pas de date de fin pour un poste ou une formation en cours
+        if values.get('current'):
+            values['end_date'] = None
+        for name, value in values.items():
+            columns.setdefault(name, {})[item['id']] = value
+    return columns
+
+
+def apply_bulk_edit(portfolio, section, order=None, items=None):
+    """Appliquer un nouvel ordre et/ou des modifications en une transaction ; renvoie le résumé"""
+    model = SECTIONS[section][0]
+    table = model.__table__
+    existing = set(db.session.execute(
+        select(table.c.id).where(table.c.portfolio_id == portfolio.id)
+    ).scalars())
+
+    columns = {}
+    if order is not None:
+        order = _ids(order, 'order')
+        if set(order) != existing:
+            raise BulkEditError('order doit contenir tous les éléments de la section, une seule fois')
+        columns['order_index'] = {item_id: index for index, item_id in enumerate(order)}
+    if items:
+        patches = _patches(section, table, items)
+        if not {item['id'] for item in items} <= existing:
+            raise BulkEditError('items : élément introuvable dans cette section')
+        columns.update(patches)
+    if not columns:
+        raise BulkEditError('Rien à modifier : order ou items attendu')
+
+    # Une seule instruction pour tous les éléments : chaque colonne prend la
+    # valeur prévue pour son id, les autres lignes gardent la leur
+    ids = sorted({item_id for values in columns.values() for item_id in values})
+    now = datetime.utcnow()
+    values = {
+        name: case({item_id: literal(value, table.c[name].type) for item_id, value in by_id.items()},
+                   value=table.c.id, else_=table.c[name])
+        for name, by_id in columns.items()
+    }
+    result = db.session.execute(
+        update(table)
+        .where(table.c.portfolio_id == portfolio.id, table.c.id.in_(ids))
+        .values(updated_at=now, **values)
+    )
+    if items:
+        # La mise à jour ne passe pas par la session : modifier le portfolio le réindexe pour la recherche
+        portfolio.updated_at = now
+    db.session.commit()
+    return {'section': section, 'updated': result.rowcount, 'order': order is not None}
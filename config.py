@@ -9,6 +9,32 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'mssql+pyodbc://@localhost\\SQLEXPRESS/portfolio_builder?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Pool de connexions par worker (0 = pas de pool local), borné par DB_MAX_CONNECTIONS
+    # (plafond du serveur, réparti entre WEB_CONCURRENCY workers) ; DB_PGBOUNCER pour
+    # PgBouncer en mode transaction (pas de requêtes préparées côté serveur)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # secondes
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    DB_MAX_CONNECTIONS = int(os.environ['DB_MAX_CONNECTIONS']) if os.environ.get('DB_MAX_CONNECTIONS') else None
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ['true', 'on', '1']
+    
+    # Réplica en lecture pour les endpoints (ou blueprints) listés, abandonné au-delà de
+    # DATABASE_REPLICA_MAX_LAG secondes de retard ; après une écriture, le visiteur lit
+    # sur le primaire pendant DATABASE_REPLICA_STICKY secondes
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    DATABASE_REPLICA_ENDPOINTS = ('public',)
+    DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+    DATABASE_REPLICA_CHECK_INTERVAL = float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 10))
+    DATABASE_REPLICA_STICKY = int(os.environ.get('DATABASE_REPLICA_STICKY', 10))
+    
+    # Service ASGI des pages publiques (uvicorn asgi:app) : base lue avec un pilote asynchrone
+    # (par défaut le réplica ou la base principale via asyncpg/aiosqlite) et threads des
+    # requêtes transmises à l'application WSGI (tableau de bord, envois, fichiers)
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 8))
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'static/uploads'
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     
@@ -18,6 +44,127 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    # Envoi : sessions SMTP gardées ouvertes par processus (réutilisées pendant MAIL_POOL_IDLE
+    # secondes), messages par tâche pour send_many et débit maximal (messages/s, 0 = illimité)
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE', 2))
+    MAIL_POOL_IDLE = int(os.environ.get('MAIL_POOL_IDLE', 60))
+    MAIL_MAX_EMAILS = int(os.environ['MAIL_MAX_EMAILS']) if os.environ.get('MAIL_MAX_EMAILS') else None
+    MAIL_TIMEOUT = int(os.environ.get('MAIL_TIMEOUT', 10))
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+    MAIL_RATE_LIMIT = float(os.environ.get('MAIL_RATE_LIMIT', 5))
+    
+    # Durée de validité des jetons signés envoyés par email, en secondes (voir tokens.py,
+    # qui fixe les valeurs par défaut)
+    TOKEN_MAX_AGE = {
+        purpose: int(value) for purpose, value in (
+            ('reset-password', os.environ.get('PASSWORD_RESET_TOKEN_MAX_AGE')),
+            ('verify-email', os.environ.get('EMAIL_VERIFY_TOKEN_MAX_AGE')),
+        ) if value
+    }
+    
+    # Hachage des mots de passe (voir passwords.py) : algorithme et coût, à calibrer avec
+    # `flask benchmark passwords` ; threads dédiés par processus (0 = dans la requête)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 0))
+    
+    # Limitation des tentatives (voir ratelimit.py) : règles 'N/période' (fenêtre glissante)
+    # ou 'N/période burst B' (seau à jetons), vide = pas de limite ; compteurs 'memory'
+    # (par processus) ou 'redis' (partagés) ; proxys de confiance devant l'application
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory')
+    RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL') or os.environ.get('REDIS_URL')
+    RATELIMIT_PROXY_COUNT = int(os.environ.get('RATELIMIT_PROXY_COUNT', 0))
+    RATELIMIT_LOGIN = os.environ.get('RATELIMIT_LOGIN', '10/minute burst 20')  # par IP
+    RATELIMIT_LOGIN_ACCOUNT = os.environ.get('RATELIMIT_LOGIN_ACCOUNT', '5/minute')  # par email visé
+    RATELIMIT_REGISTER = os.environ.get('RATELIMIT_REGISTER', '5/hour')
+    RATELIMIT_RESET_PASSWORD = os.environ.get('RATELIMIT_RESET_PASSWORD', '5/hour')
+    RATELIMIT_RESET_PASSWORD_ACCOUNT = os.environ.get('RATELIMIT_RESET_PASSWORD_ACCOUNT', '3/hour')
+    RATELIMIT_CV_IMPORT = os.environ.get('RATELIMIT_CV_IMPORT', '20/hour')  # par utilisateur
+    
+    # Cache des pages publiques rendues ('lru', 'redis' ou 'null')
+    PAGE_CACHE_TYPE = os.environ.get('PAGE_CACHE_TYPE', 'lru')
+    PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 300))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512))
+    PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL') or os.environ.get('REDIS_URL')
+    
+    # Compteur de vues asynchrone ('memory', 'spool' ou 'sync')
+    VIEW_COUNTER_FLUSH_INTERVAL = float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 10))
+    VIEW_COUNTER_DURABILITY = os.environ.get('VIEW_COUNTER_DURABILITY', 'memory')
+    VIEW_COUNTER_SPOOL_DIR = os.environ.get('VIEW_COUNTER_SPOOL_DIR') or 'instance/view_spool'
+    VIEW_COUNTER_FSYNC = os.environ.get('VIEW_COUNTER_FSYNC', 'false').lower() in ['true', 'on', '1']
+    
+    # Statistiques de visites (0 = écriture immédiate)
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 10))
+    ANALYTICS_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RETENTION_DAYS', 30))
+    ANALYTICS_ROLLUP_INTERVAL = float(os.environ.get('ANALYTICS_ROLLUP_INTERVAL', 300))  # visiteurs uniques, top
+    
+    # Recherche plein texte ('auto', 'postgresql', 'sqlite' ou 'python')
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    
+    # Cache-Control par route publique ('portfolio', 'embed', 'api', 'cv', 'private'),
+    # les valeurs absentes reprennent http_cache.DEFAULT_POLICIES
+    HTTP_CACHE_CONTROL = {}
+    
+    # Export statique des portfolios publics (flask export-static)
+    STATIC_EXPORT_FOLDER = os.environ.get('STATIC_EXPORT_FOLDER') or 'static_export'
+    
+    # Images envoyées : largeurs générées par type, formats (AVIF si pillow-avif-plugin
+    # est installé), qualité et taille du pool de processus (0 = traitement synchrone)
+    IMAGE_VARIANTS = {'profile': (96, 192, 384), 'project': (480, 960, 1440)}
+    IMAGE_FORMATS = ('avif', 'webp', 'jpeg')
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    
+    # Import de CV depuis une URL (exécuté par la file de tâches)
+    CV_IMPORT_MAX_BYTES = int(os.environ.get('CV_IMPORT_MAX_BYTES', 16 * 1024 * 1024))
+    CV_IMPORT_TIMEOUT = int(os.environ.get('CV_IMPORT_TIMEOUT', 30))  # secondes sans données
+    CV_IMPORT_RETRIES = int(os.environ.get('CV_IMPORT_RETRIES', 3))
+    
+    # File de tâches de fond (emails, imports de CV, images) : 'database' (table jobs),
+    # 'memory' (un seul processus) ou 'sync' (après la réponse). Threads exécutant les
+    # tâches dans chaque processus web (0 = seulement des workers `flask jobs worker`),
+    # tentatives et délais entre tentatives (doublés à chaque échec), en secondes
+    JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'database')
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 1))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BASE_DELAY = float(os.environ.get('JOB_RETRY_BASE_DELAY', 10))
+    JOB_RETRY_MAX_DELAY = float(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))  # tâche 'running' reprise au-delà
+    
+    # CV générés à partir du portfolio (pool de processus, 0 = dans la requête)
+    CV_RENDER_WORKERS = int(os.environ.get('CV_RENDER_WORKERS', 2))
+    CV_RENDER_TIMEOUT = int(os.environ.get('CV_RENDER_TIMEOUT', 20))  # secondes d'attente par requête
+    
+    # Service des fichiers envoyés : 'python' (sendfile sous gunicorn), 'x-accel' (nginx,
+    # location internal FILE_SERVING_ACCEL_PREFIX -> UPLOAD_FOLDER) ou 'x-sendfile'
+    FILE_SERVING_MODE = os.environ.get('FILE_SERVING_MODE', 'python')
+    FILE_SERVING_ACCEL_PREFIX = os.environ.get('FILE_SERVING_ACCEL_PREFIX', '/_uploads/')
+    
+    # Stockage des fichiers envoyés : 'local' (UPLOAD_FOLDER) ou 's3' (paquet boto3 requis,
+    # compatible MinIO via S3_ENDPOINT_URL). Les fichiers en cours d'écriture passent par
+    # UPLOAD_SCRATCH_FOLDER (UPLOAD_FOLDER/.tmp par défaut).
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    UPLOAD_SCRATCH_FOLDER = os.environ.get('UPLOAD_SCRATCH_FOLDER')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', 'uploads/')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')  # CDN ou bucket public pour les images
+    S3_PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', 300))
+    S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    
+    # Mesures par requête exposées sur /metrics (format Prometheus, protégé par
+    # METRICS_TOKEN ; sans jeton, 404 hors debug et test), journal des requêtes SQL
+    # lentes (0 = désactivé)
+    # et en-tête Server-Timing (par défaut seulement en mode debug)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    REQUEST_QUERY_WARNING = int(os.environ.get('REQUEST_QUERY_WARNING', 30))  # requêtes SQL par requête HTTP
+    SERVER_TIMING = None
     
     # Configuration de l'environnement
     FLASK_ENV = os.environ.get('FLASK_ENV', 'development')
@@ -38,6 +185,14 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    PAGE_CACHE_TYPE = 'null'
+    VIEW_COUNTER_DURABILITY = 'sync'
+    ANALYTICS_FLUSH_INTERVAL = 0
+    IMAGE_WORKERS = 0
+    JOB_QUEUE_BACKEND = 'sync'
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # rapide : les tests créent beaucoup de comptes
+    CV_RENDER_WORKERS = 0
+    RATELIMIT_ENABLED = False
 
 # Dictionnaire des configurations
 config = {
@@ -1,27 +1,14 @@
 import os
-from dotenv import load_dotenv
+from config import ProductionConfig
 
-load_dotenv()
-
-class Config:
-    """Configuration pour Render"""
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    
+class RenderConfig(ProductionConfig):
+    """Configuration pour Render (FLASK_CONFIG=config_render.RenderConfig)"""
     # Configuration PostgreSQL pour Render
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql://localhost/portfolio_builder'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
-    # Configuration des dossiers
-    UPLOAD_FOLDER = 'static/uploads'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-    
-    # Configuration email (optionnel)
-    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
-    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
-    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
-    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     
     # Configuration Flask
     FLASK_ENV = os.environ.get('FLASK_ENV', 'production')
     FLASK_DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ['true', 'on', '1']
+    
+    # Le proxy de Render ajoute l'adresse du client à X-Forwarded-For
+    RATELIMIT_PROXY_COUNT = int(os.environ.get('RATELIMIT_PROXY_COUNT', 1))
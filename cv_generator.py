@@ -0,0 +1,358 @@
+"""
+Génération de CV à partir des données du portfolio
+
+Le CV (PDF, texte ou Markdown) est construit à partir des expériences,
+formations, compétences et projets, avec les couleurs du thème. Le rendu se
+fait dans un pool de processus et le résultat est confié au stockage sous
+generated/cv/<portfolio>/<version>.<ext>, où la version est celle du
+portfolio (voir http_cache) : tant que le portfolio ne change pas, les
+téléchargements servent le même fichier sans nouveau rendu, et les requêtes
+conditionnelles reçoivent un 304 sans même lire le stockage. Le rendu d'une
+nouvelle version supprime les fichiers des versions précédentes du même
+format.
+"""
+
+import atexit
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app, Response
+from werkzeug.utils import get_content_type
+from http_cache import is_fresh, not_modified
+from models import db, User, Portfolio
+from pdf_document import PDFDocument, hex_to_rgb
+from repository import load_portfolio_or_404
+from storage import get_storage, scratch_folder
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand la mise en forme change : les CV déjà générés sont ignorés
+RENDER_VERSION = 1
+
+# format -> (type MIME, extension)
+FORMATS = {
+    'pdf': ('application/pdf', 'pdf'),
+    'txt': ('text/plain', 'txt'),
+    'md': ('text/markdown', 'md'),
+}
+
+CONTACT_LABELS = (
+    ('email', 'Email'),
+    ('phone', 'Téléphone'),
+    ('location', 'Localisation'),
+    ('linkedin', 'LinkedIn'),
+    ('github', 'GitHub'),
+    ('website', 'Site web'),
+)
+
+
+def _period(start_date, end_date, current):
+    if start_date is None:
+        return ''
+    end = 'Présent' if current or end_date is None else str(end_date.year)
+    if end == str(start_date.year):
+        return end
+    return f'{start_date.year} - {end}'
+
+
+def _lines(text):
+    return [line.strip(' \t-•*') for line in (text or '').splitlines() if line.strip(' \t-•*')]
+
+
+def cv_data(portfolio):
+    """Données du CV (dictionnaire simple, transmis au pool de rendu) à partir d'un instantané"""
+    user = portfolio.user
+    current_titles = [exp.title for exp in portfolio.experiences if exp.current]
+    return {
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'headline': current_titles[0] if current_titles else '',
+        'bio': portfolio.bio or '',
+        'contact': [(label, getattr(portfolio, name, None) or getattr(user, name, None))
+                    for name, label in CONTACT_LABELS
+                    if getattr(portfolio, name, None) or getattr(user, name, None)],
+        'theme': {
+            'primary_color': portfolio.theme_primary_color,
+            'secondary_color': portfolio.theme_secondary_color,
+            'layout': portfolio.theme_layout,
+        },
+        'experiences': [{
+            'title': f'{exp.title} - {exp.company}',
+            'period': _period(exp.start_date, exp.end_date, exp.current),
+            'location': exp.location or '',
+            'bullets': _lines(exp.description),
+        } for exp in portfolio.experiences],
+        'education': [{
+            'title': f'{edu.degree} - {edu.institution}',
+            'period': _period(edu.start_date, edu.end_date, edu.current),
+            'location': edu.location or '',
+            'bullets': _lines(edu.description),
+        } for edu in portfolio.education],
+        'skills': [(category, [f'{skill.name} ({skill.level})' if skill.level else skill.name
+                               for skill in skills])
+                   for category, skills in portfolio.skills_by_category.items()],
+        'projects': [{
+            'title': project.title,
+            'period': str(project.created_at.year) if project.created_at else '',
+            'location': '',
+            'bullets': _lines(project.description)
+            + ([f"Technologies: {', '.join(project.get_technologies_list())}"]
+               if project.get_technologies_list() else [])
+            + ([f'GitHub: {project.github_url}'] if project.github_url else [])
+            + ([f'Démo: {project.demo_url}'] if project.demo_url else []),
+        } for project in portfolio.projects],
+    }
+
+
+def _sections(data):
+    """Sections du CV dans l'ordre : (titre, [(intitulé, [puces])])"""
+    sections = []
+    for key, heading in (('experiences', 'Expérience professionnelle'), ('education', 'Formation')):
+        if data[key]:
+            sections.append((heading, [(_entry_title(entry), entry['bullets']) for entry in data[key]]))
+    if data['skills']:
+        sections.append(('Compétences', [(f'{category}:', names) for category, names in data['skills']]))
+    if data['projects']:
+        sections.append(('Projets notables', [(_entry_title(entry), entry['bullets']) for entry in data['projects']]))
+    return sections
+
+
+def _entry_title(entry):
+    details = ', '.join(part for part in (entry['location'], entry['period']) if part)
+    return f"{entry['title']} ({details})" if details else entry['title']
+
+
+def render_text(data):
+    """CV en texte brut (même présentation que les exports CV_<Nom>_<date>.txt)"""
+    lines = ['CURRICULUM VITAE', '', f"{data['first_name']} {data['last_name'].upper()}"]
+    if data['headline']:
+        lines.append(data['headline'])
+    if data['contact']:
+        lines += ['', 'INFORMATIONS PERSONNELLES']
+        lines += [f'{label}: {value}' for label, value in data['contact']]
+    if data['bio']:
+        lines += ['', 'PROFIL', data['bio'].strip()]
+    for heading, entries in _sections(data):
+        lines += ['', heading.upper()]
+        for title, bullets in entries:
+            lines += ['', title]
+            lines += [f'• {bullet}' for bullet in bullets]
+    return '\n'.join(lines) + '\n'
+
+
+def _md(text):
+    for char in '\\`*_[]#':
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+def render_markdown(data):
+    """CV en Markdown"""
+    lines = [f"# {_md(data['first_name'])} {_md(data['last_name'])}"]
+    if data['headline']:
+        lines += ['', f"**{_md(data['headline'])}**"]
+    if data['contact']:
+        lines.append('')
+        lines += [f'- {label} : {_md(value)}' for label, value in data['contact']]
+    if data['bio']:
+        lines += ['', _md(data['bio'].strip())]
+    for heading, entries in _sections(data):
+        lines += ['', f'## {heading}']
+        for title, bullets in entries:
+            lines += ['', f'### {_md(title)}']
+            if bullets:
+                lines.append('')
+                lines += [f'- {_md(bullet)}' for bullet in bullets]
+    return '\n'.join(lines) + '\n'
+
+
+def render_pdf(data):
+    """CV en PDF, aux couleurs du thème"""
+    theme = data['theme']
+    primary = hex_to_rgb(theme['primary_color'], (0.23, 0.51, 0.96))
+    secondary = hex_to_rgb(theme['secondary_color'], (0.12, 0.16, 0.22))
+    muted = (0.42, 0.45, 0.5)
+    # Les polices web du thème ne sont pas embarquées : police standard la plus proche
+    family = 'times' if theme['layout'] == 'classic' else 'helvetica'
+    name = f"{data['first_name']} {data['last_name']}"
+
+    doc = PDFDocument(title=f'CV - {name}', family=family)
+    doc.text(name, size=22, bold=True, color=primary)
+    if data['headline']:
+        doc.text(data['headline'], size=12, color=secondary)
+    if data['contact']:
+        doc.space(4)
+        doc.text('  |  '.join(value for _, value in data['contact']), size=8.5, color=muted)
+    if data['bio']:
+        doc.space(8)
+        doc.text(data['bio'].strip(), size=9.5, color=secondary)
+
+    for heading, entries in _sections(data):
+        doc.space(14)
+        # Pas de titre de section seul en bas de page
+        doc.ensure_space(60)
+        doc.text(heading.upper(), size=11.5, bold=True, color=primary)
+        doc.rule(color=primary)
+        for title, bullets in entries:
+            doc.space(6)
+            doc.ensure_space(30)
+            doc.text(title, size=10, bold=True, color=secondary)
+            for bullet in bullets:
+                doc.text(bullet, size=9.5, color=secondary, indent=14, marker='•')
+    return doc.build()
+
+
+RENDERERS = {
+    'pdf': render_pdf,
+    'txt': lambda data: render_text(data).encode('utf-8'),
+    'md': lambda data: render_markdown(data).encode('utf-8'),
+}
+
+
+def generate_cv(data, fmt, key, scratch_dir, storage):
+    """Rendre un CV et le confier au stockage (exécuté dans un processus du pool)"""
+    content = RENDERERS[fmt](data)
+    fd, path = tempfile.mkstemp(dir=scratch_dir, prefix='.cv-', suffix=f'.{FORMATS[fmt][1]}')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        storage.save_file(path, key, content_type=get_content_type(FORMATS[fmt][0], 'utf-8'))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    discard_previous_versions(key, storage)
+
+
+def cv_key(portfolio_id, etag, fmt):
+    """Clé de stockage du CV généré pour une version de portfolio"""
+    return f'generated/cv/{portfolio_id}/{etag}-v{RENDER_VERSION}.{FORMATS[fmt][1]}'
+
+
+def discard_previous_versions(key, storage):
+    """Supprimer les CV du même portfolio et du même format, sauf celui de `key`"""
+    folder, name = posixpath.split(key)
+    extension = posixpath.splitext(name)[1]
+    try:
+        for other in storage.list_keys(f'{folder}/'):
+            if other != key and other.endswith(extension):
+                storage.delete(other)
+    except Exception as e:
+        # Le CV rendu reste servi ; nouvel essai au prochain rendu
+        logger.warning(f"Suppression des anciens CV de {folder} impossible : {e}")
+
+
+class CVRenderer:
+    """Pool de processus pour le rendu des CV, un seul rendu par version et par format"""
+
+    def __init__(self, app, workers=2, timeout=20, max_stored=1024):
+        self.app = app
+        self.workers = workers
+        self.timeout = timeout
+        self.max_stored = max_stored
+        # Clés connues dans le stockage (LRU) : évite d'interroger le stockage à chaque téléchargement
+        self._stored = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def is_stored(self, key, storage):
+        """Le CV de cette version est-il déjà dans le stockage ?"""
+        with self._lock:
+            if key in self._stored:
+                self._stored.move_to_end(key)
+                return True
+        if storage.exists(key):
+            # Clé liée à la version : le fichier ne change plus
+            self._remember(key)
+            return True
+        return False
+
+    def _remember(self, key):
+        with self._lock:
+            self._stored[key] = True
+            self._stored.move_to_end(key)
+            while len(self._stored) > self.max_stored:
+                self._stored.popitem(last=False)
+
+    def render(self, data, fmt, key, storage):
+        """Rendre un CV et attendre le résultat (au plus timeout secondes)"""
+        args = (data, fmt, key, scratch_folder(self.app), storage)
+        if not self.workers:
+            generate_cv(*args)
+        else:
+            with self._lock:
+                # Téléchargements simultanés d'une même version : un seul rendu
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._get_executor().submit(generate_cv, *args)
+                    self._pending[key] = future
+                    future.add_done_callback(lambda f: self._pending.pop(key, None))
+            future.result(timeout=self.timeout)
+        self._remember(key)
+
+    def _get_executor(self):
+        # Un pool par processus : les workers gunicorn ne partagent pas celui du maître
+        if self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pending = {}
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+        return self._executor
+
+    def stop(self):
+        """Attendre la fin des rendus en cours"""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pid = None
+
+
+def get_renderer():
+    """Récupérer le pool de rendu de l'application courante (créé au premier appel)"""
+    renderer = current_app.extensions.get('cv_renderer')
+    if renderer is None:
+        renderer = CVRenderer(
+            current_app._get_current_object(),
+            workers=current_app.config.get('CV_RENDER_WORKERS', 2),
+            timeout=current_app.config.get('CV_RENDER_TIMEOUT', 20),
+        )
+        current_app.extensions['cv_renderer'] = renderer
+    return renderer
+
+
+def send_generated_cv(validator, fmt, policy='cv', as_attachment=True):
+    """Réponse HTTP pour le CV généré d'une version de portfolio (voir http_cache.portfolio_validator)"""
+    etag = f'{validator.etag}-{fmt}'
+    if is_fresh(etag, validator.last_modified, weak=False):
+        return not_modified(etag, validator.last_modified, policy, weak=False)
+
+    storage = get_storage()
+    renderer = get_renderer()
+    key = cv_key(validator.portfolio_id, validator.etag, fmt)
+    if not renderer.is_stored(key, storage):
+        portfolio = load_portfolio_or_404(portfolio_id=validator.portfolio_id)
+        try:
+            renderer.render(cv_data(portfolio), fmt, key, storage)
+        except FutureTimeout:
+            logger.warning(f"Rendu du CV {key} trop long")
+            response = Response('Génération du CV en cours, réessayez dans quelques secondes.',
+                                status=503, mimetype='text/plain')
+            response.headers['Retry-After'] = '5'
+            return response
+
+    user = db.session.query(User).join(Portfolio, Portfolio.user_id == User.id) \
+        .filter(Portfolio.id == validator.portfolio_id).first()
+    return storage.serve(
+        key,
+        mimetype=FORMATS[fmt][0],
+        as_attachment=as_attachment,
+        download_name=f"CV_{user.get_full_name().replace(' ', '_')}.{FORMATS[fmt][1]}",
+        etag=etag,
+        last_modified=validator.last_modified,
+        policy=policy
+    )
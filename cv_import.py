@@ -0,0 +1,227 @@
+"""
+Import de CV depuis une URL
+
+Le téléchargement ne se fait plus dans la requête : un import est enregistré
+dans cv_imports puis exécuté par la file de tâches (jobs.py). Le fichier est lu en
+flux, par morceaux, dans un fichier partiel (.part) avec une limite de taille
+stricte ; en cas d'erreur réseau le téléchargement reprend là où il s'était
+arrêté (en-tête Range). Le contenu doit commencer par la signature PDF, quel
+que soit le content-type annoncé, et n'est confié au stockage (cv/, sous
+l'empreinte de son contenu) qu'une fois complet. La page CV interroge /portfolio/cv/import/<id> pour suivre
+l'avancement.
+"""
+
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from file_serving import store_content_addressed
+from jobs import enqueue, task
+from storage import scratch_folder
+
+logger = logging.getLogger(__name__)
+
+PDF_SIGNATURE = b'%PDF-'
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+
+class CVImportError(Exception):
+    """Erreur définitive : inutile de réessayer"""
+
+
+def download(url, part_path, max_bytes, timeout=(5, 30), chunk_size=64 * 1024, progress=None):
+    """Télécharger url dans part_path, en reprenant un fichier partiel existant ; renvoie la taille"""
+    # Import différé : requests n'est chargé que par les processus qui importent des CV
+    import requests
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # Le fichier partiel est déjà complet
+            return offset
+        if response.status_code == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != offset:
+                raise requests.RequestException("Reprise refusée par le serveur")
+            mode = 'ab'
+        elif response.status_code == 200:
+            # Pas de reprise possible : on recommence depuis le début
+            offset, mode = 0, 'wb'
+        else:
+            raise CVImportError(f"Le serveur a répondu {response.status_code}")
+
+        length = response.headers.get('Content-Length')
+        total = offset + int(length) if length and length.isdigit() else None
+        if total is not None and total > max_bytes:
+            raise CVImportError(f"Fichier trop volumineux (max {max_bytes // (1024 * 1024)} Mo)")
+        if progress:
+            progress(offset, total)
+
+        received = offset
+        with open(part_path, mode) as f:
+            head = None if offset else b''
+            for chunk in response.iter_content(chunk_size):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise CVImportError(f"Fichier trop volumineux (max {max_bytes // (1024 * 1024)} Mo)")
+                if head is not None and len(head) < len(PDF_SIGNATURE):
+                    head += chunk[:len(PDF_SIGNATURE)]
+                    if len(head) >= len(PDF_SIGNATURE) and not head.startswith(PDF_SIGNATURE):
+                        raise CVImportError("Le fichier n'est pas un PDF")
+                f.write(chunk)
+                if progress:
+                    progress(received, total)
+    return received
+
+
+def has_pdf_signature(path):
+    """Le fichier commence-t-il par la signature PDF ?"""
+    with open(path, 'rb') as f:
+        return f.read(len(PDF_SIGNATURE)) == PDF_SIGNATURE
+
+
+class CVImporter:
+    """Exécution des imports de CV (dans un worker de la file de tâches)"""
+
+    def __init__(self, app, max_bytes=16 * 1024 * 1024, timeout=30, retries=3):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.retries = retries
+
+    def run(self, import_id):
+        """Exécuter un import"""
+        from models import db, CVImport
+
+        try:
+            cv_import = db.session.get(CVImport, import_id)
+            if cv_import is None or cv_import.status == 'done':
+                return
+            self._download(cv_import)
+        except Exception as e:
+            logger.error(f"Erreur import CV {import_id}: {e}")
+            db.session.rollback()
+            # Sinon l'import reste « en cours » et ne peut pas être relancé ; le fichier partiel est conservé
+            try:
+                cv_import = db.session.get(CVImport, import_id)
+                if cv_import is not None and cv_import.status != 'done':
+                    self._fail(cv_import, "Erreur interne lors de l'import")
+            except Exception as e:
+                logger.error(f"Impossible de marquer l'import CV {import_id} en échec : {e}")
+                db.session.rollback()
+
+    def _download(self, cv_import):
+        import requests
+        from models import db
+
+        part_path = os.path.join(scratch_folder(self.app), f'cv-import-{cv_import.id}.part')
+        last_update = [0.0]
+
+        def progress(received, total):
+            # Au plus deux écritures par seconde pour le suivi
+            now = time.monotonic()
+            if now - last_update[0] >= 0.5:
+                last_update[0] = now
+                cv_import.bytes_received = received
+                cv_import.total_bytes = total
+                db.session.commit()
+
+        cv_import.status = 'downloading'
+        cv_import.error = None
+        db.session.commit()
+
+        for attempt in range(self.retries + 1):
+            cv_import.attempts = (cv_import.attempts or 0) + 1
+            try:
+                size = download(cv_import.url, part_path, self.max_bytes,
+                                timeout=(5, self.timeout), progress=progress)
+                if not has_pdf_signature(part_path):
+                    raise CVImportError("Le fichier n'est pas un PDF")
+            except CVImportError as e:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                self._fail(cv_import, str(e))
+                return
+            except (requests.RequestException, OSError) as e:
+                if attempt == self.retries:
+                    # Le fichier partiel est conservé : l'import pourra être relancé
+                    self._fail(cv_import, f"Erreur lors du téléchargement : {e}")
+                    return
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            break
+
+        cv_import.filename = store_content_addressed(part_path, 'cv', 'pdf')
+        self._complete(cv_import, size)
+
+    def _fail(self, cv_import, message):
+        from models import db
+
+        cv_import.status = 'failed'
+        cv_import.error = message[:300]
+        db.session.commit()
+
+    def _complete(self, cv_import, size):
+        from models import db, Portfolio
+        from page_cache import invalidate_portfolio
+
+        portfolio = db.session.get(Portfolio, cv_import.portfolio_id)
+        portfolio.cv_filename = cv_import.filename
+        portfolio.cv_url = f"/uploads/cv/{cv_import.filename}"
+        portfolio.cv_uploaded_at = datetime.utcnow()
+        cv_import.status = 'done'
+        cv_import.bytes_received = size
+        cv_import.total_bytes = size
+        db.session.commit()
+        invalidate_portfolio(portfolio)
+
+
+def get_importer():
+    """Récupérer l'exécuteur d'imports de l'application courante (créé au premier appel)"""
+    importer = current_app.extensions.get('cv_importer')
+    if importer is None:
+        config = current_app.config
+        importer = CVImporter(
+            current_app._get_current_object(),
+            max_bytes=config.get('CV_IMPORT_MAX_BYTES', config.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024),
+            timeout=config.get('CV_IMPORT_TIMEOUT', 30),
+            retries=config.get('CV_IMPORT_RETRIES', 3),
+        )
+        current_app.extensions['cv_importer'] = importer
+    return importer
+
+
+@task('cv_import.run', max_attempts=1)
+def run_import(import_id):
+    """Tâche de fond : téléchargement d'un CV (les reprises sont gérées par l'import)"""
+    get_importer().run(import_id)
+
+
+def start_import(portfolio, url, name=None):
+    """Enregistrer un import de CV et le lancer en arrière-plan"""
+    from models import db, CVImport
+
+    name = secure_filename(name or '') or f"imported_cv_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.pdf"
+    if not name.lower().endswith('.pdf'):
+        name += '.pdf'
+    # Nom affiché pendant l'import, remplacé par l'empreinte du contenu à la fin
+    cv_import = CVImport(portfolio_id=portfolio.id, url=url, filename=name)
+    db.session.add(cv_import)
+    db.session.commit()
+    enqueue('cv_import.run', import_id=cv_import.id)
+    return cv_import
+
+
+def retry_import(cv_import):
+    """Relancer un import échoué (reprend le fichier partiel s'il existe)"""
+    from models import db
+
+    cv_import.status = 'pending'
+    cv_import.error = None
+    db.session.commit()
+    enqueue('cv_import.run', import_id=cv_import.id)
@@ -0,0 +1,515 @@
+"""
+Remplissage d'un portfolio à partir d'un CV existant
+
+Le texte du CV (fichier texte, Markdown ou texte extrait d'un PDF) est
+découpé en sections d'après leurs titres (EXPÉRIENCE PROFESSIONNELLE,
+FORMATION, COMPÉTENCES...), puis chaque section en éléments : une ligne
+« Intitulé - Organisme (2020 - Présent) » suivie de puces. Le résultat est
+présenté pour relecture avant d'être enregistré : les éléments retenus sont
+insérés en une seule transaction, un INSERT par table (executemany), au lieu
+d'un formulaire et d'un commit par élément.
+
+Le résultat de l'analyse est conservé dans le stockage (storage.py) sous
+resume-previews/, accessible à toutes les instances jusqu'à la confirmation ;
+les analyses abandonnées sont supprimées par une tâche de fond.
+"""
+
+import json
+import os
+import posixpath
+import re
+import secrets
+import tempfile
+import time
+import unicodedata
+from datetime import date, datetime
+from sqlalchemy import insert
+from jobs import enqueue, task
+from models import db, Experience, Education, Skill, Project
+from storage import get_storage, scratch_folder
+
+MAX_TEXT_LENGTH = 100_000
+
+PREVIEW_MAX_AGE = 24 * 3600  # secondes
+PREVIEW_PREFIX = 'resume-previews/'
+PREVIEW_PURGE_INTERVAL = 3600  # secondes entre deux tâches de nettoyage, par processus
+
+# Identifiant d'une analyse : <date de création (timestamp)>-<aléa>
+PREVIEW_TOKEN_RE = re.compile(r'(\d{1,12})-[A-Za-z0-9_-]{20,64}')
+
+_last_purge = None
+
+# Début du titre de section (sans accents, en minuscules) -> section
+SECTION_TITLES = (
+    ('experience', 'experiences'),
+    ('parcours professionnel', 'experiences'),
+    ('emplois', 'experiences'),
+    ('formation', 'education'),
+    ('education', 'education'),
+    ('etudes', 'education'),
+    ('diplomes', 'education'),
+    ('competence', 'skills'),
+    ('skills', 'skills'),
+    ('langue', 'languages'),
+    ('projet', 'projects'),
+    ('realisations', 'projects'),
+    ('informations personnelles', 'contact'),
+    ('coordonnees', 'contact'),
+    ('contact', 'contact'),
+    ('profil', 'bio'),
+    ('a propos', 'bio'),
+    ('resume', 'bio'),
+)
+
+# Libellé de coordonnée -> champ du portfolio
+CONTACT_FIELDS = (
+    ('email', 'email'),
+    ('e-mail', 'email'),
+    ('mail', 'email'),
+    ('telephone', 'phone'),
+    ('tel', 'phone'),
+    ('localisation', 'location'),
+    ('adresse', 'location'),
+    ('ville', 'location'),
+    ('linkedin', 'linkedin'),
+    ('github', 'github'),
+    ('site', 'website'),
+    ('website', 'website'),
+)
+
+# Niveaux rencontrés dans les CV -> niveaux proposés par SkillForm
+SKILL_LEVELS = {
+    'debutant': 'Débutant', 'notions': 'Débutant', 'scolaire': 'Débutant',
+    'intermediaire': 'Intermédiaire',
+    'avance': 'Avancé', 'confirme': 'Avancé', 'courant': 'Avancé', 'professionnel': 'Avancé',
+    'expert': 'Expert', 'natif': 'Expert', 'maternelle': 'Expert', 'bilingue': 'Expert',
+}
+
+SKILL_CATEGORIES = ('Technique', 'Langue', 'Soft Skills', 'Autre')
+
+BULLET_RE = re.compile(r'^\s*(?:[•●▪◦‣∙*·]|-(?=\s)|\d+[.)](?=\s))\s*')
+DETAILS_RE = re.compile(r'^(?P<title>.+?)\s*\((?P<details>[^()]*\d{4}[^()]*)\)\s*$')
+PERIOD_RE = re.compile(
+    r"(?:[^\W\d_]+\.?\s+)?(?P<start>(?:19|20)\d{2})(?:\s*(?:-|–|—|à|a)\s*(?:[^\W\d_]+\.?\s+)?(?P<end>(?:19|20)\d{2}|pr[ée]sent|aujourd'hui|en cours|actuel))?",
+    re.IGNORECASE
+)
+EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[a-z]{2,}', re.IGNORECASE)
+PHONE_RE = re.compile(r'\+?[\d\s().-]{8,20}')
+MARKDOWN_ESCAPE_RE = re.compile(r'\\([\\`*_\[\]#])')
+# Puces et icônes devant les coordonnées (« • », « 📧 ») : tout sauf lettres, chiffres et « + »
+CONTACT_PREFIX_RE = re.compile(r'^[^\w+]+')
+TITLE_SEPARATORS = (' - ', ' – ', ' — ', ' | ', ' @ ', ' chez ')
+
+
+class ResumeParseError(ValueError):
+    """CV illisible ou format non pris en charge"""
+
+
+def _normalize(value):
+    value = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(char for char in value if not unicodedata.combining(char)).strip()
+
+
+def extract_text(file):
+    """Texte d'un CV envoyé (.txt, .md ou .pdf)"""
+    filename = (file.filename or '').lower()
+    if filename.endswith('.pdf'):
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+        try:
+            reader = PdfReader(file.stream)
+            text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+        except (PdfReadError, ValueError) as e:
+            raise ResumeParseError(f"PDF illisible : {e}")
+        if not text.strip():
+            raise ResumeParseError("Aucun texte dans ce PDF (document scanné ?)")
+        return text[:MAX_TEXT_LENGTH]
+    if filename.endswith(('.txt', '.md')):
+        data = file.read(MAX_TEXT_LENGTH * 4)
+        for encoding in ('utf-8-sig', 'cp1252'):
+            try:
+                return data.decode(encoding)[:MAX_TEXT_LENGTH]
+            except UnicodeDecodeError:
+                continue
+    raise ResumeParseError("Formats acceptés : PDF, texte (.txt) ou Markdown (.md)")
+
+
+def _section_of(line):
+    """Section désignée par une ligne de titre, '' pour une section ignorée, None si ce n'est pas un titre"""
+    markdown = line.startswith('## ')
+    if markdown:
+        line = line[3:]
+    elif BULLET_RE.match(line) or DETAILS_RE.match(line) or not (
+            line == line.upper() and any(char.isalpha() for char in line) and len(line) <= 60):
+        return None
+    key = _normalize(line.strip(' :#'))
+    for prefix, section in SECTION_TITLES:
+        if key.startswith(prefix):
+            return section
+    # Sigle seul (« SQL », « AWS ») : contenu de la section, pas un titre
+    return '' if markdown or ' ' in key or len(key) > 5 else None
+
+
+def _split_sections(text):
+    """Lignes de chaque section ('' pour une ligne vide, qui sépare les éléments)"""
+    sections = {}
+    current = None
+    for raw_line in text.splitlines():
+        # Caractères échappés par le Markdown
+        line = MARKDOWN_ESCAPE_RE.sub(r'\1', raw_line.strip())
+        section = _section_of(line) if line else None
+        if section is not None:
+            current = section
+            sections.setdefault(current, [])
+        elif current:
+            sections[current].append(line)
+    return sections
+
+
+def _entries(lines):
+    """Éléments d'une section : [(intitulé, [lignes de description])]"""
+    entries = []
+    in_block = False
+    for line in lines:
+        bullet = BULLET_RE.match(line)
+        if not line:
+            in_block = False
+        elif line.startswith('### '):
+            entries.append((line[4:].strip(), []))
+            in_block = True
+        elif bullet and entries:
+            entries[-1][1].append(line[bullet.end():].strip())
+        elif in_block and entries[-1][1] and line[0].islower():
+            # Suite d'une ligne coupée par l'extraction du PDF
+            entries[-1][1][-1] += ' ' + line
+        elif in_block and not entries[-1][1] and not DETAILS_RE.match(entries[-1][0]) \
+                and PERIOD_RE.fullmatch(line.strip('() ')):
+            # Dates sur la ligne suivant l'intitulé
+            entries[-1] = (f'{entries[-1][0]} ({line.strip("() ")})', [])
+        elif in_block and not DETAILS_RE.match(line):
+            # Description sans puces, jusqu'à la prochaine ligne vide
+            entries[-1][1].append(line)
+        else:
+            entries.append((line[bullet.end():].strip() if bullet else line, []))
+            in_block = True
+    return entries
+
+
+def _title_parts(title):
+    """(intitulé, organisme, lieu, année de début, année de fin, en cours)"""
+    location, start, end, current = '', None, None, False
+    match = DETAILS_RE.match(title)
+    if match:
+        title = match.group('title').strip()
+        details = [part.strip() for part in match.group('details').split(',')]
+        period = PERIOD_RE.search(details[-1])
+        if period:
+            start = int(period.group('start'))
+            end_value = period.group('end')
+            if end_value is None:
+                end = start
+            elif end_value.isdigit():
+                end = int(end_value)
+            else:
+                current = True
+            location = ', '.join(details[:-1])
+    for separator in TITLE_SEPARATORS:
+        if separator in title:
+            name, organisation = title.split(separator, 1)
+            return name.strip(), organisation.strip(), location, start, end, current
+    return title.strip(), '', location, start, end, current
+
+
+def _timeline(lines):
+    items = []
+    for title, bullets in _entries(lines):
+        name, organisation, location, start, end, current = _title_parts(title)
+        items.append({
+            'title': name[:200],
+            'organisation': organisation[:200],
+            'location': location[:100],
+            'start_year': start,
+            'end_year': end,
+            'current': current,
+            'description': '\n'.join(bullets),
+        })
+    return items
+
+
+def _skill_level(value):
+    percent = re.fullmatch(r'(\d{1,3})\s*%', value.strip())
+    if percent:
+        value = int(percent.group(1))
+        return 'Expert' if value >= 85 else 'Avancé' if value >= 70 else \
+            'Intermédiaire' if value >= 40 else 'Débutant'
+    return SKILL_LEVELS.get(_normalize(value))
+
+
+def _skill(text, category):
+    match = re.match(r'^(.+?)\s*\(([^()]+)\)$', text) or re.match(r'^(.+?)\s+[-–:]\s+(.+)$', text)
+    level = _skill_level(match.group(2)) if match else None
+    return {
+        # Parenthèse qui n'est pas un niveau : elle fait partie du nom
+        'name': (match.group(1) if level else text).strip()[:100],
+        'level': level or 'Intermédiaire',
+        'category': category,
+    }
+
+
+def _skill_category(label, default):
+    key = _normalize(label)
+    for category in SKILL_CATEGORIES:
+        if key == _normalize(category):
+            return category
+    if 'langue' in key and 'programmation' not in key:
+        return 'Langue'
+    if 'soft' in key or 'savoir' in key or 'qualite' in key or 'humain' in key:
+        return 'Soft Skills'
+    return default
+
+
+def _skills(lines, default_category):
+    skills = []
+    category = default_category
+    for line in filter(None, lines):
+        bullet = BULLET_RE.match(line)
+        text = line[bullet.end():].strip() if bullet else line
+        if not bullet and text.endswith(':'):
+            category = _skill_category(text[:-1], default_category)
+            continue
+        if not bullet and ':' in text:
+            # « Langages : Python, JavaScript »
+            label, text = text.split(':', 1)
+            category = _skill_category(label, default_category)
+        names = [part.strip() for part in re.split(r',(?![^()]*\))', text) if part.strip()]
+        skills.extend(_skill(name, category) for name in names)
+    return skills
+
+
+def _projects(lines):
+    projects = []
+    for title, bullets in _entries(lines):
+        name, _, _, start, _, _ = _title_parts(title)
+        project = {'title': name[:200], 'year': start, 'technologies': [], 'github_url': '', 'demo_url': ''}
+        description = []
+        for bullet in bullets:
+            label, _, value = bullet.partition(':')
+            key = _normalize(label)
+            if value and key in ('technologies', 'stack', 'outils'):
+                project['technologies'] = [tech.strip() for tech in value.split(',') if tech.strip()]
+            elif value and key == 'github':
+                project['github_url'] = value.strip()[:200]
+            elif value and key in ('demo', 'site', 'lien'):
+                project['demo_url'] = value.strip()[:200]
+            else:
+                description.append(bullet)
+        project['description'] = '\n'.join(description) or name
+        projects.append(project)
+    return projects
+
+
+def _contact_field(label, value):
+    key = _normalize(label)
+    for prefix, field in CONTACT_FIELDS:
+        if key.startswith(prefix):
+            return field
+    # Sans libellé (ou avec une icône) : d'après la forme de la valeur
+    if EMAIL_RE.fullmatch(value):
+        return 'email'
+    if 'linkedin.com' in value:
+        return 'linkedin'
+    if 'github.com' in value:
+        return 'github'
+    if value.startswith(('http://', 'https://', 'www.')):
+        return 'website'
+    if PHONE_RE.fullmatch(value):
+        return 'phone'
+    return 'location'
+
+
+def _contact(lines):
+    contact = {}
+    for line in filter(None, lines):
+        line = CONTACT_PREFIX_RE.sub('', line)
+        label, separator, value = line.partition(':')
+        # « https://... » : les deux-points font partie de la valeur
+        if not separator or _normalize(label) in ('http', 'https') or ' ' in label.strip() and len(label) > 20:
+            label, value = '', line
+        value = value.strip()
+        field = _contact_field(label, value)
+        if value and field not in contact:
+            contact[field] = value[:200]
+    return contact
+
+
+def parse_resume(text):
+    """Découper le texte d'un CV en éléments de portfolio (dictionnaire sérialisable en JSON)"""
+    sections = _split_sections(text)
+    skills = _skills(sections.get('skills', []), 'Technique') + _skills(sections.get('languages', []), 'Langue')
+    return {
+        'contact': _contact(sections.get('contact', [])),
+        'bio': '\n'.join(filter(None, sections.get('bio', []))),
+        'experiences': _timeline(sections.get('experiences', [])),
+        'education': _timeline(sections.get('education', [])),
+        'skills': skills,
+        'projects': _projects(sections.get('projects', [])),
+    }
+
+
+# --- Relecture avant enregistrement ------------------------------------
+
+def _preview_key(token):
+    match = PREVIEW_TOKEN_RE.fullmatch(token or '')
+    if match is None or time.time() - int(match.group(1)) > PREVIEW_MAX_AGE:
+        return None
+    return f'{PREVIEW_PREFIX}{token}.json'
+
+
+def store_preview(data):
+    """Conserver le résultat de l'analyse jusqu'à confirmation ; renvoie son identifiant"""
+    token = f'{int(time.time())}-{secrets.token_urlsafe(24)}'
+    fd, path = tempfile.mkstemp(dir=scratch_folder(), prefix='.resume-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        get_storage().save_file(path, _preview_key(token), content_type='application/json', immutable=False)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    _schedule_purge()
+    return token
+
+
+def load_preview(token):
+    """Résultat d'analyse conservé, None s'il n'existe plus ou a expiré"""
+    key = _preview_key(token)
+    if key is None:
+        return None
+    raw = get_storage().read(key)
+    try:
+        return json.loads(raw) if raw is not None else None
+    except ValueError:
+        return None
+
+
+def discard_preview(token):
+    if PREVIEW_TOKEN_RE.fullmatch(token or ''):
+        get_storage().delete(f'{PREVIEW_PREFIX}{token}.json')
+
+
+def _schedule_purge():
+    global _last_purge
+    # Au plus une tâche de nettoyage par intervalle et par processus
+    now = time.monotonic()
+    if _last_purge is None or now - _last_purge > PREVIEW_PURGE_INTERVAL:
+        _last_purge = now
+        enqueue('cv_parser.purge_previews')
+
+
+@task('cv_parser.purge_previews', max_attempts=1)
+def purge_previews():
+    """Supprimer les analyses jamais confirmées ni annulées"""
+    storage = get_storage()
+    for key in storage.list_keys(PREVIEW_PREFIX):
+        match = PREVIEW_TOKEN_RE.fullmatch(posixpath.splitext(posixpath.basename(key))[0])
+        if match and time.time() - int(match.group(1)) > PREVIEW_MAX_AGE:
+            storage.delete(key)
+
+
+def _year(value, default=None):
+    return date(value, 1, 1) if value else default
+
+
+def _item_key(section, item):
+    if section in ('experiences', 'education'):
+        return (_normalize(item['title']), _normalize(item['organisation']))
+    return (_normalize(item.get('name') or item.get('title')),)
+
+
+def mark_duplicates(portfolio, data):
+    """Signaler (duplicate) les éléments déjà présents dans le portfolio"""
+    existing = {
+        'experiences': {(_normalize(exp.title), _normalize(exp.company)) for exp in portfolio.experiences},
+        'education': {(_normalize(edu.degree), _normalize(edu.institution)) for edu in portfolio.education},
+        'skills': {(_normalize(skill.name),) for skill in portfolio.skills},
+        'projects': {(_normalize(project.title),) for project in portfolio.projects},
+    }
+    for section, keys in existing.items():
+        for item in data.get(section, []):
+            item['duplicate'] = _item_key(section, item) in keys
+    return data
+
+
+def import_resume(portfolio, data, selection):
+    """Enregistrer les éléments retenus en une transaction ; renvoie le nombre d'éléments par section"""
+    now = datetime.utcnow()
+    this_year = date(now.year, 1, 1)
+    rows = {}
+
+    def selected(section):
+        items = data.get(section, [])
+        indexes = sorted({index for index in selection.get(section, []) if 0 <= index < len(items)})
+        # Ajoutés à la suite des éléments existants
+        first = getattr(portfolio, section).count()
+        return [(first + offset, items[index]) for offset, index in enumerate(indexes)]
+
+    for section, model in (('experiences', Experience), ('education', Education)):
+        rows[model] = []
+        for order_index, item in selected(section):
+            row = {
+                'portfolio_id': portfolio.id,
+                'location': item['location'] or None,
+                'start_date': _year(item['start_year'], this_year),
+                'end_date': None if item['current'] else _year(item['end_year']),
+                'current': item['current'],
+                'description': item['description'] or ('' if model is Experience else None),
+                'order_index': order_index,
+                'created_at': now,
+                'updated_at': now,
+            }
+            if model is Experience:
+                row.update(title=item['title'], company=item['organisation'])
+            else:
+                row.update(degree=item['title'], institution=item['organisation'])
+            rows[model].append(row)
+
+    rows[Skill] = [{
+        'portfolio_id': portfolio.id,
+        'name': item['name'],
+        'level': item['level'],
+        'category': item['category'],
+        'order_index': order_index,
+        'created_at': now,
+        'updated_at': now,
+    } for order_index, item in selected('skills')]
+
+    rows[Project] = [{
+        'portfolio_id': portfolio.id,
+        'title': item['title'],
+        'description': item['description'],
+        'technologies': json.dumps(item['technologies']),
+        'github_url': item['github_url'] or None,
+        'demo_url': item['demo_url'] or None,
+        'order_index': order_index,
+        'created_at': datetime(item['year'], 1, 1) if item['year'] else now,
+        'updated_at': now,
+    } for order_index, item in selected('projects')]
+
+    # Coordonnées et présentation : seulement les champs encore vides
+    if selection.get('contact'):
+        for field, value in data.get('contact', {}).items():
+            if field != 'email' and not getattr(portfolio, field):
+                setattr(portfolio, field, value)
+    if selection.get('bio') and data.get('bio') and not portfolio.bio:
+        portfolio.bio = data['bio']
+
+    # Un INSERT par table (executemany), dans une seule transaction. Ces lignes ne
+    # passent pas par session.new : modifier le portfolio publie une nouvelle
+    # version et le réindexe pour la recherche
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.session.execute(insert(model.__table__), model_rows)
+    portfolio.updated_at = now
+    db.session.commit()
+    return {section: len(rows[model]) for section, model in
+            (('experiences', Experience), ('education', Education), ('skills', Skill), ('projects', Project))}
@@ -0,0 +1,223 @@
+"""
+Connexions à la base : taille des pools et routage des lectures vers un réplica
+
+Chaque processus (worker gunicorn) a son propre pool : DB_POOL_SIZE connexions
+permanentes et DB_MAX_OVERFLOW temporaires. Si DB_MAX_CONNECTIONS est défini
+(plafond du serveur), le pool est réduit pour que WEB_CONCURRENCY workers ne le
+dépassent pas ; les threads de fond (compteur de vues, statistiques, imports)
+puisent dans le même pool. DB_POOL_SIZE=0 désactive le pool local (une
+connexion par transaction, utile derrière PgBouncer).
+
+Avec DB_PGBOUNCER (PgBouncer en mode transaction), aucune requête préparée
+côté serveur n'est utilisée : une transaction peut changer de connexion.
+
+Si DATABASE_REPLICA_URL est défini, les SELECT des requêtes GET/HEAD des
+endpoints de DATABASE_REPLICA_ENDPOINTS (blueprint public par défaut :
+pages, recherche, API) sont envoyés au réplica. Le reste (écritures,
+tableau de bord, threads de fond) va au primaire, de même que :
+- toute la requête si le réplica est injoignable ou en retard de plus de
+  DATABASE_REPLICA_MAX_LAG secondes (vérifié au plus toutes les
+  DATABASE_REPLICA_CHECK_INTERVAL secondes par processus) ;
+- les lectures d'un visiteur pendant DATABASE_REPLICA_STICKY secondes après
+  une écriture de sa part (cookie), pour qu'il voie ses modifications.
+"""
+
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import Select, TextClause
+import flask_sqlalchemy.session
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary_until'
+
+# Retard du réplica PostgreSQL en secondes (0 s'il a rejoué tout ce qu'il a reçu)
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+PING_QUERY = text("SELECT 0")
+
+
+def engine_options(config, url):
+    """Options du moteur SQLAlchemy (pool, PgBouncer) pour une URL"""
+    url = str(url)
+    if url.startswith('sqlite'):
+        # Pools propres à SQLite choisis par Flask-SQLAlchemy
+        return {}
+
+    pool_size = config.get('DB_POOL_SIZE', 5)
+    if not pool_size:
+        options = {'poolclass': NullPool}
+    else:
+        max_overflow = config.get('DB_MAX_OVERFLOW', 5)
+        max_connections = config.get('DB_MAX_CONNECTIONS')
+        if max_connections:
+            workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+            budget = max(1, max_connections // workers)
+            if pool_size + max_overflow > budget:
+                pool_size = min(pool_size, budget)
+                max_overflow = budget - pool_size
+                logger.warning(f"Pool réduit à {pool_size}+{max_overflow} connexions par worker "
+                               f"({max_connections} au plus pour {workers} workers)")
+        options = {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+        }
+
+    driver = make_url(url).get_dialect().driver
+    if config.get('DB_PGBOUNCER') and driver == 'psycopg':
+        # psycopg 3 prépare les requêtes répétées ; psycopg2 ne le fait jamais
+        options['connect_args'] = {'prepare_threshold': None}
+    elif config.get('DB_PGBOUNCER') and driver == 'asyncpg':
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    return options
+
+
+def configure_engines(app):
+    """Compléter la configuration SQLAlchemy de l'application (avant db.init_app)"""
+    config = app.config
+    options = engine_options(config, config['SQLALCHEMY_DATABASE_URI'])
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        # Les options générales ne s'appliquent pas aux binds : les reprendre
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA] = {'url': replica_url, **engine_options(config, replica_url)}
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+class ReplicaState:
+    """Disponibilité du réplica vue par ce processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.available = True
+        self.lag = 0.0
+        self.checked_at = 0.0
+
+    def is_usable(self, engine):
+        interval = current_app.config.get('DATABASE_REPLICA_CHECK_INTERVAL', 10)
+        # Un seul thread vérifie, les autres gardent le dernier état connu
+        if time.monotonic() - self.checked_at >= interval and self._lock.acquire(blocking=False):
+            try:
+                self.check(engine)
+            finally:
+                self._lock.release()
+        return self.available
+
+    def check(self, engine):
+        max_lag = current_app.config.get('DATABASE_REPLICA_MAX_LAG', 5)
+        try:
+            with engine.connect() as conn:
+                query = POSTGRES_LAG_QUERY if engine.dialect.name == 'postgresql' else PING_QUERY
+                self.lag = float(conn.execute(query).scalar() or 0)
+            available = self.lag <= max_lag
+            if not available:
+                logger.warning(f"Réplica en retard de {self.lag:.1f}s : lectures sur le primaire")
+        except DBAPIError as e:
+            available = False
+            logger.warning(f"Réplica injoignable, lectures sur le primaire : {e}")
+        if available and not self.available:
+            logger.info("Réplica de nouveau utilisé")
+        self.available = available
+        self.checked_at = time.monotonic()
+
+    def mark_down(self):
+        self.available = False
+        self.checked_at = time.monotonic()
+
+
+def get_replica_state():
+    state = current_app.extensions.get('db_replica')
+    if state is None:
+        state = ReplicaState()
+        current_app.extensions['db_replica'] = state
+    return state
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return True
+    return isinstance(clause, TextClause) and clause.text.lstrip()[:6].upper() == 'SELECT'
+
+
+class RoutingSession(flask_sqlalchemy.session.Session):
+    """Session qui envoie les lectures des requêtes en lecture seule au réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or (clause is not None and not _is_read(clause)):
+                # Écriture (flush ORM ou instruction Core) : la suite de la requête lit sur le primaire
+                g.db_wrote = True
+            elif g.get('db_use_replica') and not g.get('db_wrote') and clause is not None:
+                engine = self._db.engines.get(REPLICA)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_session():
+    """Session des lectures publiques : celle fournie par le service ASGI (asgi.py), sinon db.session"""
+    session = g.get('read_session')
+    if session is None:
+        from extensions import db
+        session = db.session
+    return session
+
+
+def _read_only_endpoint(endpoint):
+    endpoints = current_app.config.get('DATABASE_REPLICA_ENDPOINTS', ('public',))
+    return endpoint is not None and (endpoint in endpoints or endpoint.split('.', 1)[0] in endpoints)
+
+
+def choose_database():
+    """Avant chaque requête : lire sur le réplica si possible"""
+    if REPLICA not in current_app.config.get('SQLALCHEMY_BINDS', {}) or g.get('read_session') is not None:
+        return
+    if request.method not in ('GET', 'HEAD') or not _read_only_endpoint(request.endpoint):
+        return
+    try:
+        sticky = float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    if not sticky:
+        from extensions import db
+        g.db_use_replica = get_replica_state().is_usable(db.engines[REPLICA])
+
+
+def keep_writer_on_primary(response):
+    """Après une écriture hors lecture seule : lire sur le primaire quelques secondes"""
+    sticky = current_app.config.get('DATABASE_REPLICA_STICKY', 10)
+    if g.get('db_wrote') and not g.get('db_use_replica') and sticky \
+            and REPLICA in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        response.set_cookie(STICKY_COOKIE, f'{time.time() + sticky:.0f}', max_age=int(sticky), httponly=True,
+                            samesite='Lax', secure=current_app.config.get('SESSION_COOKIE_SECURE', False))
+    return response
+
+
+def _replica_error(context):
+    # Connexion perdue ou refusée : primaire jusqu'à la prochaine vérification
+    if (context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError)) and has_app_context():
+        get_replica_state().mark_down()
+
+
+def init_app(app, db):
+    """Brancher le routage sur l'application (après db.init_app)"""
+    app.before_request(choose_database)
+    app.after_request(keep_writer_on_primary)
+    with app.app_context():
+        if REPLICA in db.engines:
+            event.listen(db.engines[REPLICA], 'handle_error', _replica_error)
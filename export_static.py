@@ -0,0 +1,153 @@
+"""
+Export statique des portfolios publics
+
+Pré-rend pour chaque portfolio public la page, la version embarquée et le JSON
+de l'API dans une arborescence servie directement par nginx ou un CDN :
+
+    <dossier>/p/<public_url>/index.html
+    <dossier>/p/<public_url>/embed/index.html
+    <dossier>/p/<public_url>/api/index.json (+ .gz, + .br si brotli est installé)
+
+L'export est incrémental : manifest.json garde la version de chaque portfolio
+(voir http_cache) et seuls les portfolios modifiés depuis le dernier export
+sont rendus, en parallèle dans un pool de processus.
+
+Utilisation : flask export-static [--output DIR] [--workers N] [--full] [--interval S]
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+MANIFEST = 'manifest.json'
+
+_worker_app = None
+
+
+def _write_atomic(path, data):
+    """Écrire un fichier sans jamais exposer une version partielle"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(settings, template_folder):
+    """Initialisation d'un processus du pool, avec la configuration et les gabarits de l'application appelante"""
+    global _worker_app
+    from app import create_app
+    from models import db
+    _worker_app = app = create_app(settings)
+    app.template_folder = template_folder
+    with app.app_context():
+        # Ne pas réutiliser les connexions héritées du processus parent
+        db.engine.dispose(close=False)
+
+
+def render_portfolio_files(public_url, output):
+    """Rendre les fichiers d'un portfolio ; renvoie la liste des chemins relatifs écrits"""
+    from page_cache import build_json_entry
+    from public import portfolio_payload, render_portfolio_page
+    from repository import load_portfolio
+
+    app = _worker_app or current_app._get_current_object()
+    with app.test_request_context(f'/p/{public_url}'):
+        portfolio = load_portfolio(public_url=public_url, public_only=True)
+        if portfolio is None:
+            return []
+        entry = build_json_entry(portfolio.id, portfolio_payload(portfolio))
+        files = {
+            f'p/{public_url}/index.html': render_portfolio_page(portfolio).encode('utf-8'),
+            f'p/{public_url}/embed/index.html': render_portfolio_page(portfolio, 'public/embed.html').encode('utf-8'),
+            f'p/{public_url}/api/index.json': entry['body'],
+            f'p/{public_url}/api/index.json.gz': entry['gzip'],
+        }
+        if 'br' in entry:
+            files[f'p/{public_url}/api/index.json.br'] = entry['br']
+
+    for relative_path, data in files.items():
+        _write_atomic(os.path.join(output, relative_path), data)
+    return sorted(files)
+
+
+def _load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def export_portfolios(output, workers=None, full=False):
+    """Exporter les portfolios modifiés ; renvoie (rendus, supprimés)"""
+    from http_cache import all_portfolio_validators
+
+    manifest = {} if full else _load_manifest(output)
+    versions = {url: validator.etag for url, validator in all_portfolio_validators().items()}
+
+    stale = sorted(url for url, etag in versions.items() if manifest.get(url) != etag)
+    removed = sorted(url for url in manifest if url not in versions)
+
+    # Portfolios supprimés ou devenus privés
+    for public_url in removed:
+        shutil.rmtree(os.path.join(output, 'p', public_url), ignore_errors=True)
+        del manifest[public_url]
+
+    rendered = []
+    if stale:
+        if workers == 1 or len(stale) == 1:
+            for public_url in stale:
+                # Comme dans le pool : une erreur n'interrompt pas l'export des autres
+                try:
+                    render_portfolio_files(public_url, output)
+                except Exception as e:
+                    current_app.logger.error(f"Erreur export {public_url}: {e}")
+                    continue
+                rendered.append(public_url)
+        else:
+            # Les processus reprennent la configuration de l'application qui lance l'export
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(dict(current_app.config), current_app.template_folder)) as pool:
+                futures = {pool.submit(render_portfolio_files, url, output): url for url in stale}
+                for future in as_completed(futures):
+                    public_url = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"Erreur export {public_url}: {e}")
+                        continue
+                    rendered.append(public_url)
+
+    for public_url in rendered:
+        manifest[public_url] = versions[public_url]
+    _write_atomic(os.path.join(output, MANIFEST),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return rendered, removed
+
+
+@click.command('export-static')
+@click.option('--output', default=None, help="Dossier de sortie (STATIC_EXPORT_FOLDER par défaut)")
+@click.option('--workers', default=None, type=int, help="Nombre de processus de rendu")
+@click.option('--full', is_flag=True, help="Tout reconstruire, sans tenir compte du manifeste")
+@click.option('--interval', default=0, type=float, help="Relancer l'export toutes les N secondes")
+@with_appcontext
+def export_static_command(output, workers, full, interval):
+    """Pré-rendre les portfolios publics en fichiers statiques"""
+    output = output or current_app.config.get('STATIC_EXPORT_FOLDER', 'static_export')
+    while True:
+        started = time.monotonic()
+        rendered, removed = export_portfolios(output, workers=workers, full=full)
+        click.echo(f"✅ {len(rendered)} portfolio(s) exporté(s), {len(removed)} supprimé(s) "
+                   f"en {time.monotonic() - started:.1f}s -> {output}")
+        if not interval:
+            break
+        full = False
+        time.sleep(interval)
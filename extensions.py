@@ -0,0 +1,35 @@
+"""
+Extensions Flask partagées, créées sans application
+
+Elles sont liées à l'application dans create_app (app.py). Les extensions
+coûteuses à importer (Flask-Mail, Flask-Migrate) ne sont chargées qu'au
+premier usage ou par la ligne de commande flask.
+"""
+
+from flask import current_app
+from flask_cors import CORS
+from flask_login import LoginManager
+from flask_sqlalchemy import SQLAlchemy
+
+from database import RoutingSession
+
+# Session à routage lecture/écriture (réplica optionnel, voir database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+login_manager = LoginManager()
+cors = CORS()
+
+
+def get_mail():
+    """Récupérer Flask-Mail pour l'application courante (initialisé au premier envoi)"""
+    mail = current_app.extensions.get('mail')
+    if mail is None:
+        from flask_mail import Mail
+        Mail().init_app(current_app._get_current_object())
+        mail = current_app.extensions['mail']
+    return mail
+
+
+def init_migrate(app):
+    """Flask-Migrate (commandes flask db), seulement depuis la ligne de commande"""
+    from flask_migrate import Migrate
+    Migrate(app, db)
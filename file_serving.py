@@ -0,0 +1,166 @@
+"""
+Service des fichiers envoyés (CV, images)
+
+Les fichiers, confiés au stockage (storage.py), sont nommés d'après
+l'empreinte de leur contenu : une URL
+/uploads/<type>/<empreinte>... ne change jamais de contenu et peut être mise
+en cache sans revalidation. Selon FILE_SERVING_MODE, l'envoi est délégué au
+serveur frontal (X-Accel-Redirect pour nginx, X-Sendfile pour Apache ou
+lighttpd) ou fait par l'application : requêtes conditionnelles, une plage
+d'octets (Range/If-Range) et, sous gunicorn, envoi par os.sendfile via
+wsgi.file_wrapper, y compris pour une plage.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from datetime import datetime
+from urllib.parse import quote
+from flask import Blueprint, abort, current_app, request, Response
+from http_cache import apply_validators, is_fresh, not_modified
+from storage import get_storage, scratch_folder
+
+files_bp = Blueprint('files', __name__)
+
+# Préfixe d'empreinte des noms de fichiers adressés par leur contenu
+CONTENT_KEY_RE = re.compile(r'^([0-9a-f]{24})[.-]')
+
+BLOCK_SIZE = 64 * 1024
+
+
+def content_key(filename):
+    """Empreinte contenue dans un nom de fichier, ou None pour un ancien nom"""
+    match = CONTENT_KEY_RE.match(filename or '')
+    return match.group(1) if match else None
+
+
+def hash_file(path):
+    """Empreinte SHA-256 (24 caractères) du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()[:24]
+
+
+def store_content_addressed(source_path, kind, extension):
+    """Confier un fichier complet au stockage sous <type>/<empreinte>.<ext> ; renvoie le nom"""
+    filename = f'{hash_file(source_path)}.{extension}'
+    get_storage().save_file(source_path, f'{kind}/{filename}')
+    return filename
+
+
+def save_upload(file, kind, extension):
+    """Enregistrer un fichier envoyé sous un nom adressé par son contenu"""
+    fd, tmp_path = tempfile.mkstemp(dir=scratch_folder(), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            file.save(f)
+        return store_content_addressed(tmp_path, kind, extension)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _if_range_matches(etag, last_modified):
+    # Sans If-Range, la plage s'applique ; sinon seulement si la version est la même
+    if_range = request.if_range
+    if not if_range.etag and not if_range.date:
+        return True
+    if if_range.etag:
+        return if_range.etag == etag
+    return last_modified is not None and last_modified.replace(microsecond=0) <= if_range.date.replace(tzinfo=None)
+
+
+def _requested_range(size, etag, last_modified):
+    """(début, fin) de la plage demandée, None pour le fichier entier, False si insatisfaisable"""
+    requested = request.range
+    if requested is None or requested.units != 'bytes' or len(requested.ranges) != 1:
+        # Plusieurs plages (multipart/byteranges) : on envoie le fichier entier
+        return None
+    if not _if_range_matches(etag, last_modified):
+        return None
+    bounds = requested.range_for_length(size)
+    return bounds if bounds is not None else False
+
+
+def _iter_file(f, length):
+    try:
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+def _file_body(f, length, partial):
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # gunicorn envoie Content-Length octets depuis la position courante par sendfile ;
+    # les autres file_wrapper lisent jusqu'à la fin du fichier
+    if file_wrapper is not None and (not partial or type(file_wrapper).__module__.startswith('gunicorn')):
+        return file_wrapper(f, BLOCK_SIZE)
+    return _iter_file(f, length)
+
+
+def serve_file(path, mimetype=None, download_name=None, as_attachment=False,
+               etag=None, last_modified=None, policy='cv'):
+    """Réponse pour un fichier envoyé, avec validateurs, plages et délégation au frontal"""
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = etag or f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    last_modified = last_modified or datetime.utcfromtimestamp(stat.st_mtime)
+    if is_fresh(etag, last_modified, weak=False):
+        return not_modified(etag, last_modified, policy, weak=False)
+
+    mode = current_app.config.get('FILE_SERVING_MODE', 'python')
+    if mode == 'x-accel':
+        # nginx sert le fichier (et gère Range) depuis une location internal
+        upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+        relative_path = os.path.relpath(os.path.abspath(path), upload_folder).replace(os.sep, '/')
+        response = Response(mimetype=mimetype)
+        prefix = current_app.config.get('FILE_SERVING_ACCEL_PREFIX', '/_uploads/')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path)
+    elif mode == 'x-sendfile':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        size = stat.st_size
+        bounds = _requested_range(size, etag, last_modified)
+        if bounds is False:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, stop = bounds or (0, size)
+        f = open(path, 'rb')
+        f.seek(start)
+        response = Response(_file_body(f, stop - start, bounds is not None), mimetype=mimetype,
+                            status=206 if bounds else 200, direct_passthrough=True)
+        response.content_length = stop - start
+        if bounds:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.headers['Accept-Ranges'] = 'bytes'
+
+    if download_name or as_attachment:
+        response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                             filename=download_name or os.path.basename(path))
+    return apply_validators(response, etag, last_modified, policy, weak=False)
+
+
+@files_bp.route('/uploads/<any(cv, images):kind>/<filename>')
+def uploaded_file(kind, filename):
+    """Fichier envoyé ; mis en cache sans limite quand son nom contient son empreinte"""
+    if filename.startswith('.'):
+        abort(404)
+    key = f'{kind}/{filename}'
+    if content_key(filename) is None:
+        return get_storage().serve(key, policy='cv')
+    return get_storage().serve(key, etag=filename, policy='immutable')
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, DateField, FileField, HiddenField
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, DateField, FileField, MultipleFileField, HiddenField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, URL, ValidationError
 from models import User
 
@@ -75,6 +75,7 @@ class ProjectForm(FlaskForm):
     github_url = StringField('Lien GitHub', validators=[Optional(), URL(), Length(max=200)])
     demo_url = StringField('Lien de démonstration', validators=[Optional(), URL(), Length(max=200)])
     featured = BooleanField('Projet mis en avant')
+    images = MultipleFileField('Images du projet')
     submit = SubmitField('Sauvegarder')
 
 class ExperienceForm(FlaskForm):
@@ -129,6 +130,21 @@ class CVImportForm(FlaskForm):
                          render_kw={'placeholder': 'CV_Mon_Nom.pdf'})
     submit = SubmitField('Importer le CV')
 
+class ResumeImportForm(FlaskForm):
+    """Formulaire de remplissage du portfolio à partir d'un CV"""
+    resume_file = FileField('CV (PDF, texte ou Markdown)')
+    resume_text = TextAreaField('Ou collez le texte de votre CV', validators=[Length(max=100000)])
+    submit = SubmitField('Analyser le CV')
+
+    def validate_resume_text(self, field):
+        if not field.data and not (self.resume_file.data and getattr(self.resume_file.data, 'filename', None)):
+            raise ValidationError('Choisissez un fichier ou collez le texte de votre CV.')
+
+class ResumeConfirmForm(FlaskForm):
+    """Confirmation des éléments extraits d'un CV"""
+    submit = SubmitField('Importer la sélection')
+    cancel = SubmitField('Annuler')
+
 class ThemeForm(FlaskForm):
     """Formulaire de personnalisation du thème"""
     primary_color = StringField('Couleur principale', validators=[DataRequired()])
@@ -0,0 +1,60 @@
+"""
+Configuration gunicorn (chargée automatiquement depuis le dossier courant)
+
+Avec preload_app, l'application est créée une seule fois dans le processus
+maître puis partagée par copie à l'écriture avec les workers : le démarrage
+d'un worker est immédiat et les pages mémoire du code restent communes.
+create_app n'ouvre aucune connexion et les pools (images, CV, compteurs) sont
+créés au premier usage dans chaque worker ; les connexions éventuellement
+ouvertes par le maître sont abandonnées après le fork.
+"""
+
+import gc
+import os
+import time
+
+wsgi_app = 'wsgi:app'
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ['true', 'on', '1']
+# bind et workers : PORT et WEB_CONCURRENCY sont lus par gunicorn lui-même
+
+_started = time.perf_counter()
+
+
+def _memory_kb(pid='self'):
+    """RSS et PSS (part des pages partagées) d'un processus, en Ko (Linux)"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    values[name.lower()] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def when_ready(server):
+    server.log.info(f"Application chargée en {time.perf_counter() - _started:.2f}s, "
+                    f"mémoire du maître {_memory_kb()}")
+    if preload_app:
+        # Objets créés au chargement exclus du ramasse-miettes : ses parcours ne
+        # touchent plus leurs pages, qui restent partagées avec les workers
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    if preload_app:
+        from extensions import db
+        from wsgi import app
+        with app.app_context():
+            # Ne pas réutiliser les connexions héritées du maître (primaire et réplica)
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Sans preload_app, inclut la création de l'application dans le worker
+    worker.log.info(f"Worker {worker.pid} prêt en {time.perf_counter() - worker.forked_at:.2f}s, "
+                    f"mémoire {_memory_kb()}")
@@ -0,0 +1,128 @@
+"""
+Validateurs HTTP (ETag, Last-Modified) et politiques Cache-Control
+
+La version d'un portfolio est dérivée en une seule requête de son updated_at,
+de celui de son utilisateur et, pour chaque section, du nombre d'éléments et
+de leur updated_at le plus récent (le nombre couvre les suppressions). Elle
+permet de répondre 304 avant de charger les sections ou de rendre un template.
+"""
+
+import hashlib
+from collections import namedtuple
+from datetime import timezone
+from flask import current_app, request, Response
+from sqlalchemy import func, select
+from models import db, User, Portfolio, Project, Experience, Education, Skill
+from database import read_session
+
+# Politiques par défaut, surchargeables via HTTP_CACHE_CONTROL
+DEFAULT_POLICIES = {
+    'portfolio': 'public, max-age=60, stale-while-revalidate=600',
+    'embed': 'public, max-age=300, stale-while-revalidate=3600',
+    'api': 'public, max-age=30, stale-while-revalidate=300',
+    'cv': 'public, max-age=3600, stale-while-revalidate=86400',
+    'private': 'private, no-cache',
+    # Fichiers dont le nom contient l'empreinte du contenu
+    'immutable': 'public, max-age=31536000, immutable',
+}
+
+Validator = namedtuple('Validator', 'portfolio_id etag last_modified')
+
+
+def cache_policy(name):
+    """Valeur de l'en-tête Cache-Control pour une route"""
+    return current_app.config.get('HTTP_CACHE_CONTROL', {}).get(name, DEFAULT_POLICIES[name])
+
+
+def _version_query(public_only=True):
+    columns = [Portfolio.id, Portfolio.public_url, Portfolio.updated_at, User.updated_at]
+    for model in (Project, Experience, Education, Skill):
+        for aggregate in (func.count(model.id), func.max(model.updated_at)):
+            columns.append(
+                select(aggregate).where(model.portfolio_id == Portfolio.id).scalar_subquery()
+            )
+    query = select(*columns).join(User, User.id == Portfolio.user_id)
+    return query.where(Portfolio.is_public == True) if public_only else query
+
+
+def _validator(row):
+    portfolio_id, _, *parts = row
+    etag = hashlib.sha1(repr((portfolio_id, *parts)).encode('utf-8')).hexdigest()[:20]
+    timestamps = [part for part in parts if hasattr(part, 'isoformat')]
+    return Validator(portfolio_id, etag, max(timestamps) if timestamps else None)
+
+
+def portfolio_validator(public_url=None, portfolio_id=None, public_only=True):
+    """Version d'un portfolio (public par défaut), ou None s'il n'existe pas"""
+    query = _version_query(public_only)
+    if public_url is not None:
+        query = query.where(Portfolio.public_url == public_url)
+    else:
+        query = query.where(Portfolio.id == portfolio_id)
+    row = read_session().execute(query).first()
+    return _validator(row) if row is not None else None
+
+
+def all_portfolio_validators():
+    """Versions de tous les portfolios publics, par public_url"""
+    return {row.public_url: _validator(row) for row in db.session.execute(_version_query())}
+
+
+def is_fresh(etag=None, last_modified=None, weak=True):
+    """Le client possède-t-il déjà cette version ?"""
+    if request.if_none_match:
+        if etag is None:
+            return False
+        if weak:
+            return request.if_none_match.contains_weak(etag)
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return _http_date(last_modified) <= request.if_modified_since
+    return False
+
+
+def _http_date(moment):
+    # Les dates sont stockées en UTC naïf ; HTTP n'a qu'une précision à la seconde
+    return moment.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def apply_validators(response, etag, last_modified, policy, weak=True):
+    """Ajouter ETag, Last-Modified et Cache-Control à une réponse"""
+    if etag is not None:
+        response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    response.headers['Cache-Control'] = cache_policy(policy)
+    return response
+
+
+def not_modified(etag, last_modified, policy, weak=True):
+    """Réponse 304 avec les mêmes validateurs"""
+    return apply_validators(Response(status=304), etag, last_modified, policy, weak=weak)
+
+
+def conditional_response(body, etag, last_modified, policy, mimetype='text/html', weak=True):
+    """Réponse complète, ou 304 si le client est à jour"""
+    if is_fresh(etag, last_modified, weak=weak):
+        return not_modified(etag, last_modified, policy, weak=weak)
+    return apply_validators(Response(body, mimetype=mimetype), etag, last_modified, policy, weak=weak)
+
+
+def send_json_entry(entry):
+    """Réponse HTTP pour une entrée JSON précalculée (voir page_cache.build_json_entry)"""
+    last_modified = entry.get('last_modified')
+    if is_fresh(entry['etag'], last_modified, weak=False):
+        return not_modified(entry['etag'], last_modified, 'api', weak=False)
+
+    accepted = request.accept_encodings
+    encoding = None
+    if 'br' in entry and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+
+    response = Response(entry[encoding] if encoding else entry['body'], mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return apply_validators(response, entry['etag'], last_modified, 'api', weak=False)
@@ -0,0 +1,383 @@
+"""
+Traitement des images envoyées (photo de profil, images de projet)
+
+L'envoi est validé par Pillow puis confié à la file de tâches (jobs.py) ; un
+worker le transmet à un pool de processus qui génère,
+pour chaque largeur configurée, une variante par format (AVIF si disponible,
+WebP, JPEG), sans métadonnées EXIF, et les confie au stockage (storage.py)
+sous images/. Les fichiers sont nommés d'après l'empreinte du contenu :
+<clé>-<largeur>.<ext>, <clé>.jpg pour la plus grande variante JPEG (le nom
+enregistré en base) et <clé>.json qui décrit les variantes et n'est écrit
+qu'une fois toutes les autres prêtes.
+
+L'image envoyée est confiée au stockage sous image-uploads/ (non servi) pour
+que le worker qui traite la tâche la retrouve, quelle que soit l'instance, et
+supprimée à la fin du traitement, même en échec. Une copie réduite, sans
+métadonnées (<clé>-preview.jpg), est affichée par responsive_image() en
+attendant les variantes ; ensuite, elle produit un <picture> avec les srcset
+correspondants.
+"""
+
+import atexit
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+from jobs import enqueue, task
+from storage import get_storage, scratch_folder
+
+logger = logging.getLogger(__name__)
+
+# Largeurs générées par type d'image, surchargeables via IMAGE_VARIANTS
+DEFAULT_VARIANTS = {
+    'profile': (96, 192, 384),
+    'project': (480, 960, 1440),
+}
+
+# format -> (nom Pillow, type MIME, extension)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', 'avif'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+# Descriptions d'images gardées en mémoire par processus (LRU)
+MAX_MANIFESTS = 2048
+
+# Images envoyées en attente de traitement (hors de images/, donc non servies)
+UPLOAD_PREFIX = 'image-uploads/'
+
+KEY_RE = re.compile(r'^([0-9a-f]{24})\.jpg$')
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def _pillow():
+    """Pillow, importé au premier traitement d'image (et non au démarrage des workers)"""
+    from PIL import Image, ImageOps
+    try:
+        import pillow_avif  # noqa: F401 (enregistre le format AVIF auprès de Pillow)
+    except ImportError:
+        pass
+    return Image, ImageOps
+
+
+def available_formats(formats):
+    """Formats demandés que Pillow sait écrire (JPEG toujours inclus)"""
+    Image, _ = _pillow()
+    Image.init()
+    available = [name for name in formats if name in FORMATS and FORMATS[name][0] in Image.SAVE]
+    if 'jpeg' not in available:
+        available.append('jpeg')
+    return available
+
+
+def _open_image(source):
+    """Image redressée, sans métadonnées ; renvoie (image, version opaque, profil ICC)"""
+    Image, ImageOps = _pillow()
+    with Image.open(source) as original:
+        original.seek(0)
+        image = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get('icc_profile')
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+    image.info = {}
+    if image.mode == 'RGBA':
+        # JPEG n'a pas de transparence : fond blanc
+        opaque = Image.new('RGB', image.size, (255, 255, 255))
+        opaque.paste(image, mask=image.getchannel('A'))
+    else:
+        opaque = image
+    return image, opaque, icc_profile
+
+
+def process_image(source_path, scratch_dir, key, widths, formats, quality, storage):
+    """Générer les variantes d'une image et les confier au stockage (exécuté dans un processus du pool)"""
+    Image, _ = _pillow()
+    work_dir = tempfile.mkdtemp(dir=scratch_dir, prefix=f'.{key}-')
+    try:
+        image, opaque, icc_profile = _open_image(source_path)
+
+        width, height = image.size
+        targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+        formats = available_formats(formats)
+        variants = {name: [] for name in formats}
+        files = []
+
+        # Du plus grand au plus petit : chaque réduction part de la précédente
+        current, current_opaque = image, opaque
+        for target in reversed(targets):
+            size = (target, max(1, round(height * target / width)))
+            if size != current.size:
+                current = current.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                current_opaque = current if current.mode == 'RGB' else \
+                    current_opaque.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for name in formats:
+                pil_format, mimetype, extension = FORMATS[name]
+                frame = current_opaque if name == 'jpeg' else current
+                options = {'quality': quality}
+                if name == 'jpeg':
+                    options.update(optimize=True, progressive=True)
+                if icc_profile:
+                    options['icc_profile'] = icc_profile
+                filename = f'{key}-{target}.{extension}'
+                frame.save(os.path.join(work_dir, filename), pil_format, **options)
+                files.append((filename, mimetype))
+                variants[name].append(target)
+
+        # Nom enregistré en base : copie de la plus grande variante JPEG
+        shutil.copyfile(os.path.join(work_dir, f'{key}-{targets[-1]}.jpg'), os.path.join(work_dir, f'{key}.jpg'))
+        files.append((f'{key}.jpg', 'image/jpeg'))
+
+        manifest = {
+            'width': targets[-1],
+            'height': max(1, round(height * targets[-1] / width)),
+            'variants': {name: sorted(widths_) for name, widths_ in variants.items()},
+        }
+        with open(os.path.join(work_dir, f'{key}.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        # La description en dernier : sa présence signifie que tout est prêt
+        files.append((f'{key}.json', 'application/json'))
+
+        for filename, mimetype in files:
+            storage.save_file(os.path.join(work_dir, filename), f'images/{filename}', content_type=mimetype)
+        return manifest
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+
+class ImagePipeline:
+    """Pool de processus pour la génération des variantes"""
+
+    def __init__(self, app, workers=2):
+        self.app = app
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, args):
+        """Générer les variantes dans le pool et attendre le résultat"""
+        if not self.workers:
+            process_image(*args)
+            return
+        self._get_executor().submit(process_image, *args).result()
+
+    def _get_executor(self):
+        # Un pool par processus : les workers gunicorn ne partagent pas celui du maître
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+                    atexit.register(self.stop)
+        return self._executor
+
+    def stop(self):
+        """Attendre la fin des traitements en cours"""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pid = None
+
+
+def get_pipeline():
+    """Récupérer le pool de l'application courante (créé au premier appel)"""
+    pipeline = current_app.extensions.get('image_pipeline')
+    if pipeline is None:
+        pipeline = ImagePipeline(
+            current_app._get_current_object(),
+            workers=current_app.config.get('IMAGE_WORKERS', 2),
+        )
+        current_app.extensions['image_pipeline'] = pipeline
+    return pipeline
+
+
+def save_image(file, kind, portfolio_id=None):
+    """Valider une image envoyée et programmer la génération de ses variantes ; renvoie son nom ou None"""
+    Image, _ = _pillow()
+    data = file.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        return None
+    if image_format not in ACCEPTED_FORMATS:
+        return None
+
+    widths = tuple(current_app.config.get('IMAGE_VARIANTS', {}).get(kind, DEFAULT_VARIANTS[kind]))
+    formats = tuple(current_app.config.get('IMAGE_FORMATS', ('avif', 'webp', 'jpeg')))
+    quality = current_app.config.get('IMAGE_QUALITY', 80)
+
+    # Même contenu, même type : mêmes variantes
+    digest = hashlib.sha256(f'{kind}:{widths}:'.encode('utf-8'))
+    digest.update(data)
+    key = digest.hexdigest()[:24]
+    name = f'{key}.jpg'
+
+    if get_storage().exists(f'images/{key}.json'):
+        return name
+
+    storage = get_storage()
+    # Dans le stockage partagé : la tâche peut être traitée par une autre instance
+    fd, upload_path = tempfile.mkstemp(dir=scratch_folder(), prefix=f'.{key}-', suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        storage.save_file(upload_path, upload_key(key), content_type='application/octet-stream', immutable=False)
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+    save_preview(data, key, max(widths), quality, storage)
+    enqueue('images.process', source_key=upload_key(key), key=key, widths=widths, formats=formats,
+            quality=quality, portfolio_id=portfolio_id)
+    return name
+
+
+def save_preview(data, key, width, quality, storage):
+    """Copie réduite, redressée et sans métadonnées, affichée pendant le traitement"""
+    Image, _ = _pillow()
+    _, preview, icc_profile = _open_image(io.BytesIO(data))
+    if preview.width > width:
+        preview = preview.resize((width, max(1, round(preview.height * width / preview.width))),
+                                 Image.Resampling.LANCZOS, reducing_gap=3.0)
+    fd, preview_path = tempfile.mkstemp(dir=scratch_folder(), prefix=f'.{key}-', suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            preview.save(f, 'JPEG', quality=quality, icc_profile=icc_profile)
+        storage.save_file(preview_path, preview_key(key), content_type='image/jpeg', immutable=False)
+    finally:
+        if os.path.exists(preview_path):
+            os.remove(preview_path)
+
+
+# Une seule tentative : l'image envoyée est supprimée du stockage, même en cas d'erreur
+@task('images.process', max_attempts=1)
+def run_image_job(source_key, key, widths, formats, quality, portfolio_id=None):
+    """Tâche de fond : variantes d'une image, puis nouvelle version du portfolio"""
+    storage = get_storage()
+    try:
+        data = storage.read(source_key)
+        if data is None:
+            logger.warning(f"Image envoyée introuvable : {source_key}")
+            return
+        fd, source_path = tempfile.mkstemp(dir=scratch_folder(), prefix=f'.{key}-', suffix='.upload')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # process_image supprime la copie locale
+        get_pipeline().run((source_path, scratch_folder(), key, tuple(widths), tuple(formats), quality, storage))
+    finally:
+        # L'image envoyée garde ses métadonnées EXIF : elle ne doit pas rester dans le stockage
+        storage.delete(source_key)
+    if portfolio_id is not None:
+        refresh_portfolio(portfolio_id)
+    # Les pages rendues à nouveau utilisent les variantes ; en cas d'échec, la copie reste affichée
+    storage.delete(preview_key(key))
+
+
+def upload_key(key):
+    """Clé de stockage de l'image envoyée, conservée jusqu'au traitement"""
+    return f'{UPLOAD_PREFIX}{key}'
+
+
+def preview_key(key):
+    """Clé de stockage de la copie affichée pendant le traitement"""
+    return f'images/{key}-preview.jpg'
+
+
+def image_manifest(name):
+    """Description des variantes d'une image, None si elle n'est pas (encore) traitée"""
+    storage = get_storage()
+    with _manifests_lock:
+        manifest = _manifests.get((id(storage), name))
+        if manifest is not None:
+            _manifests.move_to_end((id(storage), name))
+            return manifest
+    match = KEY_RE.match(name or '')
+    if not match:
+        return None
+    raw = storage.read(f'images/{match.group(1)}.json')
+    if raw is None:
+        return None
+    try:
+        manifest = json.loads(raw)
+    except ValueError:
+        return None
+    # Contenu adressé par empreinte : la description ne change jamais
+    with _manifests_lock:
+        _manifests[(id(storage), name)] = manifest
+        while len(_manifests) > MAX_MANIFESTS:
+            _manifests.popitem(last=False)
+    return manifest
+
+
+def _image_url(filename):
+    return get_storage().url(f'images/{filename}') or \
+        url_for('files.uploaded_file', kind='images', filename=filename)
+
+
+def responsive_image(name, alt='', sizes='100vw', class_='', loading='lazy'):
+    """Balise <picture> avec srcset pour une image envoyée"""
+    if not name:
+        return Markup('')
+    attributes = f'alt="{escape(alt)}" class="{escape(class_)}" loading="{loading}" decoding="async"'
+
+    match = KEY_RE.match(name)
+    if not match:
+        # Ancien envoi, sans variantes
+        return Markup(f'<img src="{escape(_image_url(name))}" {attributes}>')
+
+    key = match.group(1)
+    manifest = image_manifest(name)
+    if manifest is None:
+        # Variantes en cours de génération : copie réduite de l'image envoyée
+        return Markup(f'<img src="{escape(_image_url(f"{key}-preview.jpg"))}" {attributes}>')
+
+    sources = []
+    fallback_srcset = ''
+    for format_name, widths in manifest['variants'].items():
+        _, mimetype, extension = FORMATS[format_name]
+        srcset = ', '.join(f'{escape(_image_url(f"{key}-{w}.{extension}"))} {w}w' for w in widths)
+        if format_name == 'jpeg':
+            fallback_srcset = srcset
+        else:
+            sources.append(f'<source type="{mimetype}" srcset="{srcset}" sizes="{escape(sizes)}">')
+
+    return Markup(
+        '<picture>' + ''.join(sources)
+        + f'<img src="{escape(_image_url(name))}" srcset="{fallback_srcset}" sizes="{escape(sizes)}"'
+        + f' width="{manifest["width"]}" height="{manifest["height"]}" {attributes}></picture>'
+    )
+
+
+def refresh_portfolio(portfolio_id):
+    """Nouvelle version du portfolio une fois ses images prêtes (cache et ETag)"""
+    from models import db, Portfolio
+    from page_cache import invalidate_portfolio
+
+    db.session.execute(
+        Portfolio.__table__.update()
+        .where(Portfolio.__table__.c.id == portfolio_id)
+        .values(updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    invalidate_portfolio(db.session.get(Portfolio, portfolio_id))
+    db.session.remove()
@@ -6,9 +6,10 @@ Crée les tables de base de données et ajoute des données de démonstration
 
 import os
 import sys
-from app import app, db
-from models import User, Portfolio, Project, Experience, Education, Skill
-from werkzeug.security import generate_password_hash
+from app import create_app
+from models import db, User, Portfolio, Project, Experience, Education, Skill
+from search import ensure_index
+from passwords import hash_password
 import secrets
 from datetime import datetime
 
@@ -16,6 +17,7 @@ def init_database():
     """Initialiser la base de données"""
     print("🗄️ Initialisation de la base de données...")
     
+    app = create_app()
     with app.app_context():
         # Créer toutes les tables
         db.create_all()
@@ -23,6 +25,8 @@ def init_database():
         
         # Vérifier si des utilisateurs existent déjà
         if User.query.first():
+            # Construire l'index de recherche des portfolios existants si besoin
+            ensure_index()
             print("ℹ️ Des utilisateurs existent déjà, pas d'ajout de données de démonstration")
             return
         
@@ -32,7 +36,7 @@ def init_database():
             email='demo@example.com',
             first_name='Demo',
             last_name='User',
-            password_hash=generate_password_hash('demo123')
+            password_hash=hash_password('demo123')
         )
         db.session.add(demo_user)
         db.session.commit()
@@ -0,0 +1,446 @@
+"""
+File de tâches de fond : emails, imports de CV, traitement des images
+
+Une requête ne fait qu'enregistrer une tâche (enqueue) ; un worker l'exécute
+dans son propre contexte d'application. Une tâche qui lève une exception est
+reprogrammée avec un délai doublé à chaque tentative (JOB_RETRY_BASE_DELAY,
+plafonné à JOB_RETRY_MAX_DELAY, avec une part aléatoire), puis marquée
+'failed' après max_attempts tentatives.
+
+Selon JOB_QUEUE_BACKEND :
+- 'database' : table jobs, partagée par tous les processus. Chaque processus
+  web l'exécute avec JOB_EMBEDDED_WORKERS threads ; on peut les mettre à 0 et
+  lancer des workers dédiés (`flask jobs worker`). Une tâche 'running' depuis
+  plus de JOB_TIMEOUT secondes (worker arrêté brutalement) est reprise.
+- 'memory' : file en mémoire, exécutée par les threads du processus (perdue
+  à l'arrêt ; développement en un seul processus).
+- 'sync' : exécution immédiate, après la réponse de la requête en cours
+  (tests).
+
+Les fichiers passés aux tâches (images envoyées) sont dans
+UPLOAD_SCRATCH_FOLDER, qui doit être partagé avec les workers dédiés.
+
+Utilisation :
+    flask jobs worker [--concurrency N] [--burst]
+    flask jobs stats
+    flask jobs list [--status failed]
+    flask jobs retry ID
+    flask jobs purge [--days 7]
+"""
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import click
+from flask import after_this_request, current_app, has_request_context
+from flask.cli import with_appcontext
+from sqlalchemy import func, update
+
+logger = logging.getLogger(__name__)
+
+Task = namedtuple('Task', 'func max_attempts')
+ClaimedJob = namedtuple('ClaimedJob', 'id task payload attempts max_attempts')
+
+# Tâches enregistrées par @task, par nom
+TASKS = {}
+
+
+def task(name, max_attempts=None):
+    """Enregistrer une fonction comme tâche de fond (arguments JSON)"""
+    def decorator(func):
+        TASKS[name] = Task(func, max_attempts)
+        return func
+    return decorator
+
+
+def run_task(app, name, payload):
+    """Exécuter une tâche dans un contexte d'application neuf (session SQL séparée)"""
+    from models import db
+
+    with app.app_context():
+        try:
+            TASKS[name].func(**payload)
+        finally:
+            db.session.remove()
+
+
+def retry_delay(attempts, base=10.0, maximum=3600.0):
+    """Délai avant la tentative suivante : doublé à chaque échec, moitié aléatoire"""
+    delay = min(maximum, base * 2 ** max(0, attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class DatabaseBroker:
+    """Tâches dans la table jobs (tous les processus, toutes les machines)"""
+
+    def __init__(self, timeout=600):
+        self.timeout = timeout
+        self._recovered_at = 0.0
+
+    def push(self, name, payload, run_at, max_attempts):
+        from models import db, Job
+
+        job = Job(task=name, payload=json.dumps(payload), run_at=run_at, max_attempts=max_attempts)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def claim(self, worker_id):
+        """Réserver la prochaine tâche due, ou None"""
+        from models import db, Job
+
+        now = datetime.utcnow()
+        if time.monotonic() - self._recovered_at >= 60:
+            self._recover(now)
+        candidates = db.session.query(Job.id).filter(Job.status == 'pending', Job.run_at <= now) \
+            .order_by(Job.run_at, Job.id).limit(10).all()
+        for (job_id,) in candidates:
+            # Mise à jour conditionnelle : un seul worker obtient la tâche
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, Job.status == 'pending')
+                .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                job = db.session.get(Job, job_id)
+                return ClaimedJob(job.id, job.task, json.loads(job.payload), job.attempts, job.max_attempts)
+        db.session.commit()
+        return None
+
+    def _recover(self, now):
+        # Tâches d'un worker disparu : reprises, ou abandonnées si plus de tentatives
+        from models import db, Job
+
+        self._recovered_at = time.monotonic()
+        stale = (Job.status == 'running', Job.locked_at < now - timedelta(seconds=self.timeout))
+        db.session.execute(update(Job).where(*stale, Job.attempts >= Job.max_attempts)
+                           .values(status='failed', last_error='Worker perdu', locked_by=None))
+        db.session.execute(update(Job).where(*stale).values(status='pending', run_at=now, locked_by=None))
+        db.session.commit()
+
+    def complete(self, job):
+        self._update(job, status='done', locked_by=None, last_error=None)
+
+    def retry(self, job, run_at, error):
+        self._update(job, status='pending', run_at=run_at, locked_by=None, last_error=error)
+
+    def fail(self, job, error):
+        self._update(job, status='failed', locked_by=None, last_error=error)
+
+    def _update(self, job, **values):
+        from models import db, Job
+
+        db.session.execute(update(Job).where(Job.id == job.id).values(**values))
+        db.session.commit()
+
+    def stats(self):
+        from models import db, Job
+
+        return dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+
+class MemoryBroker:
+    """Tâches en mémoire, pour un seul processus (perdues à l'arrêt)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []  # (échéance, id)
+        self._jobs = {}
+        self._ids = itertools.count(1)
+
+    def push(self, name, payload, run_at, max_attempts):
+        with self._lock:
+            job_id = next(self._ids)
+            # Copie JSON : mêmes contraintes que la table jobs
+            self._jobs[job_id] = {'task': name, 'payload': json.loads(json.dumps(payload)), 'status': 'pending',
+                                  'attempts': 0, 'max_attempts': max_attempts, 'last_error': None}
+            heapq.heappush(self._heap, (run_at, job_id))
+        return job_id
+
+    def claim(self, worker_id):
+        with self._lock:
+            if not self._heap or self._heap[0][0] > datetime.utcnow():
+                return None
+            _, job_id = heapq.heappop(self._heap)
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['attempts'] += 1
+            return ClaimedJob(job_id, job['task'], job['payload'], job['attempts'], job['max_attempts'])
+
+    def complete(self, job):
+        with self._lock:
+            # Seules les tâches en échec sont conservées (pour `flask jobs stats`)
+            del self._jobs[job.id]
+
+    def retry(self, job, run_at, error):
+        with self._lock:
+            self._jobs[job.id].update(status='pending', last_error=error)
+            heapq.heappush(self._heap, (run_at, job.id))
+
+    def fail(self, job, error):
+        with self._lock:
+            self._jobs[job.id].update(status='failed', last_error=error)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+class Worker:
+    """Threads qui exécutent les tâches d'un broker"""
+
+    def __init__(self, app, broker, concurrency=1, poll_interval=2.0):
+        self.app = app
+        self.broker = broker
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def run(self, burst=False):
+        """Exécuter les tâches dans le thread courant et ses voisins jusqu'à stop()"""
+        threads = [threading.Thread(target=self._run, args=(burst,), name=f'jobs-{i}')
+                   for i in range(self.concurrency - 1)]
+        for thread in threads:
+            thread.start()
+        self._run(burst)
+        for thread in threads:
+            thread.join()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self.wakeup.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self, burst=False):
+        from models import db
+
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    job = self.broker.claim(f'{self.name}/{threading.current_thread().name}')
+                except Exception as e:
+                    logger.error(f"Erreur lecture de la file de tâches : {e}")
+                    db.session.rollback()
+                    job = None
+                if job is not None:
+                    self.process(job)
+                db.session.remove()
+            if job is None:
+                if burst:
+                    return
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def process(self, job):
+        """Exécuter une tâche réservée et enregistrer son résultat"""
+        config = self.app.config
+        started = time.perf_counter()
+        try:
+            if job.task not in TASKS:
+                raise LookupError(f"Tâche inconnue : {job.task}")
+            run_task(self.app, job.task, job.payload)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'[:2000]
+            if job.attempts < job.max_attempts and job.task in TASKS:
+                delay = retry_delay(job.attempts, config.get('JOB_RETRY_BASE_DELAY', 10),
+                                    config.get('JOB_RETRY_MAX_DELAY', 3600))
+                logger.warning(f"Tâche {job.task} #{job.id} en échec (tentative {job.attempts}/{job.max_attempts}), "
+                               f"nouvel essai dans {delay:.0f}s : {error}")
+                self.broker.retry(job, datetime.utcnow() + timedelta(seconds=delay), error)
+            else:
+                logger.error(f"Tâche {job.task} #{job.id} abandonnée après {job.attempts} tentative(s) : {error}")
+                self.broker.fail(job, error)
+            return
+        self.broker.complete(job)
+        logger.info(f"Tâche {job.task} #{job.id} exécutée en {time.perf_counter() - started:.2f}s")
+
+
+class JobQueue:
+    """File de tâches de l'application : broker et threads de ce processus"""
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.backend = config.get('JOB_QUEUE_BACKEND', 'database')
+        if self.backend == 'database':
+            self.broker = DatabaseBroker(timeout=config.get('JOB_TIMEOUT', 600))
+            self.threads = config.get('JOB_EMBEDDED_WORKERS', 1)
+        elif self.backend == 'memory':
+            self.broker = MemoryBroker()
+            self.threads = max(1, config.get('JOB_EMBEDDED_WORKERS', 1))
+        elif self.backend == 'sync':
+            self.broker = None
+            self.threads = 0
+        else:
+            raise ValueError(f"JOB_QUEUE_BACKEND inconnu : {self.backend}")
+        self.max_attempts = config.get('JOB_MAX_ATTEMPTS', 5)
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, name, delay=0, **payload):
+        """Enregistrer une tâche ; renvoie son identifiant (None en mode 'sync')"""
+        if name not in TASKS:
+            raise LookupError(f"Tâche inconnue : {name}")
+        if self.broker is None:
+            self._run_now(name, payload)
+            return None
+        max_attempts = TASKS[name].max_attempts or self.max_attempts
+        job_id = self.broker.push(name, payload, datetime.utcnow() + timedelta(seconds=delay), max_attempts)
+        worker = self.ensure_started()
+        if worker is not None and not delay:
+            worker.wakeup.set()
+        return job_id
+
+    def _run_now(self, name, payload):
+        def run(response=None):
+            try:
+                run_task(self.app, name, payload)
+            except Exception as e:
+                logger.error(f"Tâche {name} en échec : {e}")
+            return response
+
+        # Après la réponse : la requête a validé ses propres écritures
+        if has_request_context():
+            after_this_request(run)
+        else:
+            run()
+
+    def ensure_started(self):
+        """Démarrer les threads de ce processus (un jeu par worker gunicorn)"""
+        if not self.threads:
+            return None
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._worker = Worker(self.app, self.broker, self.threads,
+                                          self.app.config.get('JOB_POLL_INTERVAL', 2))
+                    self._worker.start()
+                    self._pid = os.getpid()
+                    atexit.register(self._worker.stop, False)
+        return self._worker
+
+
+def get_queue():
+    """Récupérer la file de l'application courante (créée au premier appel)"""
+    queue = current_app.extensions.get('job_queue')
+    if queue is None:
+        queue = JobQueue(current_app._get_current_object())
+        current_app.extensions['job_queue'] = queue
+    return queue
+
+
+def enqueue(name, delay=0, **payload):
+    """Enregistrer une tâche de fond (voir JobQueue.enqueue)"""
+    return get_queue().enqueue(name, delay, **payload)
+
+
+def init_app(app):
+    # Threads de chaque processus web démarrés à sa première requête (tâches en attente)
+    app.before_request(lambda: get_queue().ensure_started() and None)
+
+
+# --- Ligne de commande -----------------------------------------------------
+
+@click.group('jobs')
+def jobs_command():
+    """File de tâches de fond"""
+
+
+@jobs_command.command('worker')
+@click.option('--concurrency', default=1, help="Tâches exécutées en parallèle")
+@click.option('--burst', is_flag=True, help="S'arrêter quand la file est vide")
+@with_appcontext
+def worker_command(concurrency, burst):
+    """Exécuter les tâches de la table jobs"""
+    app = current_app._get_current_object()
+    queue = get_queue()
+    if queue.backend != 'database':
+        raise click.ClickException("Un worker dédié nécessite JOB_QUEUE_BACKEND='database'")
+    worker = Worker(app, queue.broker, concurrency, app.config.get('JOB_POLL_INTERVAL', 2))
+
+    def shutdown(signum, frame):
+        # Les tâches en cours se terminent, aucune autre n'est réservée
+        click.echo("Arrêt demandé, fin des tâches en cours...")
+        worker.stop(wait=False)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    click.echo(f"Worker {worker.name} : {concurrency} thread(s), tâches {', '.join(sorted(TASKS))}")
+    worker.run(burst=burst)
+
+
+@jobs_command.command('stats')
+@with_appcontext
+def stats_command():
+    """Nombre de tâches par état"""
+    stats = get_queue().broker.stats() if get_queue().broker else {}
+    for status in ('pending', 'running', 'done', 'failed'):
+        click.echo(f"{status:8} {stats.get(status, 0)}")
+
+
+@jobs_command.command('list')
+@click.option('--status', default='failed', type=click.Choice(['pending', 'running', 'done', 'failed']))
+@click.option('--limit', default=20)
+@with_appcontext
+def list_command(status, limit):
+    """Dernières tâches dans un état donné"""
+    from models import Job
+
+    for job in Job.query.filter_by(status=status).order_by(Job.updated_at.desc()).limit(limit):
+        click.echo(f"#{job.id} {job.task} tentatives {job.attempts}/{job.max_attempts} "
+                   f"{job.updated_at:%Y-%m-%d %H:%M:%S} {job.last_error or ''}")
+
+
+@jobs_command.command('retry')
+@click.argument('job_id', type=int)
+@with_appcontext
+def retry_command(job_id):
+    """Relancer une tâche en échec"""
+    from models import db, Job
+
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'failed':
+        raise click.ClickException(f"Aucune tâche en échec #{job_id}")
+    job.status = 'pending'
+    job.run_at = datetime.utcnow()
+    job.max_attempts = job.attempts + 1
+    db.session.commit()
+    click.echo(f"✅ Tâche #{job_id} relancée")
+
+
+@jobs_command.command('purge')
+@click.option('--days', default=7, help="Ancienneté des tâches terminées à supprimer")
+@with_appcontext
+def purge_command(days):
+    """Supprimer les tâches terminées"""
+    from models import db, Job
+
+    count = Job.query.filter(Job.status == 'done', Job.updated_at < datetime.utcnow() - timedelta(days=days)) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"✅ {count} tâche(s) supprimée(s)")
@@ -0,0 +1,350 @@
+"""
+Envoi des emails en tâche de fond
+
+La requête prépare le message (liens, textes) puis l'enregistre dans la file
+de tâches (jobs.py) : un serveur SMTP lent ou indisponible ne retarde plus
+l'inscription ni la demande de réinitialisation, et un envoi échoué est
+retenté plus tard.
+
+Les workers envoient par un pool de connexions SMTP authentifiées
+(MAIL_POOL_SIZE par processus) : connexion, TLS et login ne sont faits
+qu'une fois, puis la session sert aux messages suivants tant qu'elle a
+servi il y a moins de MAIL_POOL_IDLE secondes (et pour au plus
+MAIL_MAX_EMAILS messages). send_many regroupe jusqu'à MAIL_BATCH_SIZE
+messages par tâche, envoyés sur une seule session. Le débit est limité à
+MAIL_RATE_LIMIT messages par seconde et par processus (quotas du
+fournisseur).
+
+Les textes des emails (vérification, réinitialisation) sont des templates
+Jinja compilés une seule fois par processus.
+
+Essai local : python -m aiosmtpd -n -l localhost:8025, avec MAIL_SERVER=localhost,
+MAIL_PORT=8025 et MAIL_USE_TLS=false ; `flask benchmark mail` mesure le débit.
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+from extensions import get_mail
+from jobs import enqueue, task
+
+logger = logging.getLogger(__name__)
+
+# nom -> (sujet, corps)
+TEMPLATES = {
+    'verification': ('Vérification de votre compte Portfolio Builder', '''
+Bonjour {{ name }},
+
+Bienvenue sur Portfolio Builder !
+
+Votre compte a été créé avec succès. Vous pouvez maintenant commencer à créer votre portfolio professionnel.
+
+Pour vérifier votre email, cliquez sur le lien suivant :
+{{ url }}
+
+Si vous n'avez pas créé de compte, ignorez cet email.
+
+Cordialement,
+L'équipe Portfolio Builder
+'''),
+    'password_reset': ('Réinitialisation de votre mot de passe', '''
+Bonjour {{ name }},
+
+Vous avez demandé la réinitialisation de votre mot de passe.
+
+Pour réinitialiser votre mot de passe, cliquez sur le lien suivant :
+{{ url }}
+
+Ce lien expire dans {{ expires }}.
+
+Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
+
+Cordialement,
+L'équipe Portfolio Builder
+'''),
+}
+
+_compiled = {}
+
+
+def render_email(template, **context):
+    """Sujet et corps d'un email de TEMPLATES (compilé au premier usage)"""
+    compiled = _compiled.get(template)
+    if compiled is None:
+        from jinja2 import Environment
+        compiled = Environment(autoescape=False, keep_trailing_newline=True).from_string(TEMPLATES[template][1])
+        _compiled[template] = compiled
+    return TEMPLATES[template][0], compiled.render(**context)
+
+
+# Expéditeur sans MAIL_DEFAULT_SENDER ni MAIL_USERNAME (développement, tests)
+FALLBACK_SENDER = 'Portfolio Builder <noreply@localhost>'
+
+
+def _sender(sender=None):
+    config = current_app.config
+    return sender or config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME') or FALLBACK_SENDER
+
+
+def send_email(subject, recipients, body, sender=None):
+    """Programmer l'envoi d'un email texte"""
+    return enqueue('mail.send', subject=subject, recipients=list(recipients), body=body, sender=_sender(sender))
+
+
+def send_template_email(template, recipients, **context):
+    """Programmer l'envoi d'un email de TEMPLATES"""
+    subject, body = render_email(template, **context)
+    return send_email(subject, recipients, body)
+
+
+def send_many(messages):
+    """Programmer l'envoi de messages (dicts subject, recipients, body[, sender]) par lots"""
+    messages = [{'subject': m['subject'], 'recipients': list(m['recipients']), 'body': m['body'],
+                 'sender': _sender(m.get('sender'))} for m in messages]
+    size = current_app.config.get('MAIL_BATCH_SIZE', 50)
+    return [enqueue('mail.send_batch', messages=messages[i:i + size]) for i in range(0, len(messages), size)]
+
+
+class RateLimiter:
+    """Seau à jetons : rate envois par seconde en moyenne, burst d'affilée au plus"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Attendre le droit d'envoyer un message ; renvoie l'attente en secondes"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Jeton réservé tout de suite : les threads suivants attendent leur tour
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class PartialSendError(Exception):
+    """Envoi interrompu : les `sent` premiers messages ont été traités"""
+
+    def __init__(self, sent, error):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.sent = sent
+
+
+class _Connection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.used_at = time.monotonic()
+        self.sent = 0
+
+
+def _permanent(error):
+    # Refus définitif du message (adresse, contenu) : la session reste utilisable
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)) or \
+        (isinstance(error, smtplib.SMTPDataError) and error.smtp_code >= 500)
+
+
+class SMTPPool:
+    """Connexions SMTP authentifiées réutilisées d'un envoi à l'autre"""
+
+    def __init__(self, server, port, use_tls=False, use_ssl=False, username=None, password=None,
+                 size=2, idle=60, max_emails=None, timeout=10, rate=0):
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.idle = idle
+        self.max_emails = max_emails
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.connects = 0
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._free = []
+        self._pid = None
+
+    def _connect(self):
+        cls = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = cls(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connects += 1
+        return _Connection(smtp)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+        connection.smtp = None
+
+    @contextmanager
+    def connection(self):
+        """Emprunter une session SMTP (ouverte si aucune n'est disponible)"""
+        self._slots.acquire()
+        try:
+            connection = None
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Sessions héritées du processus parent : inutilisables ici
+                    self._free = []
+                    self._pid = os.getpid()
+                while self._free and connection is None:
+                    connection = self._free.pop()
+                    if time.monotonic() - connection.used_at > self.idle:
+                        # Probablement fermée par le serveur
+                        connection.smtp.close()
+                        connection = None
+            if connection is None:
+                connection = self._connect()
+            try:
+                yield connection
+            except BaseException:
+                if connection.smtp is not None:
+                    connection.smtp.close()
+                raise
+            # Session fermée pendant l'envoi (erreur) : pas rendue au pool
+            if connection.smtp is not None:
+                connection.used_at = time.monotonic()
+                with self._lock:
+                    self._free.append(connection)
+        finally:
+            self._slots.release()
+
+    def _sendmail(self, connection, args):
+        if connection.smtp is None or (self.max_emails and connection.sent >= self.max_emails):
+            if connection.smtp is not None:
+                self._close(connection)
+            connection.smtp, connection.sent = self._connect().smtp, 0
+        connection.smtp.sendmail(*args)
+
+    def send(self, messages, on_sent=None):
+        """Envoyer des messages Flask-Mail sur une même session
+
+        Les messages refusés définitivement sont journalisés et ignorés. Une
+        autre erreur après au moins un message lève PartialSendError.
+        """
+        from flask_mail import BadHeaderError, sanitize_address, sanitize_addresses
+
+        with self.connection() as connection:
+            for index, message in enumerate(messages):
+                try:
+                    if message.has_bad_headers():
+                        raise BadHeaderError
+                    if message.date is None:
+                        message.date = time.time()
+                    args = (sanitize_address(message.sender), list(sanitize_addresses(message.send_to)),
+                            message.as_bytes(), message.mail_options, message.rcpt_options)
+                    self.limiter.acquire()
+                    try:
+                        self._sendmail(connection, args)
+                    except smtplib.SMTPServerDisconnected:
+                        # Session fermée par le serveur (inactivité) : un essai sur une session neuve
+                        if connection.smtp is not None:
+                            connection.smtp.close()
+                            connection.smtp = None
+                        self._sendmail(connection, args)
+                except Exception as e:
+                    if _permanent(e):
+                        logger.error(f"Email refusé ({', '.join(message.send_to)}) : {e}")
+                        continue
+                    if connection.smtp is not None:
+                        connection.smtp.close()
+                        connection.smtp = None
+                    if index:
+                        raise PartialSendError(index, e) from e
+                    raise
+                connection.sent += 1
+                if on_sent is not None:
+                    on_sent(message)
+
+    def close(self):
+        """Fermer les sessions inutilisées"""
+        with self._lock:
+            free, self._free = self._free, []
+        for connection in free:
+            self._close(connection)
+
+
+def get_mail_pool():
+    """Récupérer le pool SMTP de l'application courante (créé au premier appel)"""
+    pool = current_app.extensions.get('mail_pool')
+    if pool is None:
+        config = current_app.config
+        pool = SMTPPool(
+            config.get('MAIL_SERVER', 'localhost'),
+            config.get('MAIL_PORT', 25),
+            use_tls=config.get('MAIL_USE_TLS', False),
+            use_ssl=config.get('MAIL_USE_SSL', False),
+            username=config.get('MAIL_USERNAME'),
+            password=config.get('MAIL_PASSWORD'),
+            size=config.get('MAIL_POOL_SIZE', 2),
+            idle=config.get('MAIL_POOL_IDLE', 60),
+            max_emails=config.get('MAIL_MAX_EMAILS'),
+            timeout=config.get('MAIL_TIMEOUT', 10),
+            rate=config.get('MAIL_RATE_LIMIT', 0),
+        )
+        current_app.extensions['mail_pool'] = pool
+    return pool
+
+
+def _message(subject, recipients, body, sender):
+    # Import différé : Flask-Mail n'est chargé qu'au premier envoi
+    from flask_mail import Message
+
+    # Message et sa sérialisation lisent la configuration dans l'extension : elle doit exister
+    get_mail()
+    return Message(subject, sender=_sender(sender), recipients=recipients, body=body)
+
+
+def deliver_messages(messages):
+    """Envoyer des messages Flask-Mail (pool SMTP, ou Flask-Mail si MAIL_SUPPRESS_SEND)"""
+    from flask_mail import email_dispatched
+
+    mail = get_mail()
+    if mail.suppress:
+        # Tests : Flask-Mail enregistre les messages sans les envoyer
+        for message in messages:
+            mail.send(message)
+        return
+    app = current_app._get_current_object()
+    get_mail_pool().send(messages, on_sent=lambda message: email_dispatched.send(message, app=app))
+
+
+@task('mail.send', max_attempts=5)
+def deliver(subject, recipients, body, sender):
+    """Envoyer un email (dans un worker de la file)"""
+    deliver_messages([_message(subject, recipients, body, sender)])
+
+
+@task('mail.send_batch', max_attempts=5)
+def deliver_batch(messages):
+    """Envoyer un lot d'emails sur une même session"""
+    try:
+        deliver_messages([_message(**m) for m in messages])
+    except PartialSendError as e:
+        # Seule la suite du lot est retentée (sans renvoyer le début)
+        logger.warning(f"Lot d'emails interrompu après {e.sent}/{len(messages)} messages : {e}")
+        enqueue('mail.send_batch', delay=current_app.config.get('JOB_RETRY_BASE_DELAY', 10),
+                messages=messages[e.sent:])
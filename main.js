@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initImagePreview();
     initSkillBars();
     initThemePreview();
+    initSortable();
 });
 
 // Gestion des tooltips
@@ -258,6 +259,63 @@ function updateThemePreview() {
     }
 }
 
+// Réorganisation par glisser-déposer : conteneurs [data-sortable-url], éléments [data-id]
+function initSortable() {
+    document.querySelectorAll('[data-sortable-url]').forEach(container => {
+        const currentOrder = () => Array.from(container.querySelectorAll('[data-id]')).map(item => parseInt(item.dataset.id));
+        let dragged = null;
+        let initialOrder = null;
+        
+        container.querySelectorAll('[data-id]').forEach(item => {
+            item.setAttribute('draggable', 'true');
+            item.classList.add('cursor-move');
+            
+            item.addEventListener('dragstart', (event) => {
+                dragged = item;
+                initialOrder = currentOrder().join(',');
+                item.classList.add('opacity-50');
+                event.dataTransfer.effectAllowed = 'move';
+            });
+            
+            item.addEventListener('dragover', (event) => {
+                // Déplacement seulement parmi les éléments voisins (même catégorie)
+                if (!dragged || dragged.parentNode !== item.parentNode) return;
+                event.preventDefault();
+                if (dragged === item) return;
+                const after = dragged.compareDocumentPosition(item) & Node.DOCUMENT_POSITION_FOLLOWING;
+                item.parentNode.insertBefore(dragged, after ? item.nextSibling : item);
+            });
+            
+            item.addEventListener('dragend', () => {
+                item.classList.remove('opacity-50');
+                dragged = null;
+                // Un seul envoi par déplacement, avec l'ordre complet de la section
+                const order = currentOrder();
+                if (order.join(',') === initialOrder) return;
+                sendBulkEdit(container.dataset.sortableUrl, { order: order })
+                    .then(() => showNotification('Ordre enregistré', 'success'))
+                    .catch(error => showNotification(error.message, 'error'));
+            });
+        });
+        
+        container.addEventListener('drop', (event) => event.preventDefault());
+    });
+}
+
+// Modification groupée d'une section : { order: [ids], items: [{ id, champ: valeur }] }
+function sendBulkEdit(url, payload) {
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+        body: JSON.stringify(payload)
+    }).then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || 'Erreur lors de l\'enregistrement');
+        }
+        return data;
+    }));
+}
+
 // Utilitaires
 function copyToClipboard(text) {
     if (navigator.clipboard) {
@@ -0,0 +1,253 @@
+"""
+Mesures par requête : nombre de requêtes SQL, temps base de données, temps de
+rendu des templates et durée totale
+
+Les requêtes SQL sont comptées via les événements du moteur SQLAlchemy et
+rattachées à la requête HTTP en cours ; les totaux par endpoint sont exposés
+au format Prometheus sur /metrics (METRICS_TOKEN requis hors debug et test).
+Les compteurs sont propres à chaque processus : avec plusieurs workers
+gunicorn, chacun répond pour lui-même.
+Les requêtes SQL lentes sont journalisées (SLOW_QUERY_THRESHOLD_MS) et,
+en mode debug, la réponse porte un en-tête Server-Timing.
+"""
+
+import hmac
+import logging
+import threading
+import time
+from flask import Blueprint, Response, abort, current_app, g, has_app_context, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Limites des histogrammes (secondes, puis nombre de requêtes SQL)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Histogramme cumulatif (buckets, somme et nombre d'observations)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Totaux par endpoint depuis le démarrage du processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}        # (endpoint, méthode, statut) -> nombre
+        self.durations = {}       # endpoint -> Histogram (durée totale)
+        self.query_counts = {}    # endpoint -> Histogram (requêtes SQL par requête HTTP)
+        self.db_seconds = {}      # endpoint -> temps SQL cumulé
+        self.template_seconds = {}  # endpoint -> temps de rendu cumulé
+        self.slow_queries = 0
+
+    def record(self, endpoint, method, status, stats):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault(endpoint, Histogram(DURATION_BUCKETS)).observe(stats.total)
+            self.query_counts.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.queries)
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + stats.db_time
+            self.template_seconds[endpoint] = self.template_seconds.get(endpoint, 0.0) + stats.template_time
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        """Texte au format d'exposition Prometheus"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, values):
+            for endpoint, hist in sorted(values.items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le=_number(bound))} {count}')
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le="+Inf")} {hist.count}')
+                lines.append(f'{name}_sum{_labels(endpoint=endpoint)} {_number(hist.sum)}')
+                lines.append(f'{name}_count{_labels(endpoint=endpoint)} {hist.count}')
+
+        with self._lock:
+            metric('portfolio_http_requests_total', 'counter', 'Requêtes HTTP traitées')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'portfolio_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+            metric('portfolio_http_request_duration_seconds', 'histogram', 'Durée totale des requêtes HTTP')
+            histogram('portfolio_http_request_duration_seconds', self.durations)
+            metric('portfolio_db_queries_per_request', 'histogram', 'Requêtes SQL par requête HTTP')
+            histogram('portfolio_db_queries_per_request', self.query_counts)
+            metric('portfolio_db_seconds_total', 'counter', 'Temps passé en base de données')
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'portfolio_db_seconds_total{_labels(endpoint=endpoint)} {_number(seconds)}')
+            metric('portfolio_template_seconds_total', 'counter', 'Temps de rendu des templates')
+            for endpoint, seconds in sorted(self.template_seconds.items()):
+                lines.append(f'portfolio_template_seconds_total{_labels(endpoint=endpoint)} {_number(seconds)}')
+            metric('portfolio_db_slow_queries_total', 'counter', 'Requêtes SQL plus lentes que SLOW_QUERY_THRESHOLD_MS')
+            lines.append(f'portfolio_db_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class RequestStats:
+    """Mesures de la requête HTTP en cours"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_starts = []
+        self.total = 0.0
+
+
+def get_registry():
+    """Récupérer les totaux de l'application courante (créés au premier appel)"""
+    registry = current_app.extensions.get('metrics')
+    if registry is None:
+        registry = MetricsRegistry()
+        current_app.extensions['metrics'] = registry
+    return registry
+
+
+def _current_stats():
+    return g.get('request_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _query_done(conn, statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # Requête en échec : comptée aussi, sinon son début resterait dans la pile
+    if context.connection is not None:
+        _query_done(context.connection, context.statement or '')
+
+
+def _query_done(conn, statement):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _current_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if not has_app_context():
+        return
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200)
+    if threshold and elapsed * 1000 >= threshold:
+        get_registry().record_slow_query()
+        # Sans les paramètres : ils peuvent contenir des données personnelles
+        logger.warning(f"Requête SQL lente ({elapsed * 1000:.0f} ms, "
+                       f"{request.endpoint if has_request_context() else 'hors requête'}) : {' '.join(statement.split())[:1000]}")
+
+
+@before_render_template.connect
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats.template_starts.append(time.perf_counter())
+
+
+@template_rendered.connect
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats.template_starts:
+        start = stats.template_starts.pop()
+        # Templates imbriqués (render_template dans un rendu) : compter seulement le plus externe
+        if not stats.template_starts:
+            stats.template_time += time.perf_counter() - start
+
+
+@metrics_bp.before_app_request
+def start_request_stats():
+    g.request_stats = RequestStats()
+
+
+@metrics_bp.after_app_request
+def add_server_timing(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    stats.total = time.perf_counter() - stats.start
+    g.response_status = response.status_code
+    server_timing = current_app.config.get('SERVER_TIMING')
+    if server_timing is None:
+        server_timing = current_app.debug
+    if server_timing:
+        response.headers['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db_time * 1000:.1f};desc="SQL ({stats.queries})"',
+            f'tpl;dur={stats.template_time * 1000:.1f};desc="Templates"',
+            f'app;dur={stats.total * 1000:.1f};desc="Total"',
+        ))
+    return response
+
+
+@metrics_bp.teardown_app_request
+def record_request_stats(exception=None):
+    stats = g.pop('request_stats', None)
+    if stats is None or request.endpoint == 'metrics.metrics':
+        return
+    if not stats.total:
+        stats.total = time.perf_counter() - stats.start
+    # Endpoint plutôt que chemin : nombre de séries borné
+    endpoint = request.endpoint or 'aucun'
+    status = 500 if exception is not None else g.get('response_status', 500)
+    get_registry().record(endpoint, request.method, status, stats)
+
+    warning = current_app.config.get('REQUEST_QUERY_WARNING', 30)
+    if warning and stats.queries >= warning:
+        logger.warning(f"{stats.queries} requêtes SQL pour {request.method} {request.path} ({endpoint}) : "
+                       f"requêtes N+1 ?")
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Mesures au format Prometheus"""
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        # Sans jeton, les mesures (endpoints, trafic, erreurs) ne sont publiques qu'en debug et en test
+        if not (current_app.debug or current_app.testing):
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
 from datetime import datetime
 import json
-from app import db
+from extensions import db
 
 class User(UserMixin, db.Model):
     """Modèle utilisateur"""
@@ -15,8 +16,6 @@ class User(UserMixin, db.Model):
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     is_email_verified = db.Column(db.Boolean, default=False)
-    reset_token = db.Column(db.String(100))
-    reset_token_expires = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -70,14 +69,15 @@ class Portfolio(db.Model):
     experiences = db.relationship('Experience', backref='portfolio', lazy='dynamic', cascade='all, delete-orphan')
     education = db.relationship('Education', backref='portfolio', lazy='dynamic', cascade='all, delete-orphan')
     skills = db.relationship('Skill', backref='portfolio', lazy='dynamic', cascade='all, delete-orphan')
+    search_document = db.relationship('PortfolioSearchDocument', uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Portfolio {self.public_url}>'
     
     def increment_views(self):
-        self.views_count += 1
-        self.last_viewed = datetime.utcnow()
-        db.session.commit()
+        # Les vues sont mises en tampon et écrites en lot (voir view_counter.py)
+        from view_counter import record_view
+        record_view(self.id)
 
 class Project(db.Model):
     """Modèle projet"""
@@ -169,3 +169,122 @@ class Skill(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VisitEvent(db.Model):
+    """Événement de visite d'un portfolio public (journal brut, purgé périodiquement)"""
+    __tablename__ = 'visit_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    visitor_hash = db.Column(db.String(16), nullable=False)  # IP + navigateur hachés, jamais l'IP en clair
+    referrer_host = db.Column(db.String(100))
+    ua_family = db.Column(db.String(20))
+    
+    __table_args__ = (
+        db.Index('ix_visit_events_portfolio_time', 'portfolio_id', 'occurred_at'),
+        db.Index('ix_visit_events_occurred_at', 'occurred_at'),  # purge des anciens événements
+    )
+
+class VisitRollup(db.Model):
+    """Statistiques de visites pré-agrégées par heure ou par jour"""
+    __tablename__ = 'visit_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    granularity = db.Column(db.String(5), nullable=False)  # 'hour' ou 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    views = db.Column(db.Integer, default=0)
+    unique_visitors = db.Column(db.Integer, default=0)
+    referrers = db.Column(db.Text)  # JSON {hôte: nombre}
+    user_agents = db.Column(db.Text)  # JSON {famille: nombre}
+    
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'granularity', 'bucket_start', name='uq_visit_rollups_bucket'),
+    )
+    
+    def get_referrers(self):
+        return json.loads(self.referrers) if self.referrers else {}
+    
+    def get_user_agents(self):
+        return json.loads(self.user_agents) if self.user_agents else {}
+
+class CVImport(db.Model):
+    """Import d'un CV depuis une URL, exécuté en arrière-plan (voir cv_import.py)"""
+    __tablename__ = 'cv_imports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, downloading, done, failed
+    bytes_received = db.Column(db.Integer, default=0)
+    total_bytes = db.Column(db.Integer)  # Content-Length annoncé, si connu
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(300))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'bytes_received': self.bytes_received or 0,
+            'total_bytes': self.total_bytes,
+            'attempts': self.attempts or 0,
+            'error': self.error,
+        }
+
+class Job(db.Model):
+    """Tâche de fond en attente, en cours ou terminée (voir jobs.py)"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # arguments JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # prochaine exécution
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+class PortfolioSearchDocument(db.Model):
+    """Texte indexé pour la recherche plein texte (voir search.py)"""
+    __tablename__ = 'portfolio_search_documents'
+    
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), primary_key=True)
+    content = db.Column(db.Text, nullable=False, default='')  # texte d'origine, normalisé par chaque backend
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+# Index plein texte propres à chaque base. PostgreSQL : configuration 'french_unaccent'
+# (accents retirés par l'extension unaccent, puis racinisation française)
+POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'french_unaccent') THEN "
+    "CREATE TEXT SEARCH CONFIGURATION french_unaccent (COPY = french); "
+    "ALTER TEXT SEARCH CONFIGURATION french_unaccent "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem; "
+    "END IF; END $$",
+    "CREATE INDEX ix_portfolio_search_documents_fts ON portfolio_search_documents "
+    "USING gin (to_tsvector('french_unaccent', content))",
+)
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(
+        PortfolioSearchDocument.__table__, 'after_create',
+        DDL(statement).execute_if(dialect='postgresql')
+    )
+event.listen(
+    PortfolioSearchDocument.__table__, 'after_create',
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS portfolio_search_fts "
+        "USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')").execute_if(dialect='sqlite')
+)
@@ -0,0 +1,192 @@
+"""
+Cache des pages publiques rendues
+
+Les pages publiques (/p/<public_url>) changent rarement : on garde le HTML
+rendu en cache, indexé par public_url et par variante (page complète,
+version embarquée...). Chaque route de modification du portfolio invalide
+l'entrée correspondante.
+
+L'invalidation n'atteint que le cache du processus qui l'exécute : avec le
+cache 'lru' (un par worker gunicorn), chaque entrée garde la version du
+portfolio (http_cache.portfolio_validator) pour laquelle elle a été rendue,
+et cached_entry la compare à la version en base avant de la servir (une
+requête légère, sans chargement des sections ni rendu). Le cache 'redis',
+partagé, est invalidé pour tous les workers à la fois.
+"""
+
+import gzip
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class NullPageCache:
+    """Cache désactivé : ne conserve rien"""
+
+    shared = True
+
+    def get(self, public_url, variant):
+        return None
+
+    def set(self, public_url, variant, entry):
+        pass
+
+    def invalidate(self, public_url):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUPageCache:
+    """Cache LRU en mémoire, propre à chaque processus"""
+
+    # Invalidations des autres workers invisibles : entrées vérifiées à la lecture
+    shared = False
+
+    def __init__(self, max_entries=512, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, public_url, variant):
+        key = (public_url, variant)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, public_url, variant, entry):
+        expires_at = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._entries[(public_url, variant)] = (expires_at, entry)
+            self._entries.move_to_end((public_url, variant))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, public_url):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == public_url]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisPageCache:
+    """Cache partagé entre workers et instances, stocké dans Redis"""
+
+    shared = True
+
+    def __init__(self, url, timeout=300, prefix='page:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Le paquet 'redis' est requis pour PAGE_CACHE_TYPE='redis'")
+        self._client = redis.Redis.from_url(url)
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def _key(self, public_url):
+        # Un hash par portfolio : toutes les variantes sont supprimées d'un coup
+        return f"{self.prefix}{public_url}"
+
+    def get(self, public_url, variant):
+        raw = self._client.hget(self._key(public_url), variant)
+        if raw is None:
+            return None
+        return pickle.loads(raw)
+
+    def set(self, public_url, variant, entry):
+        key = self._key(public_url)
+        pipe = self._client.pipeline()
+        pipe.hset(key, variant, pickle.dumps(entry))
+        if self.timeout:
+            pipe.expire(key, self.timeout)
+        pipe.execute()
+
+    def invalidate(self, public_url):
+        self._client.delete(self._key(public_url))
+
+    def clear(self):
+        for key in self._client.scan_iter(f"{self.prefix}*"):
+            self._client.delete(key)
+
+
+def create_page_cache(config):
+    """Créer le backend de cache à partir de la configuration"""
+    cache_type = config.get('PAGE_CACHE_TYPE', 'lru')
+    timeout = config.get('PAGE_CACHE_TIMEOUT', 300)
+
+    if cache_type == 'redis':
+        return RedisPageCache(config['PAGE_CACHE_REDIS_URL'], timeout=timeout)
+    if cache_type == 'lru':
+        return LRUPageCache(max_entries=config.get('PAGE_CACHE_MAX_ENTRIES', 512), timeout=timeout)
+    return NullPageCache()
+
+
+def get_page_cache():
+    """Récupérer le cache de l'application courante (créé au premier appel)"""
+    cache = current_app.extensions.get('page_cache')
+    if cache is None:
+        cache = create_page_cache(current_app.config)
+        current_app.extensions['page_cache'] = cache
+    return cache
+
+
+def cached_entry(public_url, variant):
+    """Entrée en cache encore à jour et version du portfolio si elle a été lue
+
+    Renvoie (entrée, None) pour un cache partagé, (entrée, version) pour un cache
+    propre au processus, (None, version ou None) si l'entrée manque ou est périmée.
+    """
+    from http_cache import portfolio_validator
+
+    cache = get_page_cache()
+    entry = cache.get(public_url, variant)
+    if entry is None or cache.shared:
+        return entry, None
+    # Le portfolio a pu être modifié (ou rendu privé) via un autre worker ou une tâche
+    validator = portfolio_validator(public_url)
+    if validator is None or validator.etag != entry.get('version'):
+        cache.invalidate(public_url)
+        return None, validator
+    return entry, validator
+
+
+def invalidate_portfolio(portfolio):
+    """Invalider toutes les pages en cache d'un portfolio"""
+    if portfolio is not None:
+        get_page_cache().invalidate(portfolio.public_url)
+
+
+def build_json_entry(portfolio_id, data):
+    """Sérialiser une réponse JSON une fois, avec son empreinte et ses versions compressées"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    entry = {
+        'portfolio_id': portfolio_id,
+        'etag': hashlib.sha256(body).hexdigest()[:32],
+        'body': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        entry['br'] = brotli.compress(body)
+    return entry
+
@@ -0,0 +1,265 @@
+"""
+Hachage des mots de passe : algorithme et coût configurables
+
+PASSWORD_HASH_METHOD choisit l'algorithme et son coût, au format des hash
+enregistrés :
+- 'scrypt:N:r:p' (défaut scrypt:32768:8:1, celui de Werkzeug 3) ;
+- 'bcrypt:ROUNDS' (paquet bcrypt) ;
+- 'argon2:TEMPS:MÉMOIRE_KO:PARALLÉLISME' (paquet argon2-cffi, s'il est
+  installé ; sinon scrypt) ;
+- 'pbkdf2:sha256:ITÉRATIONS' (hash créés jusqu'ici par Werkzeug 2.3).
+`flask benchmark passwords --target-ms 250` mesure chaque algorithme sur la
+machine et propose le coût le plus proche de la durée visée.
+
+Les hash existants restent vérifiables quel que soit leur format ; à la
+connexion, un hash dont l'algorithme ou le coût diffère de la configuration
+est recalculé avec le mot de passe qui vient d'être vérifié.
+
+Avec PASSWORD_HASH_THREADS > 0, hachage et vérification passent par un pool
+de threads de cette taille par processus : le nombre de calculs simultanés
+est borné (une rafale de connexions n'occupe pas tous les cœurs) et les
+autres threads (requêtes, tâches de fond) continuent pendant le calcul, qui
+libère le GIL. verify_password_async sert aux appelants asyncio.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Paramètres par défaut de chaque algorithme (complètent une méthode partielle)
+DEFAULT_PARAMS = {
+    'scrypt': ('32768', '8', '1'),
+    'bcrypt': ('12',),
+    'argon2': ('3', '65536', '4'),
+    'pbkdf2': ('sha256', '600000'),
+}
+
+BCRYPT_RE = re.compile(r'^\$2[aby]\$(\d\d)\$')
+ARGON2_RE = re.compile(r'^\$argon2id\$v=\d+\$m=(\d+),t=(\d+),p=(\d+)\$')
+
+# bcrypt ne tient compte que des 72 premiers octets
+BCRYPT_MAX_BYTES = 72
+
+
+def _argon2():
+    try:
+        import argon2
+    except ImportError:
+        return None
+    return argon2
+
+
+def normalize_method(method):
+    """Méthode complète ('scrypt' -> 'scrypt:32768:8:1')"""
+    algorithm, *params = method.split(':')
+    if algorithm not in DEFAULT_PARAMS:
+        raise ValueError(f"Algorithme de hachage inconnu : {algorithm}")
+    defaults = DEFAULT_PARAMS[algorithm]
+    return ':'.join([algorithm, *params, *defaults[len(params):]])
+
+
+def stored_method(password_hash):
+    """Méthode d'un hash enregistré, au format de PASSWORD_HASH_METHOD"""
+    match = BCRYPT_RE.match(password_hash)
+    if match:
+        return f'bcrypt:{int(match.group(1))}'
+    match = ARGON2_RE.match(password_hash)
+    if match:
+        memory, time_cost, parallelism = match.groups()
+        return f'argon2:{time_cost}:{memory}:{parallelism}'
+    # Format Werkzeug : méthode$sel$hash
+    return password_hash.split('$', 1)[0]
+
+
+def hash_with(method, password):
+    """Hacher un mot de passe avec une méthode complète"""
+    algorithm, *params = method.split(':')
+    if algorithm == 'bcrypt':
+        import bcrypt
+        salt = bcrypt.gensalt(rounds=int(params[0]))
+        return bcrypt.hashpw(password.encode('utf-8')[:BCRYPT_MAX_BYTES], salt).decode('ascii')
+    if algorithm == 'argon2':
+        argon2 = _argon2()
+        time_cost, memory_cost, parallelism = (int(value) for value in params)
+        return argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                                     parallelism=parallelism).hash(password)
+    return generate_password_hash(password, method)
+
+
+def check_hash(password_hash, password):
+    """Le mot de passe correspond-il au hash (tout format connu) ?"""
+    if not password_hash:
+        return False
+    if BCRYPT_RE.match(password_hash):
+        import bcrypt
+        return bcrypt.checkpw(password.encode('utf-8')[:BCRYPT_MAX_BYTES], password_hash.encode('ascii'))
+    if password_hash.startswith('$argon2'):
+        argon2 = _argon2()
+        if argon2 is None:
+            logger.error("Hash argon2 enregistré mais argon2-cffi n'est pas installé")
+            return False
+        try:
+            return argon2.PasswordHasher().verify(password_hash, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    try:
+        return check_password_hash(password_hash, password)
+    except ValueError:
+        # Méthode inconnue de Werkzeug
+        return False
+
+
+class PasswordHasher:
+    """Méthode configurée et pool de threads des calculs de hash"""
+
+    def __init__(self, method='scrypt', threads=0):
+        method = normalize_method(method)
+        if method.startswith('argon2:') and _argon2() is None:
+            logger.warning("argon2-cffi non installé : mots de passe hachés avec scrypt")
+            method = normalize_method('scrypt')
+        self.method = method
+        self.threads = threads
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        if not self.threads:
+            return func(*args)
+        return self._get_executor().submit(func, *args).result()
+
+    def _get_executor(self):
+        # Un pool par processus : les workers gunicorn ne partagent pas celui du maître
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='password')
+                    self._pid = os.getpid()
+                    atexit.register(self.stop)
+        return self._executor
+
+    def stop(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pid = None
+
+    def hash(self, password):
+        return self._run(hash_with, self.method, password)
+
+    def verify(self, password_hash, password):
+        return self._run(check_hash, password_hash, password)
+
+    async def verify_async(self, password_hash, password):
+        # Sans pool dédié : celui de la boucle
+        executor = self._get_executor() if self.threads else None
+        return await asyncio.get_running_loop().run_in_executor(executor, check_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return stored_method(password_hash) != self.method
+
+
+def get_hasher():
+    """Récupérer le hacheur de l'application courante (créé au premier appel)"""
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = PasswordHasher(
+            current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+            threads=current_app.config.get('PASSWORD_HASH_THREADS', 0),
+        )
+        current_app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def hash_password(password):
+    """Hash d'un nouveau mot de passe, avec la méthode configurée"""
+    return get_hasher().hash(password)
+
+
+def verify_password(password_hash, password):
+    """Vérifier un mot de passe contre un hash enregistré"""
+    return get_hasher().verify(password_hash, password)
+
+
+async def verify_password_async(password_hash, password):
+    """Comme verify_password, sans bloquer la boucle asyncio"""
+    return await get_hasher().verify_async(password_hash, password)
+
+
+def authenticate(user, password):
+    """Vérifier le mot de passe d'un compte ; le hash est recalculé (et enregistré) s'il est périmé"""
+    from models import db
+
+    hasher = get_hasher()
+    if not hasher.verify(user.password_hash, password):
+        return False
+    if hasher.needs_rehash(user.password_hash):
+        previous = stored_method(user.password_hash)
+        try:
+            user.password_hash = hasher.hash(password)
+            db.session.commit()
+            logger.info(f"Hash du compte {user.id} mis à jour ({previous} -> {hasher.method})")
+        except Exception as e:
+            # La connexion aboutit quand même ; nouvel essai à la prochaine
+            db.session.rollback()
+            logger.error(f"Mise à jour du hash du compte {user.id} impossible : {e}")
+    return True
+
+
+# --- Calibrage -------------------------------------------------------------
+
+def measure(method, password='correct horse battery staple', runs=3):
+    """Durée médiane d'un hachage avec une méthode complète, en millisecondes"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        hash_with(method, password)
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def _candidates(algorithm):
+    # Coûts croissants ; la mémoire de scrypt (128 * N * r) et d'argon2 reste fixée
+    if algorithm == 'scrypt':
+        return [f'scrypt:{2 ** exponent}:8:1' for exponent in range(12, 19)]
+    if algorithm == 'bcrypt':
+        return [f'bcrypt:{rounds}' for rounds in range(8, 17)]
+    if algorithm == 'argon2':
+        return [f'argon2:{time_cost}:65536:4' for time_cost in range(1, 11)]
+    if algorithm == 'pbkdf2':
+        return [f'pbkdf2:sha256:{iterations}' for iterations in
+                (100000, 200000, 300000, 400000, 600000, 800000, 1200000, 1600000, 2400000)]
+    raise ValueError(f"Algorithme de hachage inconnu : {algorithm}")
+
+
+def calibrate(algorithm, target_ms, runs=3):
+    """Mesurer les coûts croissants d'un algorithme ; renvoie (méthode la plus proche de target_ms, mesures)"""
+    measurements = []
+    for method in _candidates(algorithm):
+        elapsed = measure(method, runs=runs)
+        measurements.append((method, elapsed))
+        if elapsed >= target_ms:
+            break
+    best = min(measurements, key=lambda item: abs(item[1] - target_ms))[0]
+    return best, measurements
+
+
+def available_algorithms():
+    """Algorithmes utilisables sur cette installation"""
+    algorithms = ['scrypt', 'bcrypt', 'pbkdf2']
+    try:
+        import bcrypt  # noqa: F401
+    except ImportError:
+        algorithms.remove('bcrypt')
+    if _argon2() is not None:
+        algorithms.insert(0, 'argon2')
+    return algorithms
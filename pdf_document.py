@@ -0,0 +1,173 @@
+"""
+Écriture de documents PDF simples (texte, titres, filets, couleurs)
+
+Générateur minimal sans dépendance : polices standard PDF (Helvetica, Times,
+Courier) en WinAnsiEncoding, ce qui couvre les caractères accentués du
+français, mise en page par curseur avec retour à la ligne et sauts de page
+automatiques, flux de contenu compressés.
+"""
+
+import unicodedata
+import zlib
+
+PAGE_WIDTH = 595.28  # A4, en points
+PAGE_HEIGHT = 841.89
+
+# Familles de polices standard : (normale, grasse)
+FONT_FAMILIES = {
+    'helvetica': ('Helvetica', 'Helvetica-Bold'),
+    'times': ('Times-Roman', 'Times-Bold'),
+    'courier': ('Courier', 'Courier-Bold'),
+}
+
+# Chasses Helvetica (millièmes de corps) pour les caractères 32 à 126
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+
+def hex_to_rgb(value, default=(0, 0, 0)):
+    """'#3B82F6' -> (r, g, b) entre 0 et 1"""
+    value = (value or '').lstrip('#')
+    if len(value) != 6:
+        return default
+    try:
+        return tuple(int(value[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    except ValueError:
+        return default
+
+
+def _char_width(char, bold):
+    code = ord(char)
+    if not 32 <= code <= 126:
+        # Lettre accentuée : chasse de la lettre de base
+        base = unicodedata.normalize('NFKD', char)[:1]
+        code = ord(base) if base and 32 <= ord(base) <= 126 else ord('n')
+    width = _HELVETICA_WIDTHS[code - 32]
+    # Les graisses sont un peu plus larges ; Times est plus étroit (marge de sécurité)
+    return width * 1.06 if bold else width
+
+
+def text_width(text, size, family='helvetica', bold=False):
+    """Largeur approximative d'un texte, en points"""
+    if family == 'courier':
+        return len(text) * 600 * size / 1000
+    return sum(_char_width(char, bold) for char in text) * size / 1000
+
+
+def _escape(text):
+    data = text.encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PDFDocument:
+    """Document PDF construit ligne par ligne, de haut en bas"""
+
+    def __init__(self, title='', family='helvetica', margin=50):
+        self.title = title
+        self.family = family if family in FONT_FAMILIES else 'helvetica'
+        self.margin = margin
+        self.pages = []
+        self._stream = None
+        self.y = 0
+        self.new_page()
+
+    @property
+    def width(self):
+        """Largeur utile de la page"""
+        return PAGE_WIDTH - 2 * self.margin
+
+    def new_page(self):
+        self._stream = []
+        self.pages.append(self._stream)
+        self.y = PAGE_HEIGHT - self.margin
+
+    def ensure_space(self, height):
+        """Passer à la page suivante s'il reste moins de height points"""
+        if self.y - height < self.margin:
+            self.new_page()
+
+    def space(self, height):
+        """Espace vertical"""
+        self.y -= height
+
+    def text(self, text, size=10, bold=False, color=(0, 0, 0), indent=0, leading=1.35, marker=None):
+        """Paragraphe avec retour à la ligne automatique (marker : puce devant la première ligne)"""
+        font = b'F2' if bold else b'F1'
+        for number, line in enumerate(self.wrap(text, size, bold, self.width - indent)):
+            self.ensure_space(size * leading)
+            self.y -= size * leading
+            if marker and number == 0:
+                self._draw(font, size, color, self.margin + indent - size, marker)
+            self._draw(font, size, color, self.margin + indent, line)
+
+    def _draw(self, font, size, color, x, text):
+        self._stream.append(b'BT /%s %.2f Tf %.3f %.3f %.3f rg %.2f %.2f Td (%s) Tj ET' % (
+            font, size, *color, x, self.y, _escape(text)
+        ))
+
+    def rule(self, color=(0.8, 0.8, 0.8), thickness=0.8):
+        """Filet horizontal sur toute la largeur"""
+        self.ensure_space(thickness + 4)
+        self.y -= 4
+        self._stream.append(b'%.3f %.3f %.3f RG %.2f w %.2f %.2f m %.2f %.2f l S' % (
+            *color, thickness, self.margin, self.y, PAGE_WIDTH - self.margin, self.y
+        ))
+
+    def wrap(self, text, size, bold, width):
+        """Découper un texte en lignes tenant dans width"""
+        lines = []
+        for paragraph in (text or '').splitlines() or ['']:
+            line = ''
+            for word in paragraph.split(' '):
+                candidate = f'{line} {word}' if line else word
+                if line and text_width(candidate, size, self.family, bold) > width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            lines.append(line)
+        return lines
+
+    def build(self):
+        """Sérialiser le document ; renvoie les octets du PDF"""
+        regular, bold = FONT_FAMILIES[self.family]
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            None,  # pages, complété plus bas
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % regular.encode(),
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % bold.encode(),
+            b'<< /Title (%s) /Producer (Portfolio Builder) >>' % _escape(self.title),
+        ]
+        page_ids = []
+        for stream in self.pages:
+            content = zlib.compress(b'\n'.join(stream))
+            objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content))
+            objects.append(
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+                b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>' % (
+                    PAGE_WIDTH, PAGE_HEIGHT, len(objects)
+                )
+            )
+            page_ids.append(len(objects))
+        objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page_id for page_id in page_ids), len(page_ids)
+        )
+
+        output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(output))
+            output += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        xref = len(output)
+        output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        output += b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(objects) + 1, xref
+        )
+        return bytes(output)
@@ -1,9 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, send_from_directory, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
-from models import User, Portfolio, Project, Experience, Education, Skill, db
-from forms import PortfolioForm, ProjectForm, ExperienceForm, EducationForm, SkillForm, CVUploadForm, CVImportForm, ThemeForm
-import os
+from models import Portfolio, Project, Experience, Education, Skill, CVImport, db
+from forms import (PortfolioForm, ProjectForm, ExperienceForm, EducationForm, SkillForm, CVUploadForm, CVImportForm,
+                   ResumeImportForm, ResumeConfirmForm, ThemeForm)
+from page_cache import invalidate_portfolio
+from analytics import get_dashboard
+import search
+from repository import load_portfolio
+from images import save_image
+from cv_import import start_import, retry_import
+from file_serving import save_upload
+from cv_generator import send_generated_cv
+from cv_parser import (ResumeParseError, extract_text, parse_resume, store_preview, load_preview,
+                       discard_preview, mark_duplicates, import_resume)
+from http_cache import portfolio_validator
+from bulk_edit import BulkEditError, apply_bulk_edit
+from ratelimit import rate_limit
 import json
 import secrets
 from datetime import datetime
@@ -19,18 +31,15 @@ def dashboard():
         # Créer un portfolio par défaut
         portfolio = create_default_portfolio(current_user)
     
-    # Récupérer les données pour les compteurs
-    projects = portfolio.projects.all()
-    experiences = portfolio.experiences.all()
-    education = portfolio.education.all()
-    skills = portfolio.skills.all()
+    # Récupérer les données pour les compteurs (sections chargées en une requête)
+    snapshot = load_portfolio(portfolio_id=portfolio.id)
     
     return render_template('portfolio/dashboard.html', 
-                         portfolio=portfolio,
-                         projects=projects,
-                         experiences=experiences,
-                         education=education,
-                         skills=skills)
+                         portfolio=snapshot,
+                         projects=snapshot.projects,
+                         experiences=snapshot.experiences,
+                         education=snapshot.education,
+                         skills=snapshot.skills)
 
 @portfolio_bp.route('/edit', methods=['GET', 'POST'])
 @login_required
@@ -57,6 +66,7 @@ def edit():
                 portfolio.profile_image = filename
         
         db.session.commit()
+        invalidate_portfolio(portfolio)
         flash('Portfolio mis à jour avec succès !', 'success')
         return redirect(url_for('portfolio.dashboard'))
     
@@ -97,9 +107,11 @@ def add_project():
             featured=form.featured.data,
             order_index=portfolio.projects.count()
         )
+        project.set_images_list(save_project_images(form.images.data, portfolio))
         
         db.session.add(project)
         db.session.commit()
+        invalidate_portfolio(portfolio)
         
         flash('Projet ajouté avec succès !', 'success')
         return redirect(url_for('portfolio.projects'))
@@ -133,7 +145,13 @@ def edit_project(project_id):
         technologies = [tech.strip() for tech in form.technologies.data.split(',') if tech.strip()]
         project.technologies = json.dumps(technologies)
         
+        # Les nouvelles images s'ajoutent aux existantes
+        images = save_project_images(form.images.data, current_user.portfolio)
+        if images:
+            project.set_images_list(project.get_images_list() + images)
+        
         db.session.commit()
+        invalidate_portfolio(current_user.portfolio)
         flash('Projet mis à jour avec succès !', 'success')
         return redirect(url_for('portfolio.projects'))
     
@@ -147,6 +165,7 @@ def delete_project(project_id):
     
     db.session.delete(project)
     db.session.commit()
+    invalidate_portfolio(current_user.portfolio)
     
     flash('Projet supprimé avec succès !', 'success')
     return redirect(url_for('portfolio.projects'))
@@ -187,6 +206,7 @@ def add_experience():
         
         db.session.add(experience)
         db.session.commit()
+        invalidate_portfolio(portfolio)
         
         flash('Expérience ajoutée avec succès !', 'success')
         return redirect(url_for('portfolio.experiences'))
@@ -210,6 +230,7 @@ def edit_experience(exp_id):
         experience.description = form.description.data
         
         db.session.commit()
+        invalidate_portfolio(current_user.portfolio)
         flash('Expérience mise à jour avec succès !', 'success')
         return redirect(url_for('portfolio.experiences'))
     
@@ -223,6 +244,7 @@ def delete_experience(exp_id):
     
     db.session.delete(experience)
     db.session.commit()
+    invalidate_portfolio(current_user.portfolio)
     
     flash('Expérience supprimée avec succès !', 'success')
     return redirect(url_for('portfolio.experiences'))
@@ -263,6 +285,7 @@ def add_education():
         
         db.session.add(education)
         db.session.commit()
+        invalidate_portfolio(portfolio)
         
         flash('Formation ajoutée avec succès !', 'success')
         return redirect(url_for('portfolio.education'))
@@ -301,6 +324,7 @@ def add_skill():
         
         db.session.add(skill)
         db.session.commit()
+        invalidate_portfolio(portfolio)
         
         flash('Compétence ajoutée avec succès !', 'success')
         return redirect(url_for('portfolio.skills'))
@@ -320,6 +344,7 @@ def edit_skill(skill_id):
         skill.category = form.category.data
         
         db.session.commit()
+        invalidate_portfolio(current_user.portfolio)
         flash('Compétence mise à jour avec succès !', 'success')
         return redirect(url_for('portfolio.skills'))
     
@@ -333,6 +358,7 @@ def delete_skill(skill_id):
     
     db.session.delete(skill)
     db.session.commit()
+    invalidate_portfolio(current_user.portfolio)
     
     flash('Compétence supprimée avec succès !', 'success')
     return redirect(url_for('portfolio.skills'))
@@ -354,6 +380,7 @@ def edit_education(edu_id):
         education.description = form.description.data
         
         db.session.commit()
+        invalidate_portfolio(current_user.portfolio)
         flash('Formation mise à jour avec succès !', 'success')
         return redirect(url_for('portfolio.education'))
     
@@ -367,12 +394,35 @@ def delete_education(edu_id):
     
     db.session.delete(education)
     db.session.commit()
+    invalidate_portfolio(current_user.portfolio)
     
     flash('Formation supprimée avec succès !', 'success')
     return redirect(url_for('portfolio.education'))
 
+@portfolio_bp.route('/<any(projects, experiences, education, skills):section>/bulk', methods=['POST'])
+@login_required
+def bulk_edit(section):
+    """Réorganiser et/ou modifier plusieurs éléments d'une section (JSON : order, items)"""
+    portfolio = current_user.portfolio
+    if not portfolio:
+        portfolio = create_default_portfolio(current_user)
+    
+    # JSON uniquement : un autre site ne peut pas envoyer ce type de requête sans pré-vérification CORS
+    payload = request.get_json(silent=True) if request.is_json else None
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Requête JSON attendue'}), 400
+    
+    try:
+        result = apply_bulk_edit(portfolio, section, payload.get('order'), payload.get('items'))
+    except BulkEditError as e:
+        return jsonify({'error': str(e)}), 400
+    # Un seul commit, une seule invalidation pour toute la section
+    invalidate_portfolio(portfolio)
+    return jsonify(result)
+
 @portfolio_bp.route('/cv', methods=['GET', 'POST'])
 @login_required
+@rate_limit('RATELIMIT_CV_IMPORT', key='user')
 def cv():
     """Gestion du CV"""
     portfolio = current_user.portfolio
@@ -390,48 +440,109 @@ def cv():
                 portfolio.cv_url = f"/uploads/cv/{filename}"
                 portfolio.cv_uploaded_at = datetime.utcnow()
                 db.session.commit()
+                invalidate_portfolio(portfolio)
                 flash('CV téléchargé avec succès !', 'success')
                 return redirect(url_for('portfolio.cv'))
     
     if import_form.validate_on_submit():
-        # Import de CV depuis une URL
-        import requests
+        # Import de CV depuis une URL, téléchargé en arrière-plan
+        start_import(portfolio, import_form.cv_url.data, import_form.cv_name.data)
+        flash('Import du CV lancé, vous pouvez suivre sa progression ci-dessous.', 'info')
+        return redirect(url_for('portfolio.cv'))
+    
+    # Dernier import non terminé, suivi depuis la page
+    imports = CVImport.query.filter(CVImport.portfolio_id == portfolio.id, CVImport.status != 'done')
+    if portfolio.cv_uploaded_at:
+        imports = imports.filter(CVImport.created_at > portfolio.cv_uploaded_at)
+    cv_import = imports.order_by(CVImport.id.desc()).first()
+    
+    return render_template('portfolio/cv.html', form=form, import_form=import_form, portfolio=portfolio,
+                         cv_import=cv_import)
+
+@portfolio_bp.route('/cv/import/<int:import_id>')
+@login_required
+def cv_import_status(import_id):
+    """État d'un import de CV (interrogé par la page CV)"""
+    cv_import = CVImport.query.filter_by(id=import_id, portfolio_id=current_user.portfolio.id).first_or_404()
+    return jsonify(cv_import.to_dict())
+
+@portfolio_bp.route('/cv/import/<int:import_id>/retry', methods=['POST'])
+@login_required
+def retry_cv_import(import_id):
+    """Relancer un import de CV échoué"""
+    cv_import = CVImport.query.filter_by(id=import_id, portfolio_id=current_user.portfolio.id).first_or_404()
+    if cv_import.status == 'failed':
+        retry_import(cv_import)
+        flash('Import du CV relancé.', 'info')
+    return redirect(url_for('portfolio.cv'))
+
+@portfolio_bp.route('/cv/generated.<any(pdf, txt, md):fmt>')
+@login_required
+def generated_cv(fmt):
+    """CV généré à partir du portfolio, y compris s'il n'est pas public"""
+    portfolio = current_user.portfolio
+    if not portfolio:
+        portfolio = create_default_portfolio(current_user)
+    
+    validator = portfolio_validator(portfolio_id=portfolio.id, public_only=False)
+    return send_generated_cv(validator, fmt, policy='private', as_attachment='download' in request.args)
+
+@portfolio_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@rate_limit('RATELIMIT_CV_IMPORT', key='user')
+def import_cv():
+    """Remplir le portfolio à partir d'un CV existant (analyse, puis relecture)"""
+    form = ResumeImportForm()
+    
+    if form.validate_on_submit():
         try:
-            response = requests.get(import_form.cv_url.data, timeout=30)
-            if response.status_code == 200:
-                # Vérifier que c'est un PDF
-                if response.headers.get('content-type', '').startswith('application/pdf'):
-                    # Générer un nom de fichier unique
-                    filename = import_form.cv_name.data or f"imported_cv_{current_user.id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.pdf"
-                    filename = secure_filename(filename)
-                    
-                    # Créer le dossier s'il n'existe pas
-                    cv_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'cv')
-                    os.makedirs(cv_folder, exist_ok=True)
-                    
-                    # Sauvegarder le fichier
-                    file_path = os.path.join(cv_folder, filename)
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    # Mettre à jour le portfolio
-                    portfolio.cv_filename = filename
-                    portfolio.cv_url = f"/uploads/cv/{filename}"
-                    portfolio.cv_uploaded_at = datetime.utcnow()
-                    db.session.commit()
-                    
-                    flash('CV importé avec succès !', 'success')
-                    return redirect(url_for('portfolio.cv'))
-                else:
-                    flash('Le fichier doit être un PDF.', 'error')
+            if form.resume_file.data and form.resume_file.data.filename:
+                text = extract_text(form.resume_file.data)
             else:
-                flash('Impossible de télécharger le fichier depuis cette URL.', 'error')
-        except requests.RequestException as e:
-            flash(f'Erreur lors du téléchargement : {str(e)}', 'error')
-        except Exception as e:
-            flash(f'Erreur lors de l\'import : {str(e)}', 'error')
+                text = form.resume_text.data
+        except ResumeParseError as e:
+            flash(str(e), 'error')
+        else:
+            data = parse_resume(text)
+            if any(data[section] for section in ('experiences', 'education', 'skills', 'projects')):
+                discard_preview(session.pop('resume_import', None))
+                session['resume_import'] = store_preview(data)
+                return redirect(url_for('portfolio.import_cv_preview'))
+            flash('Aucune expérience, formation, compétence ou projet reconnu dans ce CV.', 'error')
+    
+    return render_template('portfolio/import_cv.html', form=form)
+
+@portfolio_bp.route('/import/preview', methods=['GET', 'POST'])
+@login_required
+def import_cv_preview():
+    """Relire les éléments extraits du CV et enregistrer ceux retenus"""
+    token = session.get('resume_import')
+    data = load_preview(token)
+    if data is None:
+        flash('Analyse du CV expirée, veuillez le renvoyer.', 'info')
+        return redirect(url_for('portfolio.import_cv'))
     
-    return render_template('portfolio/cv.html', form=form, import_form=import_form, portfolio=portfolio)
+    portfolio = current_user.portfolio
+    if not portfolio:
+        portfolio = create_default_portfolio(current_user)
+    
+    form = ResumeConfirmForm()
+    if form.validate_on_submit():
+        if form.submit.data:
+            selection = {section: [int(index) for index in request.form.getlist(section) if index.isdigit()]
+                         for section in ('experiences', 'education', 'skills', 'projects')}
+            selection.update({key: True for key in ('contact', 'bio') if request.form.get(key)})
+            # Tous les éléments en une transaction
+            counts = import_resume(portfolio, data, selection)
+            invalidate_portfolio(portfolio)
+            flash(f"CV importé : {counts['experiences']} expérience(s), {counts['education']} formation(s), "
+                  f"{counts['skills']} compétence(s), {counts['projects']} projet(s).", 'success')
+        session.pop('resume_import', None)
+        discard_preview(token)
+        return redirect(url_for('portfolio.dashboard'))
+    
+    return render_template('portfolio/import_cv_preview.html', form=form, data=mark_duplicates(portfolio, data),
+                         portfolio=portfolio)
 
 @portfolio_bp.route('/theme', methods=['GET', 'POST'])
 @login_required
@@ -450,6 +561,7 @@ def theme():
         portfolio.theme_layout = form.layout.data
         
         db.session.commit()
+        invalidate_portfolio(portfolio)
         flash('Thème mis à jour avec succès !', 'success')
         return redirect(url_for('portfolio.theme'))
     
@@ -470,21 +582,11 @@ def preview():
 def search_portfolios():
     """Rechercher des portfolios publics"""
     query = request.form.get('query', '') if request.method == 'POST' else request.args.get('q', '')
-    portfolios = []
-    
-    if query:
-        # Rechercher par nom d'utilisateur, nom complet, ou bio
-        portfolios = Portfolio.query.join(User).filter(
-            Portfolio.is_public == True,
-            db.or_(
-                User.username.contains(query),
-                User.first_name.contains(query),
-                User.last_name.contains(query),
-                Portfolio.bio.contains(query)
-            )
-        ).limit(20).all()
-    
-    return render_template('portfolio/search.html', portfolios=portfolios, query=query)
+    
+    # Recherche plein texte partagée avec la page publique
+    results = search.search_portfolios(query, page=request.args.get('page', 1, type=int))
+    
+    return render_template('portfolio/search.html', portfolios=results.items, results=results, query=query)
 
 @portfolio_bp.route('/analytics')
 @login_required
@@ -494,10 +596,11 @@ def analytics():
     if not portfolio:
         portfolio = create_default_portfolio(current_user)
     
-    # Récupérer les informations des visiteurs depuis la session
-    visitors = session.get('visitors', [])
+    # Statistiques pré-agrégées par jour et par heure
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    stats = get_dashboard(portfolio.id, days=days)
     
-    return render_template('portfolio/analytics.html', portfolio=portfolio, visitors=visitors)
+    return render_template('portfolio/analytics.html', portfolio=portfolio, stats=stats)
 
 def create_default_portfolio(user):
     """Créer un portfolio par défaut pour un utilisateur"""
@@ -520,23 +623,26 @@ def create_default_portfolio(user):
     return portfolio
 
 def save_profile_image(file):
-    """Sauvegarder l'image de profil"""
-    if file and allowed_file(file.filename, {'png', 'jpg', 'jpeg', 'gif'}):
-        filename = secure_filename(file.filename)
-        filename = f"profile_{current_user.id}_{secrets.token_hex(8)}_{filename}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'images', filename)
-        file.save(filepath)
-        return filename
+    """Sauvegarder l'image de profil (variantes générées en arrière-plan)"""
+    if file and allowed_file(file.filename, {'png', 'jpg', 'jpeg', 'gif', 'webp'}):
+        portfolio = current_user.portfolio
+        return save_image(file, 'profile', portfolio_id=portfolio.id)
     return None
 
+def save_project_images(files, portfolio):
+    """Sauvegarder les images d'un projet ; renvoie la liste des noms enregistrés"""
+    names = []
+    for file in files or []:
+        if file and file.filename and allowed_file(file.filename, {'png', 'jpg', 'jpeg', 'gif', 'webp'}):
+            name = save_image(file, 'project', portfolio_id=portfolio.id)
+            if name and name not in names:
+                names.append(name)
+    return names
+
 def save_cv_file(file):
-    """Sauvegarder le fichier CV"""
+    """Sauvegarder le fichier CV (nommé d'après l'empreinte de son contenu)"""
     if file and allowed_file(file.filename, {'pdf'}):
-        filename = secure_filename(file.filename)
-        filename = f"cv_{current_user.id}_{secrets.token_hex(8)}_{filename}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'cv', filename)
-        file.save(filepath)
-        return filename
+        return save_upload(file, 'cv', 'pdf')
     return None
 
 def allowed_file(filename, allowed_extensions):
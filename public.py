@@ -1,74 +1,58 @@
-from flask import Blueprint, render_template, request, send_from_directory, current_app, abort, session
-from models import Portfolio, Project, Experience, Education, Skill, User, db
-import json
-import requests
-from datetime import datetime
+from flask import Blueprint, render_template, request, abort, session, Response
+from flask_login import current_user
+from models import Portfolio
+from page_cache import get_page_cache, cached_entry, build_json_entry
+from http_cache import (portfolio_validator, is_fresh, not_modified, conditional_response,
+                        apply_validators, send_json_entry)
+from view_counter import record_view
+from analytics import record_visit
+from repository import load_portfolio_or_404
+from images import responsive_image
+from file_serving import content_key
+from storage import get_storage
+from cv_generator import send_generated_cv
+import search
+import hashlib
 
 public_bp = Blueprint('public', __name__)
+public_bp.add_app_template_global(responsive_image)
 
 @public_bp.route('/search')
 def search_portfolios():
     """Rechercher des portfolios publics (page publique)"""
     query = request.args.get('q', '')
-    portfolios = []
-    
-    if query:
-        # Rechercher par nom d'utilisateur, nom complet, ou bio
-        portfolios = Portfolio.query.join(User).filter(
-            Portfolio.is_public == True,
-            db.or_(
-                User.username.contains(query),
-                User.first_name.contains(query),
-                User.last_name.contains(query),
-                Portfolio.bio.contains(query)
-            )
-        ).limit(20).all()
-    
-    return render_template('public/search.html', portfolios=portfolios, query=query)
+    
+    # Recherche plein texte : noms, bio, projets, technologies, compétences, expériences
+    results = search.search_portfolios(query, page=request.args.get('page', 1, type=int))
+    
+    return render_template('public/search.html', portfolios=results.items, results=results, query=query)
 
 @public_bp.route('/<public_url>')
 def view_portfolio(public_url):
     """Voir un portfolio public"""
-    portfolio = Portfolio.query.filter_by(public_url=public_url, is_public=True).first_or_404()
-    
-    # Incrémenter le compteur de vues seulement si l'utilisateur n'a pas encore visité ce portfolio dans cette session
-    viewed_key = f'viewed_{portfolio.id}'
-    if not session.get(viewed_key, False):
-        portfolio.increment_views()
-        session[viewed_key] = True
-        
-        # Enregistrer les informations du visiteur
-        visitor_info = {
-            'ip': request.remote_addr,
-            'user_agent': request.headers.get('User-Agent', ''),
-            'referrer': request.headers.get('Referer', ''),
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        # Stocker les informations du visiteur dans la session
-        if 'visitors' not in session:
-            session['visitors'] = []
-        session['visitors'].append(visitor_info)
-    
-    # Récupérer toutes les données du portfolio
-    projects = portfolio.projects.order_by(Project.order_index).all()
-    experiences = portfolio.experiences.order_by(Experience.order_index).all()
-    education = portfolio.education.order_by(Education.order_index).all()
-    skills = portfolio.skills.order_by(Skill.order_index).all()
-    
-    # Grouper les compétences par catégorie
-    skills_by_category = {}
-    for skill in skills:
-        if skill.category not in skills_by_category:
-            skills_by_category[skill.category] = []
-        skills_by_category[skill.category].append(skill)
-    
-    return render_template('public/portfolio.html', 
-                         portfolio=portfolio,
-                         projects=projects,
-                         experiences=experiences,
-                         education=education,
-                         skills_by_category=skills_by_category)
+    cached, validator = cached_entry(public_url, 'portfolio')
+    if cached is not None:
+        register_visit(cached['portfolio_id'], track_visitor=True)
+        return conditional_response(cached['html'], cached['etag'], cached['last_modified'], 'portfolio')
+    
+    # Version du portfolio : 304 sans charger les sections ni rendre le template
+    validator = validator or portfolio_validator(public_url) or abort(404)
+    register_visit(validator.portfolio_id, track_visitor=True)
+    if is_fresh(validator.etag, validator.last_modified):
+        return not_modified(validator.etag, validator.last_modified, 'portfolio')
+    
+    # Portfolio, utilisateur et sections en deux requêtes
+    portfolio = load_portfolio_or_404(public_url=public_url, public_only=True)
+    
+    html = render_portfolio_page(portfolio)
+    get_page_cache().set(public_url, 'portfolio', {
+        'portfolio_id': portfolio.id,
+        'version': validator.etag,
+        'html': html,
+        'etag': validator.etag,
+        'last_modified': validator.last_modified
+    })
+    return conditional_response(html, validator.etag, validator.last_modified, 'portfolio')
 
 @public_bp.route('/<public_url>/cv')
 def download_cv(public_url):
@@ -78,27 +62,111 @@ def download_cv(public_url):
     if not portfolio.cv_filename:
         abort(404)
     
-    try:
-        return send_from_directory(
-            os.path.join(current_app.config['UPLOAD_FOLDER'], 'cv'),
-            portfolio.cv_filename,
-            as_attachment=True,
-            download_name=f"CV_{portfolio.user.get_full_name().replace(' ', '_')}.pdf"
-        )
-    except FileNotFoundError:
-        abort(404)
+    # Le nom de fichier change à chaque nouvel envoi de CV (empreinte du contenu)
+    etag = content_key(portfolio.cv_filename) or \
+        hashlib.sha1(portfolio.cv_filename.encode('utf-8')).hexdigest()[:20]
+    return get_storage().serve(
+        f'cv/{portfolio.cv_filename}',
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"CV_{portfolio.user.get_full_name().replace(' ', '_')}.pdf",
+        etag=etag,
+        last_modified=portfolio.cv_uploaded_at,
+        policy='cv'
+    )
+
+@public_bp.route('/<public_url>/cv.<any(pdf, txt, md):fmt>')
+def generated_cv(public_url, fmt):
+    """CV généré à partir des données du portfolio (rendu une fois par version)"""
+    validator = portfolio_validator(public_url) or abort(404)
+    return send_generated_cv(validator, fmt, policy='cv')
 
 @public_bp.route('/<public_url>/api')
 def portfolio_api(public_url):
     """API JSON pour récupérer les données du portfolio"""
-    portfolio = Portfolio.query.filter_by(public_url=public_url, is_public=True).first_or_404()
-    
-    # Incrémenter le compteur de vues seulement si l'utilisateur n'a pas encore visité ce portfolio dans cette session
-    viewed_key = f'viewed_{portfolio.id}'
-    if not session.get(viewed_key, False):
-        portfolio.increment_views()
-        session[viewed_key] = True
-    
+    # JSON sérialisé et compressé une seule fois, jusqu'à la prochaine modification
+    entry, validator = cached_entry(public_url, 'api')
+    if entry is None:
+        validator = validator or portfolio_validator(public_url) or abort(404)
+        # L'ETag de l'API est l'empreinte du contenu : sans lui, seul If-Modified-Since
+        # permet de répondre 304 avant de reconstruire le JSON
+        if not request.if_none_match and is_fresh(last_modified=validator.last_modified):
+            register_visit(validator.portfolio_id)
+            return not_modified(None, validator.last_modified, 'api')
+        
+        portfolio = load_portfolio_or_404(public_url=public_url, public_only=True)
+        entry = build_json_entry(portfolio.id, portfolio_payload(portfolio))
+        entry['version'] = validator.etag
+        entry['last_modified'] = validator.last_modified
+        get_page_cache().set(public_url, 'api', entry)
+    
+    register_visit(entry['portfolio_id'])
+    return send_json_entry(entry)
+
+@public_bp.route('/<public_url>/embed')
+def embed_portfolio(public_url):
+    """Version embarquée du portfolio (iframe)"""
+    # embed.html hérite de base.html (menu utilisateur, messages flash) :
+    # seul le rendu anonyme est partageable entre visiteurs
+    has_flashes = bool(session.get('_flashes'))
+    cacheable = not current_user.is_authenticated and not has_flashes
+    validator = None
+    if cacheable:
+        cached, validator = cached_entry(public_url, 'embed')
+        if cached is not None:
+            register_visit(cached['portfolio_id'])
+            return conditional_response(cached['html'], cached['etag'], cached['last_modified'], 'embed')
+    
+    validator = validator or portfolio_validator(public_url) or abort(404)
+    register_visit(validator.portfolio_id)
+    etag, policy = validator.etag, 'embed'
+    if current_user.is_authenticated:
+        # Le rendu dépend de l'utilisateur connecté
+        etag, policy = f"{validator.etag}-u{current_user.id}", 'private'
+    if not has_flashes and is_fresh(etag, validator.last_modified):
+        return not_modified(etag, validator.last_modified, policy)
+    
+    portfolio = load_portfolio_or_404(public_url=public_url, public_only=True)
+    
+    html = render_portfolio_page(portfolio, 'public/embed.html')
+    if cacheable:
+        get_page_cache().set(public_url, 'embed', {
+            'portfolio_id': portfolio.id,
+            'version': validator.etag,
+            'html': html,
+            'etag': etag,
+            'last_modified': validator.last_modified
+        })
+    if has_flashes:
+        return apply_validators(Response(html, mimetype='text/html'), None, None, 'private')
+    return conditional_response(html, etag, validator.last_modified, policy)
+
+def render_portfolio_page(portfolio, template='public/portfolio.html'):
+    """Rendre la page publique (ou embarquée) d'un instantané de portfolio"""
+    return render_template(template, 
+                         portfolio=portfolio,
+                         projects=portfolio.projects,
+                         experiences=portfolio.experiences,
+                         education=portfolio.education,
+                         skills=portfolio.skills,
+                         skills_by_category=portfolio.skills_by_category)
+
+def register_visit(portfolio_id, track_visitor=False):
+    """Comptabiliser une vue, une seule fois par session et par portfolio"""
+    viewed_key = f'viewed_{portfolio_id}'
+    if session.get(viewed_key, False):
+        return
+    
+    # Mise en tampon : aucune écriture en base pendant la requête
+    record_view(portfolio_id)
+    session[viewed_key] = True
+    
+    if track_visitor:
+        # Journal de visites persistant, écrit en arrière-plan
+        record_visit(portfolio_id, request)
+
+def portfolio_payload(portfolio):
+    """Données JSON publiques d'un portfolio"""
     # Préparer les données JSON
     data = {
         'user': {
@@ -131,7 +199,7 @@ def portfolio_api(public_url):
     }
     
     # Ajouter les projets
-    for project in portfolio.projects.order_by(Project.order_index).all():
+    for project in portfolio.projects:
         data['projects'].append({
             'id': project.id,
             'title': project.title,
@@ -144,7 +212,7 @@ def portfolio_api(public_url):
         })
     
     # Ajouter les expériences
-    for exp in portfolio.experiences.order_by(Experience.order_index).all():
+    for exp in portfolio.experiences:
         data['experiences'].append({
             'id': exp.id,
             'title': exp.title,
@@ -158,7 +226,7 @@ def portfolio_api(public_url):
         })
     
     # Ajouter les formations
-    for edu in portfolio.education.order_by(Education.order_index).all():
+    for edu in portfolio.education:
         data['education'].append({
             'id': edu.id,
             'degree': edu.degree,
@@ -172,7 +240,7 @@ def portfolio_api(public_url):
         })
     
     # Ajouter les compétences
-    for skill in portfolio.skills.order_by(Skill.order_index).all():
+    for skill in portfolio.skills:
         data['skills'].append({
             'id': skill.id,
             'name': skill.name,
@@ -182,34 +250,3 @@ def portfolio_api(public_url):
         })
     
     return data
-
-@public_bp.route('/<public_url>/embed')
-def embed_portfolio(public_url):
-    """Version embarquée du portfolio (iframe)"""
-    portfolio = Portfolio.query.filter_by(public_url=public_url, is_public=True).first_or_404()
-    
-    # Incrémenter le compteur de vues seulement si l'utilisateur n'a pas encore visité ce portfolio dans cette session
-    viewed_key = f'viewed_{portfolio.id}'
-    if not session.get(viewed_key, False):
-        portfolio.increment_views()
-        session[viewed_key] = True
-    
-    # Récupérer toutes les données du portfolio
-    projects = portfolio.projects.order_by(Project.order_index).all()
-    experiences = portfolio.experiences.order_by(Experience.order_index).all()
-    education = portfolio.education.order_by(Education.order_index).all()
-    skills = portfolio.skills.order_by(Skill.order_index).all()
-    
-    # Grouper les compétences par catégorie
-    skills_by_category = {}
-    for skill in skills:
-        if skill.category not in skills_by_category:
-            skills_by_category[skill.category] = []
-        skills_by_category[skill.category].append(skill)
-    
-    return render_template('public/embed.html', 
-                         portfolio=portfolio,
-                         projects=projects,
-                         experiences=experiences,
-                         education=education,
-                         skills_by_category=skills_by_category)
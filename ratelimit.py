@@ -0,0 +1,248 @@
+"""
+Limitation du débit des routes sensibles (connexion, inscription, mot de passe
+oublié, imports de CV)
+
+Une règle compte les requêtes d'une clé : l'adresse IP du client, le compte
+visé (champ du formulaire, email par défaut) ou l'utilisateur connecté. Au-delà
+de sa limite, la requête est refusée (429 avec Retry-After) dès l'entrée dans
+la vue : avant la validation du formulaire, toute requête SQL et tout calcul
+de hash. Les règles sont dans la configuration (RATELIMIT_LOGIN...) :
+- '10/minute' : fenêtre glissante, estimée à partir du compteur de la fenêtre
+  courante et de la part de la précédente encore couverte ;
+- '10/minute burst 20' : seau à jetons (GCRA, une seule valeur par clé), débit
+  moyen avec rafale de 20 requêtes ;
+- '5/15minute' : période de 15 minutes ; vide : pas de limite.
+
+Compteurs (RATELIMIT_STORAGE) :
+- 'memory' : propres à chaque processus, sans verrou (chaque opération sur un
+  dict est atomique sous le GIL ; deux requêtes simultanées sur une même clé
+  peuvent être comptées à une unité près) ;
+- 'redis' (RATELIMIT_REDIS_URL) : partagés par tous les workers et instances,
+  mis à jour atomiquement. Si Redis ne répond pas, la requête passe.
+
+Derrière un proxy (Render, nginx), RATELIMIT_PROXY_COUNT indique combien
+d'adresses de X-Forwarded-For ont été ajoutées par des proxys de confiance.
+
+Utilisation :
+    @rate_limit('RATELIMIT_LOGIN')                   # par IP
+    @rate_limit('RATELIMIT_LOGIN_ACCOUNT', key='account')
+"""
+
+import hashlib
+import itertools
+import logging
+import math
+import re
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+Rate = namedtuple('Rate', 'limit period burst')
+
+RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*(?:burst\s+(\d+))?\s*$')
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+_rates = {}
+
+
+def parse_rate(rule):
+    """'10/minute burst 20' -> Rate(10, 60, 20)"""
+    rate = _rates.get(rule)
+    if rate is None:
+        match = RATE_RE.match(rule)
+        if match is None:
+            raise ValueError(f"Règle de limitation invalide : {rule!r}")
+        limit, count, unit, burst = match.groups()
+        rate = Rate(int(limit), int(count or 1) * PERIODS[unit], int(burst) if burst else None)
+        _rates[rule] = rate
+    return rate
+
+
+class MemoryStore:
+    """Compteurs du processus, sans verrou"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        # clé -> [compteur (itertools.count), dernière valeur, expiration]
+        #     ou [TAT, jetons utilisés, expiration]
+        self._data = {}
+        self._writes = itertools.count()
+
+    def _prune(self, now):
+        # Instantané sous le GIL : aucun code Python ne s'exécute pendant la copie
+        for key, entry in list(self._data.items()):
+            if entry[-1] < now:
+                self._data.pop(key, None)
+        if len(self._data) > self.max_keys:
+            # Attaque sur beaucoup de clés : oublier d'abord les compteurs les plus bas (une clé
+            # par requête reste à 1), puis ceux qui expirent le plus tôt, jusqu'à 90 % de la
+            # limite pour ne pas trier à chaque nouvelle clé
+            entries = sorted(list(self._data.items()), key=lambda item: (item[1][1], item[1][-1]))
+            for key, _ in entries[:len(entries) - self.max_keys * 9 // 10]:
+                self._data.pop(key, None)
+
+    def _written(self, now):
+        if next(self._writes) % 1000 == 999 or len(self._data) > self.max_keys:
+            self._prune(now)
+
+    def hit_window(self, key, period, now):
+        """Compter une requête ; renvoie (fenêtre courante, fenêtre précédente)"""
+        window = int(now // period)
+        entry = self._data.get((key, window))
+        if entry is None:
+            entry = self._data.setdefault((key, window), [itertools.count(1), 0, (window + 2) * period])
+            self._written(now)
+        # next() sur itertools.count est atomique : pas d'incrément perdu
+        count = entry[1] = next(entry[0])
+        previous = self._data.get((key, window - 1))
+        return count, previous[1] if previous else 0
+
+    def hit_bucket(self, key, interval, burst, now):
+        """Prendre un jeton ; renvoie 0, ou l'attente en secondes si le seau est vide"""
+        entry = self._data.get(key)
+        tat = max(entry[0], now) if entry else now
+        new_tat = tat + interval
+        allow_at = new_tat - interval * burst
+        if now < allow_at:
+            return allow_at - now
+        self._data[key] = [new_tat, (new_tat - now) / interval, new_tat]
+        if entry is None:
+            self._written(now)
+        return 0
+
+
+# GCRA : instant théorique d'arrivée (TAT) du prochain jeton, mis à jour atomiquement
+BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - interval * burst
+if now < allow_at then return tostring(allow_at - now) end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+
+class RedisStore:
+    """Compteurs partagés entre workers et instances, stockés dans Redis"""
+
+    def __init__(self, url, prefix='ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Le paquet 'redis' est requis pour RATELIMIT_STORAGE='redis'")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._bucket = self._client.register_script(BUCKET_SCRIPT)
+        self.prefix = prefix
+        self.errors = (redis.RedisError, OSError)
+
+    def hit_window(self, key, period, now):
+        window = int(now // period)
+        current = f'{self.prefix}{key}:{window}'
+        pipe = self._client.pipeline()
+        pipe.incr(current)
+        pipe.expire(current, 2 * period)
+        pipe.get(f'{self.prefix}{key}:{window - 1}')
+        count, _, previous = pipe.execute()
+        return count, int(previous or 0)
+
+    def hit_bucket(self, key, interval, burst, now):
+        return float(self._bucket(keys=[f'{self.prefix}{key}'], args=[repr(now), repr(interval), burst]))
+
+
+class RateLimiter:
+    """Application des règles sur un stockage de compteurs"""
+
+    def __init__(self, store):
+        self.store = store
+        self.errors = getattr(store, 'errors', ())
+
+    def hit(self, key, rate, now=None):
+        """Compter une requête ; renvoie 0 si elle est admise, sinon l'attente conseillée en secondes"""
+        now = time.time() if now is None else now
+        try:
+            if rate.burst:
+                return self.store.hit_bucket(key, rate.period / rate.limit, rate.burst, now)
+            count, previous = self.store.hit_window(key, rate.period, now)
+        except self.errors as e:
+            logger.error(f"Limitation indisponible, requête admise : {e}")
+            return 0
+        elapsed = now % rate.period
+        # Part de la fenêtre précédente encore dans la fenêtre glissante
+        if previous * (1 - elapsed / rate.period) + count <= rate.limit:
+            return 0
+        return rate.period - elapsed
+
+
+def create_limiter(config):
+    """Créer le limiteur à partir de la configuration"""
+    if config.get('RATELIMIT_STORAGE', 'memory') == 'redis':
+        return RateLimiter(RedisStore(config['RATELIMIT_REDIS_URL']))
+    return RateLimiter(MemoryStore(max_keys=config.get('RATELIMIT_MEMORY_MAX_KEYS', 100000)))
+
+
+def get_limiter():
+    """Récupérer le limiteur de l'application courante (créé au premier appel)"""
+    limiter = current_app.extensions.get('ratelimit')
+    if limiter is None:
+        limiter = create_limiter(current_app.config)
+        current_app.extensions['ratelimit'] = limiter
+    return limiter
+
+
+def client_ip():
+    """Adresse du client, en ne croyant que les proxys de confiance"""
+    proxies = current_app.config.get('RATELIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.remote_addr or ''
+
+
+def _identity(key, field):
+    if key == 'ip':
+        return client_ip()
+    if key == 'account':
+        value = (request.form.get(field) or '').strip().lower()
+        # Empreinte : les adresses ne sont pas conservées dans les compteurs
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()[:24] if value else None
+    if key == 'user':
+        return str(current_user.get_id()) if current_user.is_authenticated else client_ip()
+    raise ValueError(f"Clé de limitation inconnue : {key}")
+
+
+def check(setting, key='ip', field='email'):
+    """Compter la requête courante pour la règle `setting` ; lève TooManyRequests au-delà"""
+    config = current_app.config
+    rule = config.get(setting)
+    if not rule or not config.get('RATELIMIT_ENABLED', True):
+        return
+    identity = _identity(key, field)
+    if identity is None:
+        return
+    retry_after = get_limiter().hit(f'{setting}:{key}:{identity}', parse_rate(rule))
+    if retry_after:
+        logger.warning(f"{setting} dépassé ({key} {identity if key != 'account' else identity[:8]}, "
+                       f"{request.endpoint})")
+        raise TooManyRequests(retry_after=math.ceil(retry_after))
+
+
+def rate_limit(setting, key='ip', field='email', methods=('POST',)):
+    """Limiter une vue selon la règle de configuration `setting` (requêtes `methods` seulement)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method in methods:
+                check(setting, key, field)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,169 @@
+"""
+Chargement d'un portfolio complet
+
+Les relations de Portfolio sont déclarées lazy='dynamic' : chaque section
+coûte une requête. load_portfolio récupère le portfolio et son utilisateur
+en une requête, puis les quatre sections en une seule requête UNION ALL, et
+renvoie un instantané immuable et trié, utilisable tel quel par les vues et
+les templates.
+"""
+
+from flask import abort
+from sqlalchemy import cast, literal, null, type_coerce, union_all, select, Boolean, Date, DateTime, Integer, Text
+from models import User, Portfolio, Project, Experience, Education, Skill
+from database import read_session
+
+
+class Snapshot:
+    """Objet en lecture seule construit à partir d'une ligne"""
+
+    __slots__ = ('_values',)
+
+    def __init__(self, **values):
+        object.__setattr__(self, '_values', values)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} est en lecture seule")
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._values.get('id')}>"
+
+
+class UserSnapshot(Snapshot):
+    __slots__ = ()
+    get_full_name = User.get_full_name
+
+
+class ProjectSnapshot(Snapshot):
+    __slots__ = ()
+    get_technologies_list = Project.get_technologies_list
+    get_images_list = Project.get_images_list
+
+
+class ExperienceSnapshot(Snapshot):
+    __slots__ = ()
+
+
+class EducationSnapshot(Snapshot):
+    __slots__ = ()
+
+
+class SkillSnapshot(Snapshot):
+    __slots__ = ()
+
+
+class PortfolioSnapshot(Snapshot):
+    __slots__ = ()
+
+    @property
+    def skills_by_category(self):
+        """Compétences groupées par catégorie, dans l'ordre d'affichage"""
+        skills_by_category = {}
+        for skill in self.skills:
+            skills_by_category.setdefault(skill.category, []).append(skill)
+        return skills_by_category
+
+
+# Colonnes communes de la requête UNION ALL : (nom, type SQL)
+_SLOTS = [
+    ('id', Integer), ('order_index', Integer), ('created_at', DateTime), ('updated_at', DateTime),
+    ('t1', Text), ('t2', Text), ('t3', Text), ('t4', Text), ('t5', Text), ('t6', Text),
+    ('d1', Date), ('d2', Date), ('b1', Boolean),
+]
+
+_SHARED = ('id', 'order_index', 'created_at', 'updated_at')
+
+# Correspondance colonne commune -> attribut du modèle, par section
+_SECTIONS = {
+    'projects': (Project, ProjectSnapshot, {
+        't1': 'title', 't2': 'description', 't3': 'technologies', 't4': 'github_url',
+        't5': 'demo_url', 't6': 'images', 'b1': 'featured',
+    }),
+    'experiences': (Experience, ExperienceSnapshot, {
+        't1': 'title', 't2': 'company', 't3': 'location', 't4': 'description',
+        'd1': 'start_date', 'd2': 'end_date', 'b1': 'current',
+    }),
+    'education': (Education, EducationSnapshot, {
+        't1': 'degree', 't2': 'institution', 't3': 'location', 't4': 'description',
+        'd1': 'start_date', 'd2': 'end_date', 'b1': 'current',
+    }),
+    'skills': (Skill, SkillSnapshot, {
+        't1': 'name', 't2': 'level', 't3': 'category',
+    }),
+}
+
+
+# Données de compte jamais exposées aux templates
+_PRIVATE_USER_COLUMNS = {'password_hash'}
+
+
+def _attribute(mapping, slot):
+    return mapping.get(slot, slot if slot in _SHARED else None)
+
+
+def _sections_query(portfolio_id):
+    selects = []
+    for section, (model, _, mapping) in _SECTIONS.items():
+        columns = [literal(section).label('section')]
+        for slot, sql_type in _SLOTS:
+            attribute = _attribute(mapping, slot)
+            if attribute is None:
+                columns.append(cast(null(), sql_type).label(slot))
+            else:
+                # Pas de CAST SQL sur les vraies colonnes (SQLite convertirait les dates en nombres)
+                columns.append(type_coerce(getattr(model, attribute), sql_type).label(slot))
+        selects.append(select(*columns).where(model.portfolio_id == portfolio_id))
+    union = union_all(*selects).subquery()
+    return select(union).order_by(union.c.section, union.c.order_index, union.c.id)
+
+
+def _row_values(row, model, exclude=()):
+    return {column.key: getattr(row, column.key) for column in model.__table__.columns
+            if column.key not in exclude}
+
+
+def load_portfolio(public_url=None, portfolio_id=None, public_only=False):
+    """Charger un portfolio, son utilisateur et toutes ses sections (deux requêtes)"""
+    session = read_session()
+    query = session.query(Portfolio, User).join(User, User.id == Portfolio.user_id)
+    if public_url is not None:
+        query = query.filter(Portfolio.public_url == public_url)
+    else:
+        query = query.filter(Portfolio.id == portfolio_id)
+    if public_only:
+        query = query.filter(Portfolio.is_public == True)
+
+    row = query.first()
+    if row is None:
+        return None
+    portfolio, user = row
+
+    sections = {section: [] for section in _SECTIONS}
+    for record in session.execute(_sections_query(portfolio.id)):
+        _, snapshot_class, mapping = _SECTIONS[record.section]
+        values = {'portfolio_id': portfolio.id}
+        for slot, _ in _SLOTS:
+            attribute = _attribute(mapping, slot)
+            if attribute is not None:
+                values[attribute] = getattr(record, slot)
+        sections[record.section].append(snapshot_class(**values))
+
+    return PortfolioSnapshot(
+        user=UserSnapshot(**_row_values(user, User, exclude=_PRIVATE_USER_COLUMNS)),
+        **_row_values(portfolio, Portfolio),
+        **{section: tuple(items) for section, items in sections.items()}
+    )
+
+
+def load_portfolio_or_404(public_url=None, portfolio_id=None, public_only=False):
+    """Comme load_portfolio, mais 404 si le portfolio n'existe pas"""
+    snapshot = load_portfolio(public_url=public_url, portfolio_id=portfolio_id, public_only=public_only)
+    if snapshot is None:
+        abort(404)
+    return snapshot
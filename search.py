@@ -0,0 +1,340 @@
+"""
+Recherche plein texte des portfolios publics
+
+Chaque portfolio a un document de recherche (nom, bio, projets, technologies,
+compétences, expériences) mis à jour automatiquement à chaque commit qui le
+modifie. Selon la base :
+- PostgreSQL : index GIN sur to_tsvector('french_unaccent', ...) (extension
+               unaccent puis racinisation française), requête to_tsquery
+               par préfixes et classement ts_rank
+- SQLite     : table virtuelle FTS5 et classement bm25
+- autres     : index inversé en mémoire, reconstruit quand les documents changent
+Le document garde le texte d'origine ; chaque backend le met en minuscules et
+retire les accents, à l'indexation comme à la recherche, ce qui rend la
+recherche insensible aux accents. Tous les backends cherchent les termes par
+préfixe ('dev' trouve 'développeur').
+"""
+
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from itertools import chain
+from flask import current_app
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import joinedload
+from models import db, User, Portfolio, Project, Experience, Education, Skill, PortfolioSearchDocument
+from database import read_session
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Suffixes français courants (sans accents), du plus long au plus court
+FRENCH_SUFFIXES = (
+    'issements', 'issement', 'atrices', 'atrice', 'ateurs', 'ateur', 'ations', 'ation',
+    'logies', 'logie', 'ements', 'ement', 'ments', 'ment', 'ances', 'ance', 'ences', 'ence',
+    'ismes', 'isme', 'istes', 'iste', 'iques', 'ique', 'euses', 'euse', 'ites', 'ite',
+    'ives', 'ive', 'eaux', 'eau', 'aux', 'eux', 'ifs', 'if', 'ees', 'ee', 'er', 'ez',
+    'es', 'e', 's', 'x',
+)
+
+STOP_WORDS = {
+    'au', 'aux', 'avec', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'en', 'et', 'je', 'la',
+    'le', 'les', 'leur', 'mon', 'ma', 'mes', 'ou', 'par', 'pour', 'sur', 'un', 'une',
+}
+
+
+def normalize(value):
+    """Minuscules sans accents"""
+    value = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in value if not unicodedata.combining(c)).lower()
+
+
+def stem(token):
+    """Racinisation légère pour le français"""
+    for suffix in FRENCH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(value):
+    """Termes racinisés d'un texte, mots vides exclus"""
+    return [stem(token) for token in TOKEN_RE.findall(normalize(value)) if token not in STOP_WORDS]
+
+
+def build_document(portfolio, session):
+    """Texte indexé d'un portfolio"""
+    user = portfolio.user
+    parts = [user.username, user.first_name, user.last_name, portfolio.bio, portfolio.location]
+
+    for project in session.query(Project).filter_by(portfolio_id=portfolio.id):
+        parts.append(project.title)
+        parts.extend(project.get_technologies_list())
+    for skill in session.query(Skill).filter_by(portfolio_id=portfolio.id):
+        parts.append(skill.name)
+    for experience in session.query(Experience).filter_by(portfolio_id=portfolio.id):
+        parts.extend([experience.title, experience.company])
+    for education in session.query(Education).filter_by(portfolio_id=portfolio.id):
+        parts.extend([education.degree, education.institution])
+
+    return ' '.join(part for part in parts if part)
+
+
+class SearchResults:
+    """Page de résultats de recherche"""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page)) if self.per_page else 1
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+class PostgresSearchBackend:
+    """Recherche via tsvector/tsquery (configuration 'french_unaccent', voir models.py)"""
+
+    config = 'french_unaccent'
+
+    def index(self, session, portfolio_id, content):
+        pass  # index GIN sur l'expression : rien à maintenir en dehors du document
+
+    def remove(self, session, portfolio_id):
+        pass
+
+    def search(self, session, query, offset, limit):
+        # Termes alphanumériques seulement : aucun opérateur tsquery venu de la requête
+        terms = [term for term in TOKEN_RE.findall(normalize(query)) if term not in STOP_WORDS]
+        if not terms:
+            return [], 0
+        # Même expression que l'index GIN ; ':*' pour la correspondance par préfixe
+        tsvector = func.to_tsvector(self.config, PortfolioSearchDocument.content)
+        tsquery = func.to_tsquery(self.config, ' & '.join(f'{term}:*' for term in terms))
+        base = session.query(PortfolioSearchDocument.portfolio_id) \
+            .join(Portfolio, Portfolio.id == PortfolioSearchDocument.portfolio_id) \
+            .filter(Portfolio.is_public == True, tsvector.op('@@')(tsquery))
+        total = base.count()
+        rows = base.order_by(func.ts_rank(tsvector, tsquery).desc(), Portfolio.id) \
+            .offset(offset).limit(limit).all()
+        return [row[0] for row in rows], total
+
+
+class SQLiteSearchBackend:
+    """Recherche via une table virtuelle FTS5"""
+
+    def index(self, session, portfolio_id, content):
+        self.remove(session, portfolio_id)
+        session.execute(
+            text("INSERT INTO portfolio_search_fts (rowid, content) VALUES (:id, :content)"),
+            {'id': portfolio_id, 'content': ' '.join(tokenize(content))}
+        )
+
+    def remove(self, session, portfolio_id):
+        session.execute(text("DELETE FROM portfolio_search_fts WHERE rowid = :id"), {'id': portfolio_id})
+
+    def search(self, session, query, offset, limit):
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        match = ' '.join(f'"{term}"*' for term in terms)
+        params = {'match': match, 'offset': offset, 'limit': limit}
+        base = ("FROM portfolio_search_fts JOIN portfolios ON portfolios.id = portfolio_search_fts.rowid "
+                "WHERE portfolio_search_fts MATCH :match AND portfolios.is_public = 1")
+        total = session.execute(text(f"SELECT count(*) {base}"), params).scalar()
+        rows = session.execute(
+            text(f"SELECT portfolios.id {base} ORDER BY bm25(portfolio_search_fts), portfolios.id "
+                 "LIMIT :limit OFFSET :offset"),
+            params
+        ).all()
+        return [row[0] for row in rows], total
+
+
+class PythonSearchBackend:
+    """Index inversé en mémoire (TF-IDF) pour les bases sans recherche plein texte"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._terms = []
+        self._doc_count = 0
+
+    def index(self, session, portfolio_id, content):
+        pass  # l'index est reconstruit à partir des documents quand leur version change
+
+    def remove(self, session, portfolio_id):
+        pass
+
+    def _refresh(self, session):
+        version = session.query(
+            func.count(PortfolioSearchDocument.portfolio_id),
+            func.max(PortfolioSearchDocument.updated_at)
+        ).one()
+        version = tuple(version)
+        if version == self._version:
+            return
+        # Index construit hors du verrou puis remplacé d'un bloc
+        postings = {}
+        for portfolio_id, content in session.query(PortfolioSearchDocument.portfolio_id,
+                                                   PortfolioSearchDocument.content):
+            terms = Counter(tokenize(content))
+            length = sum(terms.values())
+            for term, count in terms.items():
+                postings.setdefault(term, {})[portfolio_id] = count / length
+        terms = sorted(postings)
+        with self._lock:
+            self._postings = postings
+            self._terms = terms
+            self._doc_count = version[0]
+            self._version = version
+
+    def search(self, session, query, offset, limit):
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        # Aucune requête SQL sous le verrou : avec le service ASGI (asgi.py), une
+        # requête rend la main à la boucle pendant ses lectures
+        self._refresh(session)
+        with self._lock:
+            postings, indexed_terms, doc_count = self._postings, self._terms, self._doc_count
+        scores = None
+        for term in terms:
+            # Correspondance par préfixe, comme la version FTS5 : termes contigus dans la liste triée
+            matches = {}
+            position = bisect.bisect_left(indexed_terms, term)
+            while position < len(indexed_terms) and indexed_terms[position].startswith(term):
+                docs = postings[indexed_terms[position]]
+                position += 1
+                idf = math.log(1 + doc_count / len(docs))
+                for portfolio_id, tf in docs.items():
+                    matches[portfolio_id] = matches.get(portfolio_id, 0) + tf * idf
+            if scores is None:
+                scores = matches
+            else:
+                scores = {pid: score + matches[pid] for pid, score in scores.items() if pid in matches}
+
+        if not scores:
+            return [], 0
+        public_ids = {row[0] for row in session.query(Portfolio.id)
+                      .filter(Portfolio.id.in_(scores), Portfolio.is_public == True)}
+        ranked = sorted(public_ids, key=lambda pid: (-scores[pid], pid))
+        return ranked[offset:offset + limit], len(ranked)
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+    'python': PythonSearchBackend,
+}
+
+
+def get_backend(session=None):
+    """Backend de recherche adapté à la base courante"""
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+        name = current_app.config.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            dialect = (session or db.session).get_bind().dialect.name
+            name = dialect if dialect in _BACKENDS else 'python'
+        backend = _BACKENDS[name]()
+        current_app.extensions['search_backend'] = backend
+    return backend
+
+
+def search_portfolios(query, page=1, per_page=20):
+    """Rechercher des portfolios publics, classés par pertinence"""
+    page = max(page, 1)
+    if not query or not query.strip():
+        return SearchResults([], 0, page, per_page)
+
+    session = read_session()
+    ids, total = get_backend(session).search(session, query, (page - 1) * per_page, per_page)
+    if not ids:
+        return SearchResults([], total, page, per_page)
+
+    portfolios = session.query(Portfolio).options(joinedload(Portfolio.user)).filter(Portfolio.id.in_(ids)).all()
+    by_id = {portfolio.id: portfolio for portfolio in portfolios}
+    return SearchResults([by_id[pid] for pid in ids if pid in by_id], total, page, per_page)
+
+
+def index_portfolio(portfolio_id, session=None):
+    """Mettre à jour le document de recherche d'un portfolio"""
+    session = session or db.session
+    backend = get_backend(session)
+    portfolio = session.get(Portfolio, portfolio_id)
+    document = session.get(PortfolioSearchDocument, portfolio_id)
+
+    if portfolio is None:
+        if document is not None:
+            session.delete(document)
+        backend.remove(session, portfolio_id)
+        return
+
+    content = build_document(portfolio, session)
+    if document is None:
+        document = PortfolioSearchDocument(portfolio_id=portfolio_id)
+        session.add(document)
+    document.content = content
+    backend.index(session, portfolio_id, content)
+
+
+def rebuild_index():
+    """Réindexer tous les portfolios"""
+    for (portfolio_id,) in db.session.query(Portfolio.id).all():
+        index_portfolio(portfolio_id)
+    db.session.commit()
+
+
+def ensure_index():
+    """Construire l'index s'il n'a jamais été rempli"""
+    if not PortfolioSearchDocument.query.first() and Portfolio.query.first():
+        rebuild_index()
+
+
+# --- Mise à jour automatique de l'index ---------------------------------
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Noter les portfolios dont le contenu indexé a changé"""
+    portfolios = session.info.setdefault('search_dirty', set())
+    users = session.info.setdefault('search_dirty_users', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Portfolio):
+            portfolios.add(obj.id)
+        elif isinstance(obj, User):
+            users.add(obj.id)
+        elif isinstance(obj, (Project, Experience, Education, Skill)):
+            portfolios.add(obj.portfolio_id)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _reindex_changes(session):
+    """Réindexer dans la même transaction que la modification"""
+    session.flush()
+    if not session.info.get('search_dirty') and not session.info.get('search_dirty_users'):
+        return
+    portfolio_ids = session.info.pop('search_dirty', set())
+    user_ids = session.info.pop('search_dirty_users', set())
+    if user_ids:
+        portfolio_ids |= {row[0] for row in session.query(Portfolio.id).filter(Portfolio.user_id.in_(user_ids))}
+    for portfolio_id in sorted(pid for pid in portfolio_ids if pid is not None):
+        index_portfolio(portfolio_id, session)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('search_dirty', None)
+    session.info.pop('search_dirty_users', None)
@@ -0,0 +1,240 @@
+"""
+Stockage des fichiers envoyés (CV, images)
+
+Les fichiers sont désignés par une clé relative ('cv/<empreinte>.pdf',
+'images/<empreinte>-480.webp'...). Deux pilotes :
+- local : UPLOAD_FOLDER sur le disque de l'instance, servi par file_serving
+- s3    : bucket compatible S3 (AWS, MinIO, Scaleway...), envoi multipart en
+          flux depuis un fichier temporaire et téléchargement par redirection
+          vers une URL présignée (ou S3_PUBLIC_URL pour les fichiers publics)
+Les fichiers sont d'abord écrits dans un dossier de travail local
+(UPLOAD_SCRATCH_FOLDER), puis confiés au stockage une fois complets.
+"""
+
+import mimetypes
+import os
+import shutil
+from flask import abort, current_app, redirect
+from werkzeug.http import dump_options_header
+from werkzeug.security import safe_join
+from werkzeug.utils import get_content_type
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class LocalStorage:
+    """Fichiers sur le disque local"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Chemin d'un fichier, None si la clé sort du dossier"""
+        return safe_join(self.root, key)
+
+    def save_file(self, source_path, key, content_type=None, immutable=True):
+        """Déplacer un fichier complet dans le stockage"""
+        destination = self.path(key)
+        if destination is None:
+            raise ValueError(f"Clé de stockage invalide : {key}")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.chmod(source_path, 0o644)
+        try:
+            os.replace(source_path, destination)
+        except OSError:
+            # Dossier de travail sur un autre système de fichiers
+            shutil.move(source_path, destination)
+
+    def exists(self, key):
+        path = self.path(key)
+        return path is not None and os.path.exists(path)
+
+    def read(self, key):
+        """Contenu d'un fichier, None s'il n'existe pas"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except (TypeError, OSError):
+            return None
+
+    def delete(self, key):
+        path = self.path(key)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def list_keys(self, prefix):
+        """Clés des fichiers d'un dossier ('generated/cv/12/')"""
+        folder = self.path(prefix)
+        try:
+            names = os.listdir(folder)
+        except (TypeError, OSError):
+            return []
+        return [f'{prefix}{name}' for name in names if not name.startswith('.')]
+
+    def url(self, key):
+        """URL directe d'un fichier public, None s'il est servi par l'application"""
+        return None
+
+    def serve(self, key, **options):
+        """Réponse HTTP pour un fichier (voir file_serving.serve_file)"""
+        from file_serving import serve_file
+
+        path = self.path(key)
+        if path is None:
+            abort(404)
+        return serve_file(path, **options)
+
+
+class S3Storage:
+    """Fichiers dans un bucket compatible S3"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key_id=None,
+                 secret_access_key=None, public_url=None, presign_expires=300,
+                 multipart_threshold=8 * 1024 * 1024):
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Le paquet 'boto3' est requis pour STORAGE_BACKEND='s3'")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.public_url = public_url
+        self.presign_expires = presign_expires
+        self.multipart_threshold = multipart_threshold
+        self._client = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Transmis aux processus de traitement d'images : le client est recréé sur place
+        state = self.__dict__.copy()
+        state['_client'] = None
+        state['_pid'] = None
+        return state
+
+    @property
+    def client(self):
+        # Un client par processus (les clients boto3 ne survivent pas à un fork)
+        if self._client is None or self._pid != os.getpid():
+            import boto3
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key_id,
+                aws_secret_access_key=self.secret_access_key,
+            )
+            self._pid = os.getpid()
+        return self._client
+
+    def _key(self, key):
+        return f'{self.prefix}{key}'
+
+    def save_file(self, source_path, key, content_type=None, immutable=True):
+        """Envoyer un fichier complet (multipart au-delà du seuil) puis le supprimer localement"""
+        from boto3.s3.transfer import TransferConfig
+
+        extra_args = {
+            'ContentType': content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream',
+        }
+        if immutable:
+            extra_args['CacheControl'] = IMMUTABLE
+        transfer = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                  multipart_chunksize=self.multipart_threshold)
+        self.client.upload_file(source_path, self.bucket, self._key(key), ExtraArgs=extra_args, Config=transfer)
+        os.remove(source_path)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def read(self, key):
+        """Contenu d'un fichier, None s'il n'existe pas"""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return response['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list_keys(self, prefix):
+        """Clés des fichiers d'un dossier ('generated/cv/12/')"""
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix), Delimiter='/'):
+            keys.extend(item['Key'][len(self.prefix):] for item in page.get('Contents', []))
+        return keys
+
+    def url(self, key):
+        """URL directe (S3_PUBLIC_URL, CDN ou bucket public), None si non configurée"""
+        if not self.public_url:
+            return None
+        return f"{self.public_url.rstrip('/')}/{self._key(key)}"
+
+    def serve(self, key, mimetype=None, download_name=None, as_attachment=False, **options):
+        """Redirection vers une URL présignée"""
+        from http_cache import cache_policy
+
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if mimetype:
+            params['ResponseContentType'] = get_content_type(mimetype, 'utf-8')
+        if download_name or as_attachment:
+            params['ResponseContentDisposition'] = dump_options_header(
+                'attachment' if as_attachment else 'inline',
+                {'filename': download_name or os.path.basename(key)}
+            )
+        url = self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expires)
+        response = redirect(url, code=302)
+        # L'URL présignée expire : la redirection elle-même n'est pas mise en cache
+        response.headers['Cache-Control'] = cache_policy('private')
+        return response
+
+
+def create_storage(config):
+    """Créer le pilote de stockage à partir de la configuration"""
+    if config.get('STORAGE_BACKEND', 'local') == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX', ''),
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            access_key_id=config.get('S3_ACCESS_KEY_ID'),
+            secret_access_key=config.get('S3_SECRET_ACCESS_KEY'),
+            public_url=config.get('S3_PUBLIC_URL'),
+            presign_expires=config.get('S3_PRESIGN_EXPIRES', 300),
+            multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+        )
+    return LocalStorage(config['UPLOAD_FOLDER'])
+
+
+def get_storage():
+    """Récupérer le stockage de l'application courante (créé au premier appel)"""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = create_storage(current_app.config)
+        current_app.extensions['storage'] = storage
+    return storage
+
+
+def scratch_folder(app=None):
+    """Dossier de travail local des fichiers en cours d'écriture"""
+    config = (app or current_app).config
+    folder = config.get('UPLOAD_SCRATCH_FOLDER') or os.path.join(config['UPLOAD_FOLDER'], '.tmp')
+    os.makedirs(folder, exist_ok=True)
+    return folder
@@ -0,0 +1,26 @@
+from flask_mail import email_dispatched
+
+from app import create_app
+from mailer import send_email
+
+
+def test_send_email_without_configured_sender():
+    app = create_app('testing')
+    app.config.update(MAIL_DEFAULT_SENDER=None, MAIL_USERNAME=None)
+    outbox = []
+
+    def record(message, app):
+        outbox.append(message)
+
+    email_dispatched.connect(record)
+    try:
+        with app.app_context():
+            # Flask-Mail n'est pas encore initialisé : c'est la tâche qui doit le faire
+            assert 'mail' not in app.extensions
+            send_email('Sujet', ['alice@example.com'], 'Corps')
+    finally:
+        email_dispatched.disconnect(record)
+
+    assert len(outbox) == 1
+    assert outbox[0].subject == 'Sujet'
+    assert outbox[0].recipients == ['alice@example.com']
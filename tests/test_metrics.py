@@ -0,0 +1,27 @@
+import pytest
+from werkzeug.exceptions import NotFound, Unauthorized
+
+from app import create_app
+from metrics import metrics
+
+
+def production_app(**settings):
+    app = create_app('testing')
+    app.config.update(TESTING=False, DEBUG=False, **settings)
+    return app
+
+
+def test_metrics_hidden_without_token_in_production():
+    app = production_app(METRICS_TOKEN=None)
+    with app.test_request_context('/metrics'):
+        with pytest.raises(NotFound):
+            metrics()
+
+
+def test_metrics_require_configured_token():
+    app = production_app(METRICS_TOKEN='secret')
+    with app.test_request_context('/metrics'):
+        with pytest.raises(Unauthorized):
+            metrics()
+    with app.test_request_context('/metrics', headers={'Authorization': 'Bearer secret'}):
+        assert metrics().status_code == 200
@@ -0,0 +1,79 @@
+"""
+Jetons signés : réinitialisation du mot de passe et vérification de l'email
+
+Un jeton porte l'identifiant du compte et une empreinte de l'état qu'il doit
+modifier, signés avec SECRET_KEY (itsdangerous) et un sel propre à son usage :
+un jeton de vérification ne peut pas servir à réinitialiser un mot de passe.
+Rien n'est écrit en base à l'émission ; signature et âge (TOKEN_MAX_AGE)
+sont vérifiés sans requête, puis le compte est lu par sa clé primaire.
+
+Usage unique : l'empreinte couvre le hash du mot de passe (réinitialisation)
+ou l'email et son état de vérification (vérification). Utiliser le jeton
+change cet état, ce qui révoque le jeton et tous ceux émis avant lui ; un
+changement de mot de passe révoque aussi les liens de réinitialisation en
+cours.
+"""
+
+import hashlib
+import hmac
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+RESET_PASSWORD = 'reset-password'
+VERIFY_EMAIL = 'verify-email'
+
+# usage -> durée de validité par défaut (secondes)
+DEFAULT_MAX_AGE = {
+    RESET_PASSWORD: 3600,
+    VERIFY_EMAIL: 7 * 24 * 3600,
+}
+
+
+def _serializer(purpose):
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=f'portfolio-builder.{purpose}')
+
+
+def _fingerprint(user, purpose):
+    """Empreinte de l'état du compte que le jeton peut modifier"""
+    if purpose == RESET_PASSWORD:
+        state = user.password_hash
+    elif purpose == VERIFY_EMAIL:
+        state = f'{user.email}:{bool(user.is_email_verified)}'
+    else:
+        raise ValueError(f"Usage de jeton inconnu : {purpose}")
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()[:16]
+
+
+def max_age(purpose):
+    """Durée de validité d'un jeton, en secondes"""
+    return current_app.config.get('TOKEN_MAX_AGE', {}).get(purpose, DEFAULT_MAX_AGE[purpose])
+
+
+def describe_max_age(purpose):
+    """Durée de validité en toutes lettres, pour les emails"""
+    seconds = max_age(purpose)
+    for unit, name in ((24 * 3600, 'jour'), (3600, 'heure'), (60, 'minute')):
+        if seconds >= unit and seconds % unit == 0:
+            count = seconds // unit
+            return f"{count} {name}{'s' if count > 1 else ''}"
+    return f'{seconds} secondes'
+
+
+def generate_token(user, purpose):
+    """Jeton signé pour un compte et un usage"""
+    return _serializer(purpose).dumps([user.id, _fingerprint(user, purpose)])
+
+
+def verify_token(token, purpose):
+    """Compte d'un jeton valide, non expiré et non encore utilisé, sinon None"""
+    from models import db, User
+
+    try:
+        user_id, fingerprint = _serializer(purpose).loads(token, max_age=max_age(purpose))
+    except (BadSignature, ValueError, TypeError):
+        # Jeton falsifié, expiré (SignatureExpired) ou mal formé : aucune requête
+        return None
+    user = db.session.get(User, user_id)
+    if user is None or not hmac.compare_digest(fingerprint, _fingerprint(user, purpose)):
+        return None
+    return user
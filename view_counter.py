@@ -0,0 +1,244 @@
+"""
+Compteur de vues asynchrone
+
+Les vues sont accumulées en mémoire puis écrites périodiquement par un thread
+de fond, avec un seul UPDATE atomique (views_count = views_count + n) par
+portfolio. Les requêtes publiques n'attendent donc jamais une écriture en base.
+
+Modes de durabilité (VIEW_COUNTER_DURABILITY) :
+- 'memory' : les vues non écrites sont perdues si le processus s'arrête brutalement
+- 'spool'  : chaque vue est aussi ajoutée à un journal local, rejoué au démarrage
+             (livraison au moins une fois)
+- 'sync'   : écriture immédiate, utile pour les tests
+"""
+
+import atexit
+import glob
+import logging
+import os
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, func
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Tampon de vues vidé périodiquement vers la base"""
+
+    def __init__(self, app, flush_interval=10, durability='memory', spool_dir=None, fsync=False):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._spool = None
+        self._pid = None
+
+    # --- Enregistrement -------------------------------------------------
+
+    def record(self, portfolio_id, viewed_at=None):
+        """Enregistrer une vue (ne touche pas à la base)"""
+        viewed_at = viewed_at or datetime.utcnow()
+        self._ensure_started()
+        with self._lock:
+            self._add(portfolio_id, 1, viewed_at)
+            if self._spool is not None:
+                self._spool.write(f"{portfolio_id}\t{viewed_at.isoformat()}\n")
+                self._spool.flush()
+                if self.fsync:
+                    os.fsync(self._spool.fileno())
+        if self.durability == 'sync':
+            self.flush()
+
+    def _add(self, portfolio_id, count, viewed_at):
+        current = self._pending.get(portfolio_id)
+        if current is None:
+            self._pending[portfolio_id] = [count, viewed_at]
+        else:
+            current[0] += count
+            if viewed_at > current[1]:
+                current[1] = viewed_at
+
+    # --- Écriture en base -----------------------------------------------
+
+    def flush(self):
+        """Écrire les vues en attente, une mise à jour par portfolio"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                flushing_path = self._rotate_spool()
+
+            try:
+                with self.app.app_context():
+                    self._write(pending)
+            except Exception as e:
+                logger.error(f"Erreur écriture compteur de vues: {e}")
+                # Remettre les vues en attente (et dans le journal actif) pour le prochain passage
+                with self._lock:
+                    for portfolio_id, (count, viewed_at) in pending.items():
+                        self._add(portfolio_id, count, viewed_at)
+                    if flushing_path:
+                        self._restore_spool(flushing_path)
+                return 0
+
+            if flushing_path:
+                os.remove(flushing_path)
+            return sum(count for count, _ in pending.values())
+
+    def _write(self, pending):
+        from models import Portfolio, db
+
+        table = Portfolio.__table__
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam('pid'))
+            .values(
+                views_count=func.coalesce(table.c.views_count, 0) + bindparam('n'),
+                last_viewed=bindparam('viewed_at'),
+                # Une vue n'est pas une modification du contenu : ne pas déclencher onupdate
+                updated_at=table.c.updated_at,
+            )
+        )
+        params = [
+            {'pid': portfolio_id, 'n': count, 'viewed_at': viewed_at}
+            for portfolio_id, (count, viewed_at) in sorted(pending.items())
+        ]
+        try:
+            db.session.execute(stmt, params)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+    # --- Journal local --------------------------------------------------
+
+    def _spool_path(self, pid):
+        return os.path.join(self.spool_dir, f"views-{pid}.log")
+
+    def _open_spool(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool = open(self._spool_path(self._pid), 'a', encoding='utf-8')
+
+    def _rotate_spool(self):
+        """Mettre de côté le journal correspondant aux vues en cours d'écriture"""
+        if self._spool is None:
+            return None
+        self._spool.close()
+        flushing_path = self._spool_path(self._pid) + '.flushing'
+        os.replace(self._spool_path(self._pid), flushing_path)
+        self._open_spool()
+        return flushing_path
+
+    def _restore_spool(self, flushing_path):
+        """Reverser dans le journal actif les vues d'une écriture échouée
+
+        Sans cela, la rotation suivante écraserait le fichier .flushing qui
+        est alors le seul à les contenir.
+        """
+        with open(flushing_path, encoding='utf-8') as f:
+            for line in f:
+                self._spool.write(line)
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+        os.remove(flushing_path)
+
+    def _replay_orphan_spools(self):
+        """Reprendre les journaux laissés par des processus arrêtés"""
+        for path in glob.glob(os.path.join(self.spool_dir, 'views-*.log*')):
+            name = os.path.basename(path)
+            # Propriétaire : le worker qui a écrit le journal, ou celui qui l'a réclamé
+            owner = name.rsplit('.claimed-', 1)[1] if '.claimed-' in name else name[6:].split('.', 1)[0]
+            if not owner.isdigit() or int(owner) == self._pid or _process_alive(int(owner)):
+                continue
+            claimed = f"{path.split('.claimed-', 1)[0]}.claimed-{self._pid}"
+            try:
+                # Renommage atomique : un seul worker récupère le journal
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        portfolio_id, viewed_at = line.rstrip('\n').split('\t')
+                        self._add(int(portfolio_id), 1, datetime.fromisoformat(viewed_at))
+                    except ValueError:
+                        continue
+                    # Les vues reprises passent dans notre propre journal
+                    self._spool.write(line)
+            self._spool.flush()
+            os.remove(claimed)
+
+    # --- Cycle de vie ---------------------------------------------------
+
+    def _ensure_started(self):
+        # Démarrage paresseux, après le fork des workers gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+            self._stop.clear()
+            if self.durability == 'spool' and self.spool_dir:
+                self._open_spool()
+                self._replay_orphan_spools()
+            if self.durability != 'sync':
+                self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """Arrêter le thread et écrire les vues restantes"""
+        self._stop.set()
+        self.flush()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_view_counter():
+    """Récupérer le compteur de l'application courante (créé au premier appel)"""
+    counter = current_app.extensions.get('view_counter')
+    if counter is None:
+        config = current_app.config
+        counter = ViewCounter(
+            current_app._get_current_object(),
+            flush_interval=config.get('VIEW_COUNTER_FLUSH_INTERVAL', 10),
+            durability=config.get('VIEW_COUNTER_DURABILITY', 'memory'),
+            spool_dir=config.get('VIEW_COUNTER_SPOOL_DIR', 'instance/view_spool'),
+            fsync=config.get('VIEW_COUNTER_FSYNC', False),
+        )
+        current_app.extensions['view_counter'] = counter
+    return counter
+
+
+def record_view(portfolio_id):
+    """Enregistrer une vue sur un portfolio"""
+    get_view_counter().record(portfolio_id)
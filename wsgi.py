@@ -0,0 +1,7 @@
+"""
+Point d'entrée WSGI : gunicorn wsgi:app (options dans gunicorn.conf.py)
+"""
+
+from app import create_app
+
+app = create_app()